@@ -7,7 +7,7 @@ from core.security import encrypt_password
 # --------------------
 DATABASE_URL = "sqlite:///septer.db"  # Or your actual DB path
 GUARDIAN_EMAIL = "puja@rntinfosec.in"
-GUARDIAN_PASSWORD = encrypt_password("Asdf2580@")
+GUARDIAN_PASSWORD = "Asdf2580@"  # encrypted in add_guardian(), so importing this derives no key
 
 # --------------------
 # SQLAlchemy Setup
@@ -41,7 +41,7 @@ def add_guardian():
         id="admin",
         email=GUARDIAN_EMAIL,
         role="Guardian",
-        password=GUARDIAN_PASSWORD,
+        password=encrypt_password(GUARDIAN_PASSWORD),
         created_at=datetime.utcnow()
     )
     session.add(guardian)
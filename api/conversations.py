@@ -0,0 +1,102 @@
+import json
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from models.log import Log
+from models.conversation import Conversation
+from schemas.ai import AIAnswer, ConversationOut, ConversationPage, ConversationSearchResult
+from core.db import get_db
+from core.pagination import encode_cursor, after_cursor
+from core.security import get_identity, Identity
+from services.analysis import answer_sections, resolve_citations, citation_sources
+from services.conversation_search import search_conversations
+
+router = APIRouter()
+
+# Deepest result a search page may start at; ranked results past this are rarely useful
+MAX_SEARCH_OFFSET = 1000
+
+
+@router.get("", response_model=ConversationPage)
+def list_conversations(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: Identity = Depends(get_identity)
+):
+    """The caller's past questions, newest first. Pass next_cursor back as cursor for the next page."""
+    query = db.query(Conversation).filter(Conversation.user_id == current_user.id)
+    if cursor:
+        query = query.filter(after_cursor(Conversation.created_at, Conversation.id, cursor))
+    rows = query.order_by(Conversation.created_at.desc(), Conversation.id.desc()).limit(limit + 1).all()
+
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None
+    return ConversationPage(
+        conversations=[{"id": c.id, "log_id": c.log_id, "question": c.question, "created_at": c.created_at} for c in page],
+        next_cursor=next_cursor
+    )
+
+
+@router.get("/search", response_model=ConversationSearchResult)
+def search_history(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+    scope: Literal["mine", "all"] = "mine",
+    db: Session = Depends(get_db),
+    current_user: Identity = Depends(get_identity)
+):
+    """
+    Full-text search over past questions and answers, best matches first,
+    each with a snippet around the match. Guardians may search everyone's
+    history with scope=all.
+    """
+    if scope == "all" and current_user.role != "Guardian":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    hits = search_conversations(db, q, None if scope == "all" else current_user.id, limit, offset)
+    return ConversationSearchResult(
+        query=q,
+        hits=[
+            {
+                "id": h["conversation"].id,
+                "user_id": h["conversation"].user_id,
+                "log_id": h["conversation"].log_id,
+                "question": h["conversation"].question,
+                "created_at": h["conversation"].created_at,
+                "snippet": h["snippet"],
+                "score": h["score"]
+            }
+            for h in hits
+        ],
+        next_offset=offset + limit if len(hits) == limit and offset + limit <= MAX_SEARCH_OFFSET else None
+    )
+
+
+@router.get("/{conversation_id}", response_model=ConversationOut)
+def get_conversation(
+    conversation_id: str,
+    db: Session = Depends(get_db),
+    current_user: Identity = Depends(get_identity)
+):
+    convo = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    if not convo or (convo.user_id != current_user.id and current_user.role != "Guardian"):
+        raise HTTPException(status_code=404, detail="Conversation not found or not authorized")
+
+    result = answer_sections(convo)
+    log_ids = json.loads(convo.log_ids) if convo.log_ids else None
+    log = db.query(Log).filter(Log.id == convo.log_id).first()
+    if log_ids:
+        citations = resolve_citations(None, result, citation_sources(db, log_ids))
+    else:
+        citations = resolve_citations(log.file_path, result) if log else {}
+    return ConversationOut(
+        id=convo.id,
+        user_id=convo.user_id,
+        log_id=convo.log_id,
+        log_ids=log_ids,
+        question=convo.question,
+        answer=AIAnswer(**result, **citations),
+        created_at=convo.created_at
+    )
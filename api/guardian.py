@@ -1,35 +1,73 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from models.user import User
 from models.conversation import Conversation
+from models.question_count import UserQuestionCount, DailyQuestionCount
 from core.db import get_db
-from core.security import require_guardian
+from core.pagination import encode_cursor, after_cursor
+from core.security import require_guardian, Identity
+from services.answer_cache import cache_stats
 
 router = APIRouter()
 
 @router.get("/dashboard")
-def guardian_dashboard(db: Session = Depends(get_db), current_user: User = Depends(require_guardian)):
-    # Total number of questions
-    total_questions = db.query(Conversation).count()
-    
-    # Questions asked by different users
-    users_with_questions = (
-        db.query(User.email, Conversation.question, Conversation.created_at)
-        .join(Conversation, User.id == Conversation.user_id)
-        .order_by(Conversation.created_at.desc())
+def guardian_dashboard(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    days: int = Query(30, ge=1, le=366),
+    db: Session = Depends(get_db),
+    current_user: Identity = Depends(require_guardian)
+):
+    """
+    Question totals from the running counters, and one page of the newest
+    questions. Pass next_cursor back as cursor for the following page.
+    """
+    # Totals come from the counter tables, which grow with users and days, not questions
+    per_user = (
+        db.query(User.email, UserQuestionCount.questions)
+        .join(UserQuestionCount, User.id == UserQuestionCount.user_id)
+        .filter(UserQuestionCount.questions > 0)
+        .order_by(UserQuestionCount.questions.desc())
+        .all()
+    )
+    since = (datetime.utcnow() - timedelta(days=days - 1)).date()
+    per_day = (
+        db.query(DailyQuestionCount.day, func.sum(DailyQuestionCount.questions))
+        .filter(DailyQuestionCount.day >= since)
+        .group_by(DailyQuestionCount.day)
+        .order_by(DailyQuestionCount.day.desc())
         .all()
     )
-    
-    # Format the questions data
-    questions_by_users = []
-    for user_email, question, created_at in users_with_questions:
-        questions_by_users.append({
-            "user_email": user_email,
-            "question": question,
-            "asked_at": created_at
-        })
+
+    # Questions asked by different users, newest first; (created_at, id) is
+    # the keyset, so each page is an index range scan however deep it is
+    query = (
+        db.query(User.email, Conversation.question, Conversation.created_at, Conversation.id)
+        .join(Conversation, User.id == Conversation.user_id)
+    )
+    if cursor:
+        query = query.filter(after_cursor(Conversation.created_at, Conversation.id, cursor))
+    rows = query.order_by(Conversation.created_at.desc(), Conversation.id.desc()).limit(limit + 1).all()
+
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None
 
     return {
-        "total_questions": total_questions,
-        "questions_by_users": questions_by_users
+        "total_questions": sum(n for _, n in per_user),
+        "questions_per_user": [{"user_email": email, "questions": n} for email, n in per_user],
+        "questions_per_day": [{"day": day, "questions": n} for day, n in per_day if n],
+        "questions_by_users": [
+            {"user_email": user_email, "question": question, "asked_at": created_at}
+            for user_email, question, created_at, _ in page
+        ],
+        "next_cursor": next_cursor
     }
+
+
+@router.get("/cache-stats")
+def answer_cache_stats(current_user: Identity = Depends(require_guardian)):
+    # Hit rate and model time saved by the /ask answer cache in this worker
+    return cache_stats()
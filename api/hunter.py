@@ -3,7 +3,8 @@ from sqlalchemy.orm import Session
 from models.user import User
 from schemas.user import UserCreate, GeminiKeyAdd, UserOut
 from core.db import get_db
-from core.security import encrypt_password, is_strong_password, get_current_user
+from core.security import encrypt_password, is_strong_password, get_current_user, invalidate_identity
+from services.gemini_clients import invalidate_api_key
 import uuid
 
 router = APIRouter()
@@ -45,9 +46,13 @@ def add_gemini_key(
     current_user: User = Depends(get_current_user)
 ):
 
+    old_key = current_user.gemini_api_key
     current_user.gemini_api_key = data.api_key
     db.commit()
     db.refresh(current_user)
+    invalidate_identity(current_user.id)
+    if old_key != data.api_key:
+        invalidate_api_key(old_key)
 
     response= { "Message" : "Key Added!" ,"User" :UserOut(id=current_user.id, email=current_user.email, role=current_user.role)}
     return response
\ No newline at end of file
@@ -1,74 +1,571 @@
-from fastapi import APIRouter, UploadFile, Form, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, Form, Depends, HTTPException, BackgroundTasks, Query, Request
+from fastapi.responses import StreamingResponse, JSONResponse
 from sqlalchemy.orm import Session
-from pathlib import Path
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from services.file_upload import save_uploaded_file
-from services.ai_handler import call_gemini
+from services.blob_store import store_blob, release_blob, collect_garbage, require_parsed
+from services.file_parser import process_blob_in_background
+from services.log_append import append_lines
+from services.record_store import iter_log_lines
+from services.ai_handler import call_gemini_async, call_gemini_batch_async, stream_gemini_async, render_sections, estimate_tokens, SectionStreamParser, CHARS_PER_TOKEN
+from services.analysis import prepare_analysis, prepare_batch, search_index, lookup_cached, save_conversation, resolve_citations, answer_sections, merge_sources, citation_sources
+from services.log_merge import merged_lines, merged_size
+from services.line_index import LineIndex
+from services.template_miner import load_templates
+from services.question_stats import uncount_log_questions
+from services.threat_analysis import load_findings
+from services.answer_cache import store_answer, normalise_question
+from services.job_queue import job_queue
 from models.log import Log
+from models.log_blob import LogBlob
 from models.conversation import Conversation
-from models.user import User
-from schemas.ai import AIQuery, AIAnswer
-from core.db import get_db
-from core.security import get_current_user
+from models.analysis_job import AnalysisJob
+from schemas.ai import AIQuery, AIAnswer, AIBatchQuery, AIBatchItem, AIBatchAnswer, JobOut
+from schemas.log import LogSearchResult, MergedSearchResult, LogAppendResult, LogLine, LogLines, LogFindings, LogTemplates
+from core.db import get_db, get_async_db, AsyncSessionLocal
+from core.security import get_identity, Identity
+from core.metrics import timed
 import uuid
+import time
+import json
+import asyncio
+from itertools import islice
 
 router = APIRouter()
 
+# Most lines one /lines request may return
+MAX_LINE_RANGE = 5000
+
+# Streamed appends are committed once this much has arrived, or once
+# complete lines have waited this long
+APPEND_BATCH_BYTES = 1 << 20
+APPEND_FLUSH_SECONDS = 0.2
+
 
 @router.post("/upload")
 def upload_log(
+    background_tasks: BackgroundTasks,
     log_type: str = Form(...),
     file: UploadFile = Form(...),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Identity = Depends(get_identity)
 ):
     if log_type not in ["txt", "log", "json", "sarif"]:
         raise HTTPException(status_code=400, detail="Unsupported log type")
 
-    file_path = save_uploaded_file(file, log_type)
+    # The body is already spooled to a temp file by the time this runs;
+    # this copies it into the upload dir, hashing and counting lines
+    with timed("upload", "spool_copy"):
+        saved = save_uploaded_file(file, log_type)
+    with timed("upload", "store_blob"):
+        blob = store_blob(db, saved)
 
     new_log = Log(
         id=str(uuid.uuid4()),
         user_id=current_user.id,
         type=log_type,
-        file_path=file_path
+        file_path=blob.file_path,
+        file_hash=blob.sha256,
+        size_bytes=saved["size_bytes"],
+        line_count=saved["line_count"]
     )
     db.add(new_log)
-    db.commit()
+    with timed("upload", "commit"):
+        db.commit()
+
+    # Identical content uploaded before is already parsed and indexed; if
+    # parsing it failed, this upload retries
+    if blob.parsed_at is None:
+        if blob.parse_error is not None:
+            blob.parse_error = None
+            db.commit()
+        background_tasks.add_task(process_blob_in_background, blob.sha256)
 
     return {"message": "Log uploaded", "log_id": new_log.id}
 
 
-@router.post("/ask", response_model=AIAnswer)
-def ask_question(
-    data: AIQuery,
+@router.post("/{log_id}/append", response_model=LogAppendResult)
+async def append_log(
+    log_id: str,
+    request: Request,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Identity = Depends(get_identity)
 ):
-    log = db.query(Log).filter(Log.id == data.log_id, Log.user_id == current_user.id).first()
+    """
+    Appends lines to a log: the request body is raw lines for text logs or
+    NDJSON records for JSON logs, and may be streamed (e.g. tail -f). Lines
+    are committed in batches as they arrive, every APPEND_FLUSH_SECONDS or
+    APPEND_BATCH_BYTES, and are searchable and citable once committed. A
+    line longer than APPEND_BATCH_BYTES is rejected with 413. The session
+    is only used in worker threads, as appends block on the log's lock.
+    """
+    chunks = request.stream()
+    next_chunk = asyncio.ensure_future(chunks.__anext__())
+    pending = b""
+    appended = 0
+    result = None
+    try:
+        while True:
+            # Wait for more of the body, but not long once complete lines are waiting
+            done, _ = await asyncio.wait({next_chunk}, timeout=APPEND_FLUSH_SECONDS if b"\n" in pending else None)
+            if done:
+                try:
+                    pending += next_chunk.result()
+                except StopAsyncIteration:
+                    break
+                next_chunk = asyncio.ensure_future(chunks.__anext__())
+                if len(pending) < APPEND_BATCH_BYTES:
+                    continue
+            cut = pending.rfind(b"\n") + 1
+            if not cut and len(pending) >= APPEND_BATCH_BYTES:
+                raise HTTPException(status_code=413, detail=f"Appended lines can be at most {APPEND_BATCH_BYTES} bytes long")
+            if cut:
+                result = await asyncio.to_thread(append_lines, db, current_user.id, log_id, pending[:cut])
+                appended += result["appended_lines"]
+                pending = pending[cut:]
+    finally:
+        next_chunk.cancel()
+
+    if pending.strip():
+        if not pending.endswith(b"\n"):
+            pending += b"\n"  # a last line without one
+        result = await asyncio.to_thread(append_lines, db, current_user.id, log_id, pending)
+        appended += result["appended_lines"]
+    if result is None:
+        result = await asyncio.to_thread(_log_totals, db, current_user.id, log_id)
+
+    return LogAppendResult(**{**result, "appended_lines": appended})
+
+
+def _log_totals(db: Session, user_id: str, log_id: str) -> dict:
+    # What an append of no lines reports
+    log = db.query(Log).filter(Log.id == log_id, Log.user_id == user_id).first()
     if not log:
         raise HTTPException(status_code=404, detail="Log not found or not authorized")
+    return {"log_id": log.id, "line_count": log.line_count, "size_bytes": log.size_bytes}
 
-    if not current_user.gemini_api_key:
-        raise HTTPException(status_code=403, detail="Gemini API key not set for this user")
 
-    log_path = Path(log.file_path)
-    if not log_path.exists():
+@router.get("/search", response_model=MergedSearchResult)
+def search_logs(
+    log_id: List[str] = Query(...),
+    ip: Optional[List[str]] = Query(None),
+    user: Optional[List[str]] = Query(None),
+    status: Optional[List[str]] = Query(None),
+    port: Optional[List[str]] = Query(None),
+    url: Optional[List[str]] = Query(None),
+    rule_id: Optional[List[str]] = Query(None),
+    severity: Optional[List[str]] = Query(None),
+    limit: int = Query(100, ge=1, le=10000),
+    db: Session = Depends(get_db),
+    current_user: Identity = Depends(get_identity)
+):
+    """
+    Index search across several logs (repeat log_id): the matching lines of
+    all of them merged into one timeline in timestamp order, each tagged
+    with its log. Without filters, the start of the merged timeline.
+    """
+    filters = {"ip": ip, "user": user, "status": status, "port": port, "url": url, "rule_id": rule_id, "severity": severity}
+    sources = merge_sources(db, current_user.id, list(dict.fromkeys(log_id)), filters if any(filters.values()) else None)
+
+    try:
+        lines = [
+            LogLine(line=n, text=text, log_id=sources[i].log_id)
+            for _, i, n, text in islice(merged_lines(sources), limit)
+        ]
+        total = merged_size(sources)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Log file not found on disk")
 
-    # Use Gemini SDK with file and question
-    result = call_gemini(log_file_path=log_path, question=data.question, user=current_user)
+    return MergedSearchResult(log_ids=[s.log_id for s in sources], total_matches=total, lines=lines)
 
-    convo = Conversation(
-        id=str(uuid.uuid4()),
-        user_id=current_user.id,
+
+@router.get("/{log_id}/search", response_model=LogSearchResult)
+def search_log(
+    log_id: str,
+    ip: Optional[List[str]] = Query(None),
+    user: Optional[List[str]] = Query(None),
+    status: Optional[List[str]] = Query(None),
+    port: Optional[List[str]] = Query(None),
+    url: Optional[List[str]] = Query(None),
+    rule_id: Optional[List[str]] = Query(None),
+    severity: Optional[List[str]] = Query(None),
+    limit: int = Query(100, ge=1, le=10000),
+    db: Session = Depends(get_db),
+    current_user: Identity = Depends(get_identity)
+):
+    log = db.query(Log).filter(Log.id == log_id, Log.user_id == current_user.id).first()
+    if not log:
+        raise HTTPException(status_code=404, detail="Log not found or not authorized")
+
+    filters = {"ip": ip, "user": user, "status": status, "port": port, "url": url, "rule_id": rule_id, "severity": severity}
+    matches = search_index(db, log, filters)
+    lines = [LogLine(line=n, text=text) for n, text in iter_log_lines(log.file_path, matches[:limit])]
+
+    return LogSearchResult(log_id=log.id, total_matches=len(matches), lines=lines)
+
+
+@router.get("/{log_id}/lines", response_model=LogLines)
+def get_log_lines(
+    log_id: str,
+    start: int = Query(..., ge=1),
+    end: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_user: Identity = Depends(get_identity)
+):
+    """Lines start..end (inclusive, 1-based) of a log, e.g. to check cited supporting logs."""
+    log = db.query(Log).filter(Log.id == log_id, Log.user_id == current_user.id).first()
+    if not log:
+        raise HTTPException(status_code=404, detail="Log not found or not authorized")
+
+    end = start if end is None else end
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if end - start + 1 > MAX_LINE_RANGE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LINE_RANGE} lines can be fetched at once")
+
+    try:
+        with LineIndex(log.file_path) as index:
+            if start > index.line_count:
+                raise HTTPException(status_code=416, detail=f"Log has only {index.line_count} lines")
+            lines = [LogLine(line=n, text=text) for n, text in index.lines(start, end)]
+            total = index.line_count
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Log file not found on disk")
+
+    return LogLines(log_id=log.id, start=start, end=lines[-1].line, total_lines=total, lines=lines)
+
+
+@router.get("/{log_id}/findings", response_model=LogFindings)
+def get_log_findings(
+    log_id: str,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: Identity = Depends(get_identity)
+):
+    """
+    Deterministic pre-analysis of the log's parsed records: top IPs and
+    users with per-bucket activity, and brute force, port scan, fan-out and
+    spike findings. The same aggregates are summarised in /ask prompts.
+    """
+    log = db.query(Log).filter(Log.id == log_id, Log.user_id == current_user.id).first()
+    if not log:
+        raise HTTPException(status_code=404, detail="Log not found or not authorized")
+
+    blob = db.query(LogBlob).filter(LogBlob.sha256 == log.file_hash).first() if log.file_hash else None
+    if not blob:
+        raise HTTPException(status_code=409, detail="Log was uploaded before parsing was available")
+    require_parsed(blob)
+
+    findings = load_findings(blob.file_path)
+    if findings is None:
+        # Parsed by an older version; rebuild the derived data in the background
+        blob.parsed_at = None
+        db.commit()
+        background_tasks.add_task(process_blob_in_background, blob.sha256)
+        raise HTTPException(status_code=409, detail="Log is being re-parsed, try again shortly")
+
+    return LogFindings(log_id=log.id, **{k: v for k, v in findings.items() if k != "version"})
+
+
+@router.get("/{log_id}/templates", response_model=LogTemplates)
+def get_log_templates(
+    log_id: str,
+    background_tasks: BackgroundTasks,
+    limit: int = Query(50, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: Identity = Depends(get_identity)
+):
+    """
+    Line templates mined from the log, most frequent first, with how much
+    smaller the compacted prompt text (see AIQuery.compact) is than the log.
+    """
+    log = db.query(Log).filter(Log.id == log_id, Log.user_id == current_user.id).first()
+    if not log:
+        raise HTTPException(status_code=404, detail="Log not found or not authorized")
+
+    blob = db.query(LogBlob).filter(LogBlob.sha256 == log.file_hash).first() if log.file_hash else None
+    if not blob:
+        raise HTTPException(status_code=409, detail="Log was uploaded before parsing was available")
+    require_parsed(blob)
+
+    doc = load_templates(blob.file_path)
+    if doc is None:
+        # Parsed before templates were mined, or by an older miner
+        blob.parsed_at = None
+        db.commit()
+        background_tasks.add_task(process_blob_in_background, blob.sha256)
+        raise HTTPException(status_code=409, detail="Log is being re-parsed, try again shortly")
+
+    return LogTemplates(
         log_id=log.id,
-        question=data.question,
-        answer_insights=result["insights"],
-        answer_reasoning=result["reasoning"],
-        answer_supporting_logs=result["supporting_logs"],
-        answer_fixes=result["fixes"]
+        lines=doc["lines"],
+        template_count=doc["template_count"],
+        raw_chars=doc["raw_chars"],
+        compact_chars=doc["compact_chars"],
+        compression_ratio=round(doc["raw_chars"] / max(doc["compact_chars"], 1), 2),
+        raw_tokens=doc["raw_chars"] // CHARS_PER_TOKEN + 1,
+        compact_tokens=doc["compact_chars"] // CHARS_PER_TOKEN + 1,
+        templates=doc["templates"][:limit]
     )
-    db.add(convo)
+
+
+@router.delete("/{log_id}")
+def delete_log(
+    log_id: str,
+    db: Session = Depends(get_db),
+    current_user: Identity = Depends(get_identity)
+):
+    log = db.query(Log).filter(Log.id == log_id, Log.user_id == current_user.id).first()
+    if not log:
+        raise HTTPException(status_code=404, detail="Log not found or not authorized")
+
+    db.query(AnalysisJob).filter(AnalysisJob.log_id == log.id).delete(synchronize_session=False)
+    uncount_log_questions(db, log.id)
+    db.query(Conversation).filter(Conversation.log_id == log.id).delete(synchronize_session=False)
+    if log.file_hash:
+        release_blob(db, log.file_hash)
+    db.delete(log)
     db.commit()
 
-    return AIAnswer(**result)
+    collect_garbage(db)
+    return {"message": "Log deleted", "log_id": log_id}
+
+
+@router.post("/ask", response_model=AIAnswer)
+async def ask_question(
+    data: AIQuery,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Identity = Depends(get_identity)
+):
+    with timed("ask", "prepare"):
+        log, log_path, line_numbers, key, sources, progress = await db.run_sync(
+            prepare_analysis, current_user, data.log_id, data.question, data.filters, data.compact, data.log_ids, data.incremental
+        )
+
+    if data.background:
+        job = await db.run_sync(
+            job_queue.submit, current_user.id, log.id, data.question, data.filters, data.use_cache, data.compact,
+            [s.log_id for s in sources] if sources else None, data.incremental
+        )
+        return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status})
+
+    with timed("ask", "cache_lookup"):
+        result = await db.run_sync(lookup_cached, key, data.use_cache, progress)
+    if result is None:
+        # Hand the connection back to the pool before the slow model call
+        await db.commit()
+
+        # Use Gemini SDK with file and question
+        started = time.perf_counter()
+        prior = progress.prior if progress else None
+        result = await call_gemini_async(log_file_path=log_path, question=data.question, user=current_user, line_numbers=line_numbers, compact=data.compact, sources=sources, prior=prior)
+        if key:
+            compute_ms = int((time.perf_counter() - started) * 1000)
+            with timed("ask", "cache_store"):
+                await db.run_sync(store_answer, key, log.file_hash, data.question, result, compute_ms)
+
+    with timed("ask", "save_conversation"):
+        await db.run_sync(save_conversation, current_user.id, log.id, data.question, result, sources, progress)
+
+    with timed("ask", "citations"):
+        citations = await asyncio.to_thread(resolve_citations, log_path, result, sources)
+    return AIAnswer(**result, **citations)
+
+
+@router.post("/ask/stream")
+async def ask_question_stream(
+    data: AIQuery,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Identity = Depends(get_identity)
+):
+    """
+    Same as /ask, but streams the answer as server-sent events:
+    "section" when a new section starts, "token" for each piece of text
+    (tagged with its section), then "done" with the full answer once the
+    conversation is saved, or "error" if the analysis fails mid-stream.
+    """
+    log, log_path, line_numbers, key, sources, progress = await db.run_sync(
+        prepare_analysis, current_user, data.log_id, data.question, data.filters, data.compact, data.log_ids, data.incremental
+    )
+    cached = await db.run_sync(lookup_cached, key, data.use_cache, progress)
+    await db.commit()
+
+    async def events():
+        parser = SectionStreamParser()
+        started = time.perf_counter()
+        try:
+            if cached is not None:
+                chunks = _replay(render_sections(cached))
+            else:
+                prior = progress.prior if progress else None
+                chunks = stream_gemini_async(log_file_path=log_path, question=data.question, user=current_user, line_numbers=line_numbers, compact=data.compact, sources=sources, prior=prior)
+
+            async for text in chunks:
+                for event in parser.feed(text):
+                    yield _sse_event(event)
+            for event in parser.finish():
+                yield _sse_event(event)
+        except HTTPException as e:
+            yield _sse("error", {"status_code": e.status_code, "detail": e.detail})
+            return
+
+        result = parser.sections()
+        # The request's session is closed once streaming starts, so open a new one
+        async with AsyncSessionLocal() as stream_db:
+            if cached is None and key:
+                compute_ms = int((time.perf_counter() - started) * 1000)
+                await stream_db.run_sync(store_answer, key, log.file_hash, data.question, result, compute_ms)
+            convo_id = await stream_db.run_sync(save_conversation, current_user.id, log.id, data.question, result, sources, progress)
+
+        citations = await asyncio.to_thread(resolve_citations, log_path, result, sources)
+        yield _sse("done", {"conversation_id": convo_id, **result, **citations})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/ask/batch", response_model=AIBatchAnswer)
+async def ask_batch(
+    data: AIBatchQuery,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Identity = Depends(get_identity)
+):
+    """
+    Several questions about one log at once. The log is read once and sent
+    with the questions together, in more than one call only when they don't
+    fit the token budget (see call_gemini_batch_async). Each answer is saved
+    as its own conversation and reported with its latency and token usage.
+    """
+    started = time.perf_counter()
+    with timed("ask", "prepare"):
+        log, log_path, line_numbers, keys, progress = await db.run_sync(
+            prepare_batch, current_user, data.log_id, data.questions, data.filters, data.compact
+        )
+
+    with timed("ask", "cache_lookup"):
+        results = [await db.run_sync(lookup_cached, key, data.use_cache) for key in keys]
+    cached = [result is not None for result in results]
+    ready = [time.perf_counter()] * len(results)
+    prompt_tokens = [0] * len(results)
+
+    # Questions that only differ as the answer cache normalises them are asked once
+    pending = {}
+    for i, question in enumerate(data.questions):
+        if results[i] is None:
+            pending.setdefault(normalise_question(question), []).append(i)
+
+    usage = None
+    if pending:
+        # Hand the connection back to the pool before the slow model calls
+        await db.commit()
+        asked = [indexes[0] for indexes in pending.values()]
+        called = time.perf_counter()
+        answers, usage = await call_gemini_batch_async(
+            log_file_path=log_path, questions=[data.questions[i] for i in asked], user=current_user,
+            line_numbers=line_numbers, compact=data.compact
+        )
+        for indexes, answer in zip(pending.values(), answers):
+            for i in indexes:
+                results[i] = answer.sections
+                ready[i] = answer.ready_at
+            prompt_tokens[indexes[0]] = answer.prompt_tokens
+            if keys[indexes[0]]:
+                compute_ms = int((answer.ready_at - called) * 1000)
+                with timed("ask", "cache_store"):
+                    await db.run_sync(store_answer, keys[indexes[0]], log.file_hash, data.questions[indexes[0]], answer.sections, compute_ms)
+
+    items = []
+    for i, question in enumerate(data.questions):
+        with timed("ask", "save_conversation"):
+            convo_id = await db.run_sync(save_conversation, current_user.id, log.id, question, results[i], None, progress)
+        with timed("ask", "citations"):
+            citations = await asyncio.to_thread(resolve_citations, log_path, results[i])
+        items.append(AIBatchItem(
+            **results[i], **citations,
+            question=question,
+            conversation_id=convo_id,
+            cached=cached[i],
+            latency_ms=int((ready[i] - started) * 1000),
+            prompt_tokens=prompt_tokens[i],
+            answer_tokens=estimate_tokens(render_sections(results[i]))
+        ))
+
+    return AIBatchAnswer(
+        log_id=log.id,
+        answers=items,
+        model_calls=usage.calls if usage else 0,
+        prompt_tokens=usage.tokens if usage else 0,
+        latency_ms=int((time.perf_counter() - started) * 1000)
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=JobOut)
+def get_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: Identity = Depends(get_identity)
+):
+    job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id, AnalysisJob.user_id == current_user.id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or not authorized")
+
+    answer = None
+    if job.conversation_id:
+        convo = db.query(Conversation).filter(Conversation.id == job.conversation_id).first()
+        if convo:
+            result = answer_sections(convo)
+            log = db.query(Log).filter(Log.id == job.log_id).first()
+            if convo.log_ids:
+                citations = resolve_citations(None, result, citation_sources(db, json.loads(convo.log_ids)))
+            else:
+                citations = resolve_citations(log.file_path, result) if log else {}
+            answer = AIAnswer(**result, **citations)
+
+    return JobOut(
+        id=job.id,
+        status=job.status,
+        log_id=job.log_id,
+        log_ids=json.loads(job.log_ids) if job.log_ids else None,
+        question=job.question,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        error=job.error,
+        conversation_id=job.conversation_id,
+        answer=answer
+    )
+
+
+@router.delete("/jobs/{job_id}")
+def cancel_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: Identity = Depends(get_identity)
+):
+    job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id, AnalysisJob.user_id == current_user.id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or not authorized")
+
+    if not job_queue.cancel(db, job):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+
+    return {"message": "Job cancelled", "job_id": job.id}
+
+
+async def _replay(text: str):
+    yield text
+
+
+def _sse_event(event) -> str:
+    kind, value = event
+    if kind == "section":
+        return _sse("section", {"section": value})
+    return _sse("token", {"section": kind, "text": value})
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,14 @@
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Response
+from core.config import settings
+from core.metrics import render, CONTENT_TYPE
+
+router = APIRouter()
+
+
+@router.get("", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """This worker's metrics in the Prometheus text format."""
+    if settings.metrics_token and authorization != f"Bearer {settings.metrics_token}":
+        raise HTTPException(status_code=401, detail="Invalid or missing credentials")
+    return Response(render(), media_type=CONTENT_TYPE)
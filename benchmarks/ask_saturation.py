@@ -0,0 +1,94 @@
+"""
+Load test: /api/auth/login latency while /api/logs/ask is saturated.
+
+Starts the app against the local stub model with a slow configurable
+latency, floods /ask with concurrent requests, and measures login latency
+before and during the flood. With the async /ask pipeline the login p99
+should stay close to its idle baseline.
+
+    python benchmarks/ask_saturation.py --ask-concurrency 200 --stub-latency-ms 2000
+"""
+import time
+import asyncio
+import argparse
+import json
+
+import httpx
+
+from common import running_server, create_hunter, synthetic_log, summarise, BENCH_PASSWORD
+
+
+async def measure_logins(client: httpx.AsyncClient, email: str, count: int, concurrency: int) -> list:
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/api/auth/login", json={"email": email, "password": BENCH_PASSWORD})
+            response.raise_for_status()
+            samples.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(count)))
+    return samples
+
+
+async def flood_ask(client: httpx.AsyncClient, headers: dict, log_id: str, count: int) -> dict:
+    statuses = {}
+
+    async def one(i):
+        response = await client.post(
+            "/api/logs/ask",
+            json={"log_id": log_id, "question": f"Any brute force? #{i}", "use_cache": False},
+            headers=headers
+        )
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return statuses
+
+
+async def run(args) -> dict:
+    extra_env = {"GEMINI_STUB_LATENCY_MS": str(args.stub_latency_ms)}
+    with running_server(extra_env) as base_url:
+        limits = httpx.Limits(max_connections=args.ask_concurrency + 50)
+        async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+            email = "load@bench.example.com"
+            headers = await create_hunter(client, email)
+            upload = await client.post(
+                "/api/logs/upload",
+                data={"log_type": "log"},
+                files={"file": ("bench.log", synthetic_log(2000))},
+                headers=headers
+            )
+            log_id = upload.json()["log_id"]
+
+            idle = await measure_logins(client, email, args.logins, args.login_concurrency)
+
+            flood = asyncio.ensure_future(flood_ask(client, headers, log_id, args.ask_concurrency))
+            await asyncio.sleep(args.stub_latency_ms / 4000)  # let the flood build up
+            loaded = await measure_logins(client, email, args.logins, args.login_concurrency)
+            statuses = await flood
+
+    return {
+        "login_idle": summarise(idle),
+        "login_during_ask_flood": summarise(loaded),
+        "ask_statuses": statuses,
+        "ask_concurrency": args.ask_concurrency,
+        "stub_latency_ms": args.stub_latency_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ask-concurrency", type=int, default=200)
+    parser.add_argument("--stub-latency-ms", type=int, default=2000)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--login-concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
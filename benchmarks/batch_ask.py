@@ -0,0 +1,107 @@
+"""
+Batch questions (/api/logs/ask/batch): the same standard questions asked
+about one log one /ask at a time and then in a single batch, for logs of
+each size given (small ones fit one prompt, large ones are chunked).
+Reports the prompt bytes and model calls each way took (read from
+/metrics) and its latency, plus the batch's per-question report.
+
+The stub model's fixed per-call latency stands in for the model's, so
+latency mostly tracks the number of calls; prompt bytes is what a real
+model would also be slowed down by.
+
+    python benchmarks/batch_ask.py --lines 2000 50000 --questions 8
+"""
+import re
+import time
+import asyncio
+import argparse
+import json
+
+import httpx
+
+from common import running_server, create_hunter, synthetic_log
+
+QUESTIONS = [
+    "Are there any signs of brute force attacks?",
+    "Which source IPs are the most active, and are any of them suspicious?",
+    "Are there any port scans or reconnaissance?",
+    "Which accounts had failed logins?",
+    "Are there any signs of privilege escalation?",
+    "Are there bursts of server errors?",
+    "Is any client probing for admin or hidden pages?",
+    "Is there anything that looks like data exfiltration?",
+    "Are there any requests from unusual user agents?",
+    "What should be investigated first?",
+]
+
+
+async def prompt_totals(client: httpx.AsyncClient) -> tuple:
+    text = (await client.get("/metrics")).text
+
+    def value(name):
+        match = re.search(rf"^{name} (\S+)", text, re.MULTILINE)
+        return float(match.group(1)) if match else 0.0
+
+    return value("septer_prompt_bytes_count"), value("septer_prompt_bytes_sum")
+
+
+async def measured(client: httpx.AsyncClient, requests) -> tuple:
+    calls, sent = await prompt_totals(client)
+    started = time.perf_counter()
+    responses = []
+    for method, url, body in requests:
+        response = await client.request(method, url, json=body)
+        response.raise_for_status()
+        responses.append(response.json())
+    latency_ms = (time.perf_counter() - started) * 1000
+    calls_after, sent_after = await prompt_totals(client)
+    cost = {"prompt_bytes": int(sent_after - sent), "model_calls": int(calls_after - calls), "latency_ms": round(latency_ms, 1)}
+    return cost, responses
+
+
+async def run(args) -> dict:
+    results = []
+    questions = QUESTIONS[:args.questions]
+    extra_env = {"GEMINI_STUB_LATENCY_MS": str(args.stub_latency_ms)}
+    with running_server(extra_env) as base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+            client.headers.update(await create_hunter(client, "batch@bench.example.com"))
+            for lines in args.lines:
+                upload = await client.post(
+                    "/api/logs/upload",
+                    data={"log_type": "log"},
+                    files={"file": ("bench.log", synthetic_log(lines))}
+                )
+                log_id = upload.json()["log_id"]
+                while (await client.get(f"/api/logs/{log_id}/findings")).status_code == 409:
+                    await asyncio.sleep(0.2)
+
+                one_by_one, _ = await measured(client, [
+                    ("POST", "/api/logs/ask", {"log_id": log_id, "question": q, "use_cache": False}) for q in questions
+                ])
+                batch, (answer,) = await measured(client, [
+                    ("POST", "/api/logs/ask/batch", {"log_id": log_id, "questions": questions, "use_cache": False})
+                ])
+                results.append({
+                    "lines": lines,
+                    "one_by_one": one_by_one,
+                    "batch": batch,
+                    "per_question": [
+                        {k: a[k] for k in ("latency_ms", "prompt_tokens", "answer_tokens")} for a in answer["answers"]
+                    ],
+                })
+    return {"stub_latency_ms": args.stub_latency_ms, "questions": len(questions), "logs": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", default=[2_000, 50_000], help="lines in each uploaded log")
+    parser.add_argument("--questions", type=int, default=8, choices=range(1, len(QUESTIONS) + 1), metavar=f"1-{len(QUESTIONS)}")
+    parser.add_argument("--stub-latency-ms", type=int, default=500)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Shared helpers for the benchmark scripts: a throwaway server process backed
+by the local stub model, and latency summaries.
+"""
+import os
+import sys
+import time
+import socket
+import tempfile
+import subprocess
+import contextlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+BENCH_PASSWORD = "Bench!Pass123"
+
+# Settings for a disposable instance; anything already exported wins
+DEFAULT_ENV = {
+    "JWT_SECRET": "benchmark-secret",
+    "GEMINI_API_BASE": "https://generativelanguage.googleapis.com",
+    "SEPTER_AES_SECRET": "benchmark-aes-secret",
+    "SEPTER_AES_SALT": "746869735f69735f73616c74",
+    "SEPTER_AES_IV_BASE": "69765f626173655f6368617200000000",
+    "GEMINI_MODEL": "stub",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def running_server(extra_env: Dict[str, str] = None, workers: int = 1) -> Iterator[str]:
+    """Starts uvicorn on a temp database and upload dir; yields the base URL."""
+    with running_server_process(extra_env, workers) as (base_url, _):
+        yield base_url
+
+
+@contextlib.contextmanager
+def running_server_process(extra_env: Dict[str, str] = None, workers: int = 1) -> Iterator[Tuple[str, subprocess.Popen]]:
+    """Like running_server, but also yields the server process (e.g. to watch its memory)."""
+    with tempfile.TemporaryDirectory(prefix="septer-bench-") as workdir:
+        env = {**DEFAULT_ENV, **os.environ, **(extra_env or {})}
+        env["DB_URL"] = (extra_env or {}).get("DB_URL", f"sqlite:///{workdir}/bench.db")
+        env["PYTHONPATH"] = str(REPO_ROOT)
+        port = free_port()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=workdir, env=env
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            wait_until_ready(base_url, proc)
+            yield base_url, proc
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+
+def wait_until_ready(base_url: str, proc: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            httpx.get(f"{base_url}/docs", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start in time")
+
+
+async def create_hunter(client: httpx.AsyncClient, email: str) -> Dict[str, str]:
+    """Signs up a Hunter with a Gemini key set and returns auth headers."""
+    await client.post("/api/hunter/signup", json={"email": email, "password": BENCH_PASSWORD, "role": "Hunter"})
+    response = await client.post("/api/auth/login", json={"email": email, "password": BENCH_PASSWORD})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    await client.put("/api/hunter/add-api-key", json={"api_key": "stub-key"}, headers=headers)
+    return headers
+
+
+def synthetic_log(lines: int, seed: int = 0) -> bytes:
+    """Apache/sshd-style lines with a realistic mix of IPs, users and statuses."""
+    out = []
+    for i in range(lines):
+        n = i * 7919 + seed
+        ip = f"10.{n % 7}.{n % 13}.{n % 251}"
+        if n % 5 == 0:
+            out.append(f"Jan  1 00:{i // 60 % 60:02d}:{i % 60:02d} host sshd[{n % 9999}]: Failed password for user{n % 17} from {ip} port {1024 + n % 50000} ssh2")
+        else:
+            status = (200, 200, 200, 302, 401, 404, 500)[n % 7]
+            out.append(f'{ip} - - [01/Jan/2025:00:{i // 60 % 60:02d}:{i % 60:02d} +0000] "GET /page/{n % 97} HTTP/1.1" {status} {n % 5000}')
+    return ("\n".join(out) + "\n").encode()
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Resident memory of a process and all its descendants (uvicorn workers), or None where /proc isn't available."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(c) for c in f.read().split()]
+    except (OSError, StopIteration):
+        return None
+    return rss + sum(rss_bytes(c) or 0 for c in children)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarise(samples_ms: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 50), 2),
+        "p95_ms": round(percentile(samples_ms, 95), 2),
+        "p99_ms": round(percentile(samples_ms, 99), 2),
+    }
@@ -0,0 +1,95 @@
+"""
+Compressed uploads (see services/blob_compression.py): the same synthetic
+log received plain, gzip- and zstd-compressed. Reports bytes sent and
+stored, time to copy the spooled upload in (the upload's spool_copy
+stage: decompress, hash, recompress) and to parse, and
+the latency of fetching random lines, which decompresses one block per
+line for compressed blobs.
+
+Runs in-process (no server needed).
+
+    python benchmarks/compressed_upload.py --lines 1000000
+"""
+import io
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import argparse
+import tempfile
+
+from common import DEFAULT_ENV, REPO_ROOT, summarise, synthetic_log
+
+
+def encode(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(data)
+    if encoding == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def measure(workdir: str, data: bytes, encoding: str, fetches: int) -> dict:
+    from fastapi import UploadFile
+    from services.file_upload import save_uploaded_file
+    from services.file_parser import parse_blob
+    from services.blob_compression import blocks_path
+    from services.line_index import LineIndex
+
+    sent = encode(data, encoding)
+    started = time.perf_counter()
+    saved = save_uploaded_file(UploadFile(io.BytesIO(sent), filename=f"bench.{encoding}"), "log")
+    spool_copy_seconds = time.perf_counter() - started
+
+    path = os.path.join(workdir, f"{encoding}.blob")
+    if saved["blocks_tmp_path"]:
+        os.replace(saved["blocks_tmp_path"], blocks_path(path))
+    os.replace(saved["tmp_path"], path)
+
+    started = time.perf_counter()
+    parse_blob(path)
+    parse_seconds = time.perf_counter() - started
+
+    rng = random.Random(0)
+    latencies = []
+    with LineIndex(path) as index:
+        for _ in range(fetches):
+            line_no = rng.randint(1, index.line_count)
+            started = time.perf_counter()
+            list(index.lines(line_no, line_no + 9))
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "sent_mb": round(len(sent) / 1e6, 2),
+        "stored_mb": round(os.path.getsize(path) / 1e6, 2),
+        "spool_copy_seconds": round(spool_copy_seconds, 2),
+        "parse_seconds": round(parse_seconds, 2),
+        "fetch_10_lines": summarise(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--fetches", type=int, default=2000, help="random 10-line ranges fetched per encoding")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="septer-bench-") as workdir:
+        # No upload size limits: this measures throughput
+        os.environ.update({**DEFAULT_ENV, "DB_URL": f"sqlite:///{workdir}/bench.db",
+                           "MAX_FILE_SIZE_MB": "100000", "MAX_DECOMPRESSED_SIZE_MB": "100000"})
+        os.chdir(workdir)  # the app creates its upload dir in the working directory
+        sys.path.insert(0, str(REPO_ROOT))
+        data = synthetic_log(args.lines)
+        results["log_mb"] = round(len(data) / 1e6, 2)
+        for encoding in ("plain", "gzip", "zstd"):
+            results[encoding] = measure(workdir, data, encoding, args.fetches)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
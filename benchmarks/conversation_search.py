@@ -0,0 +1,136 @@
+"""
+Full-text search over conversation history at scale: loads synthetic
+conversations into a temp SQLite database through the same FTS5 triggers
+the app uses, then measures ranked search latency for rare, common,
+multi-word, IP, prefix and unmatched queries, per user and global,
+against the substring scan used on databases without FTS5.
+
+Runs in-process (no server needed). 1M conversations take a few minutes
+and a couple of GB of temp disk.
+
+    python benchmarks/conversation_search.py --conversations 1000000
+"""
+import os
+import sys
+import time
+import uuid
+import json
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+from common import DEFAULT_ENV, REPO_ROOT, summarise
+
+WORDS = ("login failed password user admin root ssh session token request error timeout denied "
+         "firewall port scan traffic outbound inbound dns query lookup process service kernel "
+         "module update patch policy rule alert signature malware payload script shell command").split()
+RARE = ["mimikatz", "cobaltstrike", "lsass", "kerberoast"]
+QUERIES = {
+    "rare": "mimikatz",
+    "common": "login",
+    "two_words": "brute force",
+    "ip": "10.0.0.5",
+    "prefix": "kerber*",
+    "no_match": "zerologon",
+}
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    out = rng.choices(WORDS, k=words)
+    if rng.random() < 0.002:
+        out[rng.randrange(words)] = rng.choice(RARE)
+    if rng.random() < 0.01:
+        out.append(f"from 10.0.{rng.randrange(4)}.{rng.randrange(8)}")
+    return " ".join(out)
+
+
+def load(engine, count: int, users: list, seed: int) -> float:
+    from sqlalchemy import text
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    insert = text(
+        "INSERT INTO conversations (id, user_id, log_id, question, answer_insights, answer_reasoning, "
+        "answer_supporting_logs, answer_fixes, created_at) VALUES "
+        "(:id, :user_id, :log_id, :question, :i, :r, :s, :f, :created_at)"
+    )
+    started = time.perf_counter()
+    batch = []
+    with engine.begin() as conn:
+        for n in range(count):
+            question = ("any brute force from " if n % 10 == 0 else "") + sentence(rng, 8)
+            batch.append({
+                "id": str(uuid.UUID(int=rng.getrandbits(128))), "user_id": users[n % len(users)], "log_id": "bench",
+                "question": question, "i": sentence(rng, 14), "r": sentence(rng, 14), "s": sentence(rng, 10),
+                "f": sentence(rng, 10), "created_at": start + timedelta(seconds=n * 30),
+            })
+            if len(batch) == 10_000:
+                conn.execute(insert, batch)
+                batch = []
+        if batch:
+            conn.execute(insert, batch)
+    return time.perf_counter() - started
+
+
+def timed(runs: int, call) -> tuple:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = call()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples, result
+
+
+def run(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="septer-bench-", dir=args.tmpdir) as workdir:
+        return _run(args, workdir)
+
+
+def _run(args, workdir: str) -> dict:
+    os.environ.update({**DEFAULT_ENV, "DB_URL": f"sqlite:///{workdir}/bench.db"})
+    os.chdir(workdir)  # the app creates its upload dir in the working directory
+    sys.path.insert(0, str(REPO_ROOT))
+    from main import Base  # core.db's Base, with every table registered by importing the app
+    from core.db import engine, SessionLocal
+    from services.conversation_search import ensure_search_index, search_conversations, _search_like
+
+    Base.metadata.create_all(bind=engine)
+    ensure_search_index(engine)
+    users = [str(uuid.UUID(int=random.Random(i).getrandbits(128))) for i in range(args.users)]
+    load_seconds = load(engine, args.conversations, users, args.seed)
+
+    db = SessionLocal()
+    results = {
+        "conversations": args.conversations,
+        "users": args.users,
+        "load_seconds": round(load_seconds, 1),
+        "inserts_per_second": round(args.conversations / load_seconds),
+        "db_mb": round(os.path.getsize(f"{workdir}/bench.db") / 1e6),
+    }
+    for name, query in QUERIES.items():
+        for scope, user_id in (("user", users[0]), ("global", None)):
+            samples, hits = timed(args.runs, lambda: search_conversations(db, query, user_id, args.limit))
+            results[f"{name}_{scope}"] = {**summarise(samples), "hits": len(hits)}
+
+    # The substring-scan fallback used on databases without FTS5, for comparison
+    for name in ("rare", "common", "no_match"):
+        samples, hits = timed(max(1, args.runs // 10), lambda: _search_like(db, QUERIES[name], None, args.limit, 0))
+        results[f"like_{name}_global"] = {**summarise(samples), "hits": len(hits)}
+    db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tmpdir", default=None, help="where to put the temp database")
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Database write throughput under concurrency: writer threads save
+conversations (the same insert + question counters + commit as /ask)
+while reader threads page through history, first on an engine configured
+the way core/db.py used to (default pool, rollback journal, full sync)
+and then on the tuned engine (sized pool, WAL, busy_timeout, NORMAL sync).
+Each configuration gets its own temp SQLite database.
+
+Runs in-process (no server needed).
+
+    python benchmarks/db_writes.py --writers 4 --readers 16 --seconds 10
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import threading
+
+from common import DEFAULT_ENV, REPO_ROOT, summarise
+
+RESULT = {"insights": "i" * 400, "reasoning": "r" * 800, "supporting_logs": "Line 1: x", "fixes": "f" * 300}
+
+
+def worker(Session, stop: threading.Event, user_id: str, write: bool, out: dict) -> None:
+    from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeout
+    from models.conversation import Conversation
+    from services.analysis import save_conversation
+
+    while not stop.is_set():
+        db = Session()
+        started = time.perf_counter()
+        try:
+            if write:
+                save_conversation(db, user_id, "bench-log", "any brute force from 10.0.0.5?", RESULT)
+            else:
+                (db.query(Conversation).filter(Conversation.user_id == user_id)
+                 .order_by(Conversation.created_at.desc()).limit(50).all())
+            out["latency_ms"].append((time.perf_counter() - started) * 1000)
+        except (OperationalError, PoolTimeout) as e:
+            db.rollback()
+            key = "locked" if "locked" in str(e) else type(e).__name__
+            out["errors"][key] = out["errors"].get(key, 0) + 1
+        finally:
+            db.close()
+
+
+def measure(bind, args) -> dict:
+    from sqlalchemy.orm import sessionmaker
+    from main import Base  # core.db's Base, with every table registered by importing it
+
+    Base.metadata.create_all(bind=bind)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=bind)
+    stop = threading.Event()
+    writes = [{"latency_ms": [], "errors": {}} for _ in range(args.writers)]
+    reads = [{"latency_ms": [], "errors": {}} for _ in range(args.readers)]
+    threads = (
+        # Writers share a few users, so counter rows are contended like busy accounts
+        [threading.Thread(target=worker, args=(Session, stop, f"user-{i % 4}", True, w)) for i, w in enumerate(writes)]
+        + [threading.Thread(target=worker, args=(Session, stop, f"user-{i % 4}", False, r)) for i, r in enumerate(reads)]
+    )
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    bind.dispose()
+
+    result = {}
+    for name, outs in (("writes", writes), ("reads", reads)):
+        latencies = [ms for o in outs for ms in o["latency_ms"]]
+        errors = {}
+        for o in outs:
+            for key, n in o["errors"].items():
+                errors[key] = errors.get(key, 0) + n
+        result[name] = {
+            "per_second": round(len(latencies) / args.seconds),
+            **summarise(latencies or [0.0]),
+            "errors": errors,
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="septer-bench-") as workdir:
+        os.environ.update({**DEFAULT_ENV, "DB_URL": f"sqlite:///{workdir}/app.db"})
+        os.chdir(workdir)  # the app creates its upload dir in the working directory
+        sys.path.insert(0, str(REPO_ROOT))
+        from sqlalchemy import create_engine
+        from core.db import make_engine
+
+        url = f"sqlite:///{workdir}/before.db"
+        results["before"] = measure(create_engine(url, connect_args={"check_same_thread": False}), args)
+        results["after"] = measure(make_engine(f"sqlite:///{workdir}/after.db"), args)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
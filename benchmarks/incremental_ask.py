@@ -0,0 +1,93 @@
+"""
+Incremental re-analysis (AIQuery.incremental): a log keeps growing while
+the same question is asked after every append, once incrementally and
+once about the whole log. Reports, per round, the log size, the prompt
+bytes and model calls each ask took (read from /metrics) and its latency.
+
+The stub model's fixed per-call latency stands in for the model's, so
+latency mostly tracks the number of calls; prompt bytes is what a real
+model would also be slowed down by.
+
+    python benchmarks/incremental_ask.py --lines 20000 --append-lines 500 --rounds 5
+"""
+import re
+import time
+import asyncio
+import argparse
+import json
+
+import httpx
+
+from common import running_server, create_hunter, synthetic_log
+
+
+async def prompt_totals(client: httpx.AsyncClient) -> tuple:
+    text = (await client.get("/metrics")).text
+
+    def value(name):
+        match = re.search(rf"^{name} (\S+)", text, re.MULTILINE)
+        return float(match.group(1)) if match else 0.0
+
+    return value("septer_prompt_bytes_count"), value("septer_prompt_bytes_sum")
+
+
+async def timed_ask(client: httpx.AsyncClient, headers: dict, log_id: str, question: str, incremental: bool) -> dict:
+    calls, sent = await prompt_totals(client)
+    started = time.perf_counter()
+    response = await client.post(
+        "/api/logs/ask",
+        json={"log_id": log_id, "question": question, "incremental": incremental, "use_cache": False},
+        headers=headers
+    )
+    response.raise_for_status()
+    latency_ms = (time.perf_counter() - started) * 1000
+    calls_after, sent_after = await prompt_totals(client)
+    return {"prompt_bytes": int(sent_after - sent), "model_calls": int(calls_after - calls), "latency_ms": round(latency_ms, 1)}
+
+
+async def run(args) -> dict:
+    rounds = []
+    extra_env = {"GEMINI_STUB_LATENCY_MS": str(args.stub_latency_ms)}
+    with running_server(extra_env) as base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+            headers = await create_hunter(client, "incremental@bench.example.com")
+            upload = await client.post(
+                "/api/logs/upload",
+                data={"log_type": "log"},
+                files={"file": ("bench.log", synthetic_log(args.lines))},
+                headers=headers
+            )
+            log_id = upload.json()["log_id"]
+            while (await client.get(f"/api/logs/{log_id}/findings", headers=headers)).status_code == 409:
+                await asyncio.sleep(0.2)
+
+            # Different questions, so the full asks don't become the incremental ones' earlier answer
+            await timed_ask(client, headers, log_id, "Any brute force? (incremental)", True)
+            lines = args.lines
+            for i in range(args.rounds):
+                appended = await client.post(
+                    f"/api/logs/{log_id}/append", content=synthetic_log(args.append_lines, i + 1), headers=headers
+                )
+                appended.raise_for_status()
+                lines = appended.json()["line_count"]
+                rounds.append({
+                    "lines": lines,
+                    "incremental": await timed_ask(client, headers, log_id, "Any brute force? (incremental)", True),
+                    "full": await timed_ask(client, headers, log_id, "Any brute force? (full)", False),
+                })
+    return {"stub_latency_ms": args.stub_latency_ms, "append_lines": args.append_lines, "rounds": rounds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=20_000, help="lines in the uploaded log")
+    parser.add_argument("--append-lines", type=int, default=500, help="lines appended before each round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--stub-latency-ms", type=int, default=500)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
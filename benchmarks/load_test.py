@@ -0,0 +1,286 @@
+"""
+End-to-end load test against a real server process with the local stub
+model. Runs one phase per endpoint group, then a mixed phase, each for a
+fixed time with a fixed number of concurrent clients:
+
+    auth       signup and login
+    upload     /api/logs/upload with small, medium and large synthetic logs
+    ask        /api/logs/ask (repeated questions hit the answer cache)
+    dashboard  /api/guardian/dashboard
+    mixed      all of the above in MIX proportions
+
+For every endpoint it reports throughput, status codes and p50/p95/p99
+latency, plus the server's peak RSS (all worker processes) per phase.
+Results are saved as JSON under benchmarks/results/ with the git commit
+they were measured on; compare two runs to spot regressions.
+
+    python benchmarks/load_test.py --seconds 20 --concurrency 16
+    python benchmarks/load_test.py --baseline benchmarks/results/<earlier>.json
+    python benchmarks/load_test.py --compare <old>.json <new>.json
+"""
+import sys
+import time
+import json
+import random
+import sqlite3
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import datetime, timezone
+
+import httpx
+
+from common import (
+    REPO_ROOT, BENCH_PASSWORD, running_server_process, create_hunter, synthetic_log, summarise, rss_bytes,
+)
+
+RESULTS_DIR = REPO_ROOT / "benchmarks" / "results"
+
+PHASES = ["auth", "upload", "ask", "dashboard", "mixed"]
+
+# Share of requests per action in the mixed phase: mostly questions, with
+# logins, uploads and Guardian traffic around them
+MIX = {"ask": 50, "login": 20, "upload": 10, "dashboard": 10, "signup": 10}
+
+# Synthetic log sizes uploaded, in lines
+LOG_SIZES = {"small": 200, "medium": 5_000, "large": 50_000}
+
+QUESTIONS = [
+    "Are there any signs of brute force attacks in this log?",
+    "Which IPs have the most failed logins?",
+    "Summarise the 5xx errors.",
+    "Is there evidence of scanning?",
+    "Which users are targeted most?",
+]
+
+RSS_SAMPLE_SECONDS = 0.1
+
+
+class Recorder:
+    """Latencies and status codes per endpoint for one phase."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+
+    async def call(self, endpoint: str, request) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await request
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        self.latencies.setdefault(endpoint, []).append((time.perf_counter() - started) * 1000)
+        counts = self.statuses.setdefault(endpoint, {})
+        counts[status] = counts.get(status, 0) + 1
+        return response
+
+    def report(self, seconds: float) -> dict:
+        return {
+            endpoint: {"per_second": round(len(samples) / seconds, 1), **summarise(samples), "statuses": self.statuses[endpoint]}
+            for endpoint, samples in sorted(self.latencies.items())
+        }
+
+
+class Session:
+    """Users, logs and payloads shared by every client in a run."""
+
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random):
+        self.client = client
+        self.rng = rng
+        self.hunters = []        # (email, headers)
+        self.logs = []           # (headers, log_id)
+        self.guardian = None
+        self.signups = 0
+        self.payloads = {size: synthetic_log(lines, seed=i) for i, (size, lines) in enumerate(LOG_SIZES.items())}
+
+    async def signup(self, rec: Recorder) -> None:
+        self.signups += 1
+        email = f"load{self.signups}-{self.rng.getrandbits(32):x}@bench.example.com"
+        await rec.call("POST /api/hunter/signup", self.client.post(
+            "/api/hunter/signup", json={"email": email, "password": BENCH_PASSWORD, "role": "Hunter"}))
+
+    async def login(self, rec: Recorder) -> None:
+        email, _ = self.rng.choice(self.hunters)
+        await rec.call("POST /api/auth/login", self.client.post(
+            "/api/auth/login", json={"email": email, "password": BENCH_PASSWORD}))
+
+    async def upload(self, rec: Recorder) -> None:
+        _, headers = self.rng.choice(self.hunters)
+        size = self.rng.choice(list(LOG_SIZES))
+        await rec.call(f"POST /api/logs/upload ({size})", self.client.post(
+            "/api/logs/upload", data={"log_type": "log"},
+            files={"file": (f"{size}.log", self.payloads[size])}, headers=headers))
+
+    async def ask(self, rec: Recorder) -> None:
+        headers, log_id = self.rng.choice(self.logs)
+        await rec.call("POST /api/logs/ask", self.client.post(
+            "/api/logs/ask", json={"log_id": log_id, "question": self.rng.choice(QUESTIONS)}, headers=headers))
+
+    async def dashboard(self, rec: Recorder) -> None:
+        await rec.call("GET /api/guardian/dashboard", self.client.get(
+            "/api/guardian/dashboard", headers=self.guardian))
+
+
+async def setup(session: Session, db_path: Path, hunters: int) -> None:
+    # One log per hunter to ask about, and a Guardian promoted directly in
+    # the database (there is no API for it) before its first request
+    for i in range(hunters):
+        email = f"hunter{i}@bench.example.com"
+        headers = await create_hunter(session.client, email)
+        session.hunters.append((email, headers))
+        response = await session.client.post(
+            "/api/logs/upload", data={"log_type": "log"},
+            files={"file": ("setup.log", synthetic_log(2_000, seed=i))}, headers=headers)
+        response.raise_for_status()
+        session.logs.append((headers, response.json()["log_id"]))
+
+    email = "guardian@bench.example.com"
+    await session.client.post("/api/hunter/signup", json={"email": email, "password": BENCH_PASSWORD, "role": "Hunter"})
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE users SET role = 'Guardian' WHERE email = ?", (email,))
+    response = await session.client.post("/api/auth/login", json={"email": email, "password": BENCH_PASSWORD})
+    response.raise_for_status()
+    session.guardian = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run_phase(session: Session, phase: str, pid: int, seconds: float, concurrency: int) -> dict:
+    weights = {
+        "auth": {"signup": 1, "login": 3},
+        "upload": {"upload": 1},
+        "ask": {"ask": 1},
+        "dashboard": {"dashboard": 1},
+        "mixed": MIX,
+    }[phase]
+    actions, shares = list(weights), list(weights.values())
+    rec = Recorder()
+    peak = rss_bytes(pid)
+    started = time.perf_counter()
+    deadline = started + seconds
+
+    async def client_loop():
+        while time.perf_counter() < deadline:
+            await getattr(session, session.rng.choices(actions, shares)[0])(rec)
+
+    async def watch_memory():
+        nonlocal peak
+        while time.perf_counter() < deadline:
+            rss = rss_bytes(pid)
+            if rss is not None:
+                peak = max(peak or 0, rss)
+            await asyncio.sleep(RSS_SAMPLE_SECONDS)
+
+    await asyncio.gather(watch_memory(), *(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "seconds": round(elapsed, 1),
+        "concurrency": concurrency,
+        "peak_rss_mb": round(peak / 2**20, 1) if peak is not None else None,
+        "endpoints": rec.report(elapsed),
+    }
+
+
+async def run(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="septer-bench-") as workdir:
+        db_path = Path(workdir) / "load.db"
+        extra_env = {
+            "DB_URL": f"sqlite:///{db_path}",
+            "GEMINI_STUB_LATENCY_MS": str(args.stub_latency_ms),
+            "GEMINI_STUB_RESPONSE_LINES": str(args.stub_response_lines),
+        }
+        with running_server_process(extra_env, args.workers) as (base_url, proc):
+            limits = httpx.Limits(max_connections=args.concurrency + 10)
+            async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+                session = Session(client, random.Random(args.seed))
+                await setup(session, db_path, args.hunters)
+                phases = {}
+                for phase in args.phases:
+                    phases[phase] = await run_phase(session, phase, proc.pid, args.seconds, args.concurrency)
+                    print(f"{phase}: done", file=sys.stderr)
+    return {"meta": run_metadata(args), "phases": phases}
+
+
+def run_metadata(args) -> dict:
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        "commit": git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "measured_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("baseline", "compare", "output")},
+    }
+
+
+def save(results: dict, output: str = None) -> Path:
+    if output:
+        path = Path(output)
+    else:
+        stamp = results["meta"]["measured_at"].replace(":", "").replace("-", "")[:15]
+        path = RESULTS_DIR / f"load-{stamp}-{results['meta']['commit'] or 'nogit'}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2) + "\n")
+    return path
+
+
+def compare(old: dict, new: dict) -> str:
+    """Side-by-side throughput, p95 and peak RSS of two runs, with the change in percent."""
+    def change(a, b):
+        return f"{(b - a) / a * 100:+.0f}%" if a else "n/a"
+
+    lines = [f"{old['meta']['commit']} -> {new['meta']['commit']}"]
+    for phase, result in new["phases"].items():
+        before = old["phases"].get(phase)
+        if before is None:
+            continue
+        lines.append(f"\n[{phase}] peak RSS {before['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+        for endpoint, stats in result["endpoints"].items():
+            prev = before["endpoints"].get(endpoint)
+            if prev is None:
+                continue
+            lines.append(
+                f"  {endpoint:<36} req/s {prev['per_second']:>8} -> {stats['per_second']:<8} {change(prev['per_second'], stats['per_second']):>6}"
+                f"   p95 {prev['p95_ms']:>9} -> {stats['p95_ms']:<9} {change(prev['p95_ms'], stats['p95_ms']):>6}"
+            )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--phases", nargs="+", choices=PHASES, default=PHASES)
+    parser.add_argument("--seconds", type=float, default=20, help="duration of each phase")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients per phase")
+    parser.add_argument("--hunters", type=int, default=10, help="users created (each with a log) before the phases")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--stub-latency-ms", type=int, default=500)
+    parser.add_argument("--stub-response-lines", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="where to save results (default: benchmarks/results/load-<time>-<commit>.json)")
+    parser.add_argument("--baseline", help="saved results to compare this run against")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two saved results without running")
+    args = parser.parse_args()
+
+    if args.compare:
+        old, new = (json.loads(Path(p).read_text()) for p in args.compare)
+        print(compare(old, new))
+        return
+
+    results = asyncio.run(run(args))
+    path = save(results, args.output)
+    print(json.dumps(results, indent=2))
+    print(f"saved to {path}", file=sys.stderr)
+    if args.baseline:
+        print(compare(json.loads(Path(args.baseline).read_text()), results))
+
+
+if __name__ == "__main__":
+    main()
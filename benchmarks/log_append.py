@@ -0,0 +1,107 @@
+"""
+Appending to a log (see services/log_append.py): uploads a synthetic log,
+then has concurrent clients append batches of lines to it for a while,
+one run per batch size, and finally streams lines in a single request.
+Reports appended lines per second and append latency, the cost of the
+first append (which copies the shared blob), and whether the final line
+count is exact.
+
+    python benchmarks/log_append.py --lines 100000 --batch-lines 1 100 1000
+"""
+import time
+import asyncio
+import argparse
+import json
+
+import httpx
+
+from common import running_server, create_hunter, synthetic_log, summarise
+
+
+async def wait_until_parsed(client: httpx.AsyncClient, headers: dict, log_id: str) -> None:
+    while (await client.get(f"/api/logs/{log_id}/findings", headers=headers)).status_code == 409:
+        await asyncio.sleep(0.2)
+
+
+async def append_for(client: httpx.AsyncClient, headers: dict, log_id: str, lines: int, appenders: int, seconds: float) -> dict:
+    latencies = []
+    appended = 0
+    deadline = time.perf_counter() + seconds
+
+    async def one(k):
+        nonlocal appended
+        i = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.post(f"/api/logs/{log_id}/append", content=synthetic_log(lines, k * 100_000 + i), headers=headers)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+            appended += response.json()["appended_lines"]
+            i += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(k) for k in range(appenders)))
+    elapsed = time.perf_counter() - started
+    return {"lines": appended, "lines_per_second": round(appended / elapsed), "append": summarise(latencies)}
+
+
+async def stream(client: httpx.AsyncClient, headers: dict, log_id: str, lines: int) -> dict:
+    async def body():
+        for i in range(0, lines, 5000):
+            yield synthetic_log(min(5000, lines - i), i)
+
+    started = time.perf_counter()
+    response = await client.post(f"/api/logs/{log_id}/append", content=body(), headers=headers)
+    response.raise_for_status()
+    elapsed = time.perf_counter() - started
+    return {"lines": response.json()["appended_lines"], "seconds": round(elapsed, 2), "lines_per_second": round(lines / elapsed)}
+
+
+async def run(args) -> dict:
+    results = {}
+    with running_server() as base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+            headers = await create_hunter(client, "append@bench.example.com")
+            upload = await client.post(
+                "/api/logs/upload",
+                data={"log_type": "log"},
+                files={"file": ("bench.log", synthetic_log(args.lines))},
+                headers=headers
+            )
+            log_id = upload.json()["log_id"]
+            expected = args.lines
+            await wait_until_parsed(client, headers, log_id)
+
+            started = time.perf_counter()
+            first = await client.post(f"/api/logs/{log_id}/append", content=synthetic_log(1, 0), headers=headers)
+            first.raise_for_status()
+            results["first_append_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            expected += 1
+
+            for lines in args.batch_lines:
+                run_result = await append_for(client, headers, log_id, lines, args.appenders, args.seconds)
+                results[f"batches_of_{lines}"] = run_result
+                expected += run_result["lines"]
+            results["streamed"] = await stream(client, headers, log_id, args.stream_lines)
+            expected += args.stream_lines
+
+            final = await client.get(f"/api/logs/{log_id}/lines", params={"start": 1}, headers=headers)
+            results["line_count"] = final.json()["total_lines"]
+            results["line_count_exact"] = results["line_count"] == expected
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=100_000, help="lines in the uploaded log")
+    parser.add_argument("--batch-lines", type=int, nargs="+", default=[1, 100, 1000], help="lines per append, one run per size")
+    parser.add_argument("--appenders", type=int, default=4, help="concurrent clients appending to the log")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--stream-lines", type=int, default=200_000, help="lines streamed in the final single request")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
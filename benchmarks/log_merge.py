@@ -0,0 +1,99 @@
+"""
+Time-ordered merge of several logs (see services/log_merge.py): parses
+synthetic logs whose events interleave in time, then streams their merged
+timeline and reports lines per second, the peak of Python allocations
+during the merge (which should not grow with the log sizes) and whether
+the output came out in timestamp order.
+
+Runs in-process (no server needed).
+
+    python benchmarks/log_merge.py --logs 3 --lines 200000 1000000
+"""
+import os
+import sys
+import time
+import json
+import random
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from common import DEFAULT_ENV, REPO_ROOT
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def timed_log(path: str, lines: int, seed: int) -> None:
+    """One source: ISO-timestamped lines a random 0-2 seconds apart, with a few untimed continuations."""
+    rng = random.Random(seed)
+    ts = START
+    with open(path, "w") as f:
+        for i in range(lines):
+            ts += timedelta(milliseconds=rng.randrange(2000))
+            if i % 50 == 49:
+                f.write(f"    at frame {i} (continuation of the line above)\n")
+                continue
+            f.write(f"{ts.isoformat().replace('+00:00', 'Z')} src{seed} sshd[{i % 999}]: Failed password for user{i % 17} from 10.{seed}.{i % 13}.{i % 251} port {1024 + i % 50000}\n")
+
+
+def measure(sources) -> dict:
+    from services.log_merge import merged_lines
+
+    started = time.perf_counter()
+    count = 0
+    ordered = True
+    last = float("-inf")
+    for ts, _, _, _ in merged_lines(sources):
+        count += 1
+        if ts < last:
+            ordered = False
+        last = ts
+    seconds = time.perf_counter() - started
+
+    # Second pass under tracemalloc, which slows it down
+    tracemalloc.start()
+    for _ in merged_lines(sources):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "lines": count,
+        "seconds": round(seconds, 2),
+        "lines_per_second": round(count / seconds),
+        "peak_alloc_kb": round(peak / 1024),
+        "ordered": ordered,
+    }
+
+
+def run(args) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="septer-bench-") as workdir:
+        os.environ.update({**DEFAULT_ENV, "DB_URL": f"sqlite:///{workdir}/bench.db"})
+        os.chdir(workdir)  # the app creates its upload dir in the working directory
+        sys.path.insert(0, str(REPO_ROOT))
+        from services.file_parser import parse_blob
+        from services.log_merge import MergeSource, source_tags
+
+        for lines in args.lines:
+            sources = []
+            for tag, seed in zip(source_tags(args.logs), range(args.logs)):
+                path = os.path.join(workdir, f"{lines}-{tag}.log")
+                timed_log(path, lines, seed)
+                parse_blob(path)
+                sources.append(MergeSource(tag, tag, "log", path))
+            results[f"{args.logs}x{lines}"] = measure(sources)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logs", type=int, default=3)
+    parser.add_argument("--lines", type=int, nargs="+", default=[200_000, 1_000_000], help="lines per log, one run per size")
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
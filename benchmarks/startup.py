@@ -0,0 +1,74 @@
+"""
+Startup cost: how long `import main` takes in a fresh interpreter, and how
+long a new server process takes to accept requests and serve its first
+login and authenticated request. This is what a newly scaled-out worker
+pays before it can take traffic.
+
+    python benchmarks/startup.py --runs 5
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+from common import DEFAULT_ENV, REPO_ROOT, BENCH_PASSWORD, running_server, summarise
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print((time.perf_counter() - t) * 1000)"
+
+
+def measure_import(runs: int) -> dict:
+    import_ms, process_ms = [], []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory(prefix="septer-bench-") as workdir:
+            env = {**DEFAULT_ENV, **os.environ, "DB_URL": f"sqlite:///{workdir}/bench.db", "PYTHONPATH": str(REPO_ROOT)}
+            started = time.perf_counter()
+            out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=workdir, env=env,
+                                 capture_output=True, text=True, check=True)
+            process_ms.append((time.perf_counter() - started) * 1000)
+            import_ms.append(float(out.stdout.strip().splitlines()[-1]))
+    return {"import_main": summarise(import_ms), "python_process": summarise(process_ms)}
+
+
+def measure_boot(runs: int) -> dict:
+    ready_ms, signup_ms, login_ms, request_ms = [], [], [], []
+    for i in range(runs):
+        started = time.perf_counter()
+        with running_server() as base_url:
+            ready_ms.append((time.perf_counter() - started) * 1000)
+            with httpx.Client(base_url=base_url, timeout=60) as client:
+                email = f"boot{i}@bench.example.com"
+                signup_ms.append(_timed(lambda: client.post(
+                    "/api/hunter/signup", json={"email": email, "password": BENCH_PASSWORD, "role": "Hunter"})))
+                login = []
+                login_ms.append(_timed(lambda: login.append(client.post(
+                    "/api/auth/login", json={"email": email, "password": BENCH_PASSWORD}))))
+                headers = {"Authorization": f"Bearer {login[0].json()['access_token']}"}
+                request_ms.append(_timed(lambda: client.get("/api/logs/jobs/none", headers=headers)))
+    return {
+        "ready": summarise(ready_ms),
+        "first_signup": summarise(signup_ms),
+        "first_login": summarise(login_ms),
+        "first_authenticated_request": summarise(request_ms),
+    }
+
+
+def _timed(call) -> float:
+    started = time.perf_counter()
+    call()
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps({**measure_import(args.runs), **measure_boot(args.runs)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
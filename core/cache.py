@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries also expire after
+    ttl_seconds. With sliding=True every hit pushes the expiry back, so
+    entries expire after being idle rather than after being created.
+    on_evict, if given, is called with (key, value) whenever an entry is
+    dropped, so callers can release resources it holds.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, on_evict: Optional[Callable[[Hashable, Any], None]] = None, sliding: bool = False):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self.sliding = sliding
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                evicted = value
+            else:
+                self._entries.move_to_end(key)
+                if self.sliding:
+                    self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+                return value
+        self._evicted(key, evicted)
+        return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None and old[0] is not value:
+                evicted.append((key, old[0]))
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._pop_oldest())
+        for item in evicted:
+            self._evicted(*item)
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._evicted(key, entry[0])
+        return entry[0]
+
+    def purge_expired(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [(k, v) for k, (v, expires_at) in self._entries.items() if expires_at < now]
+            for key, _ in expired:
+                del self._entries[key]
+        for item in expired:
+            self._evicted(*item)
+        return len(expired)
+
+    def clear(self) -> None:
+        with self._lock:
+            entries = [(k, v) for k, (v, _) in self._entries.items()]
+            self._entries.clear()
+        for item in entries:
+            self._evicted(*item)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _pop_oldest(self) -> tuple:
+        key, (value, _) = self._entries.popitem(last=False)
+        return key, value
+
+    def _evicted(self, key: Hashable, value: Any) -> None:
+        if self.on_evict:
+            self.on_evict(key, value)
@@ -1,3 +1,4 @@
+from typing import Literal, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -6,6 +7,68 @@ class Settings(BaseSettings):
     jwt_secret: str
     gemini_api_base: str
     max_file_size_mb: int = 10
+    # gzip/zstd uploads: max_file_size_mb limits the bytes sent, this the log
+    # once decompressed (checked while streaming, so archive bombs stop early)
+    max_decompressed_size_mb: int = 200
+
+    # Findings of logs being appended to cover the whole log, so they are
+    # recomputed (in the parser pool) at most this often rather than per append
+    append_findings_interval_seconds: float = 30
+
+    # Connection pool per engine (each worker has a sync and an async engine).
+    # Size + overflow matches the 40 threads FastAPI runs sync routes on
+    db_pool_size: int = 20
+    db_max_overflow: int = 20
+    db_pool_timeout_seconds: float = 30
+    db_pool_recycle_seconds: int = 30 * 60
+    db_pool_pre_ping: bool = False
+
+    # Applied to every SQLite connection
+    sqlite_journal_mode: Literal["WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY", "OFF"] = "WAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_synchronous: Literal["OFF", "NORMAL", "FULL", "EXTRA"] = "NORMAL"
+
+    # Gemini model name; "stub" selects the local deterministic stand-in
+    gemini_model: str = "gemini-2.0-flash"
+    gemini_stub_latency_ms: int = 0
+    gemini_stub_response_lines: int = 5
+
+    # Pooled Gemini clients, one set per API key; idle keys are dropped
+    gemini_client_pool_size: int = 256
+    gemini_client_idle_seconds: int = 15 * 60
+
+    # Logs larger than this (estimated tokens) are analysed in chunks
+    ai_chunk_token_budget: int = 100_000
+    ai_max_concurrency: int = 4
+
+    # Questions sent together in one prompt by /ask/batch, bounding the response length
+    ai_batch_questions_per_call: int = 8
+
+    # Per-process cap on concurrent model calls (requests and background jobs
+    # share it), and the overall /ask deadline
+    ai_max_inflight: int = 32
+    ai_request_timeout_seconds: float = 120
+
+    # Processes parsing uploads into normalised records; 0 parses in-thread
+    parser_workers: int = 2
+
+    # Prometheus /metrics; with a token set, scrapes must send it as a bearer token
+    metrics_enabled: bool = True
+    metrics_token: Optional[str] = None
+
+    # Authenticated identities cached per worker; bounds how stale a role
+    # or API key change made through another worker can be
+    auth_cache_size: int = 10_000
+    auth_cache_ttl_seconds: float = 30
+
+    # Background analysis jobs (/ask with "background": true)
+    job_workers: int = 2
+    job_max_queued_per_user: int = 20
+
+    # /ask answer cache: in-process LRU tier in front of a persistent DB tier
+    answer_cache_ttl_seconds: int = 7 * 24 * 60 * 60
+    answer_cache_memory_entries: int = 1024
+    answer_cache_max_rows: int = 100_000
 
     # AES encryption secrets (must be set in .env)
     septer_aes_secret: str
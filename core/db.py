@@ -1,16 +1,85 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 from core.config import settings
+from core.metrics import Gauge
+
+# Async drivers for the same databases, used by the async session below
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+def _async_url(db_url: str):
+    url = make_url(db_url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+def _is_sqlite(db_url: str) -> bool:
+    return make_url(db_url).get_backend_name() == "sqlite"
+
+def _engine_options(db_url: str) -> dict:
+    url = make_url(db_url)
+    options = {}
+    if _is_sqlite(db_url):
+        options["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            # In-memory databases use a single shared connection, not a sized pool
+            return options
+    options.update(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout_seconds,
+        pool_recycle=settings.db_pool_recycle_seconds,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+    return options
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers and one writer work at the same time instead of
+    # failing each other with "database is locked"; busy_timeout makes
+    # writers wait for the lock rather than erroring at once; NORMAL sync is
+    # safe under WAL (a crash can lose the last commits, not corrupt the file)
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.close()
+
+def make_engine(db_url: str):
+    """Sync engine with the configured pool, and the SQLite pragmas applied to every new connection."""
+    bind = create_engine(db_url, **_engine_options(db_url))
+    if _is_sqlite(db_url):
+        event.listen(bind, "connect", _sqlite_pragmas)
+    return bind
+
+def make_async_engine(db_url: str):
+    """Async counterpart of make_engine."""
+    bind = create_async_engine(_async_url(db_url), **_engine_options(db_url))
+    if _is_sqlite(db_url):
+        event.listen(bind.sync_engine, "connect", _sqlite_pragmas)
+    return bind
 
 # Create SQLAlchemy engine with dynamic DB selection
-engine = create_engine(
-    settings.db_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.db_url else {}
-)
+engine = make_engine(settings.db_url)
 
 # Session factory for database access
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine over the same database for routes that must not block the event loop
+async_engine = make_async_engine(settings.db_url)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+def _checked_out(bind) -> int:
+    # Only queue pools count checkouts; in-memory SQLite has a single shared connection
+    checkedout = getattr(bind.pool, "checkedout", None)
+    return checkedout() if checkedout else 0
+
+Gauge("septer_db_connections_in_use", "Pooled sync engine connections checked out", function=lambda: _checked_out(engine))
+Gauge("septer_db_async_connections_in_use", "Pooled async engine connections checked out", function=lambda: _checked_out(async_engine.sync_engine))
+
 # Declarative base class for models
 Base = declarative_base()
 
@@ -20,4 +89,37 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Async counterpart of get_db
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# create_all() never alters existing tables, so add any new nullable columns
+# to databases created by an older version of the models
+def add_missing_columns(bind=engine):
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=bind.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+
+# Likewise for indexes declared on existing tables
+def add_missing_indexes(bind=engine):
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind)
\ No newline at end of file
@@ -0,0 +1,35 @@
+import os
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import Iterator, Union
+
+
+@contextmanager
+def atomic_path(path: str) -> Iterator[str]:
+    """
+    Yields a temp path next to path for the caller to write, then renames
+    it over path, so readers see the old file or the new one, never part of
+    one. The temp name is unique per process and thread, so concurrent
+    writers of the same file don't write into each other's temp file; if
+    the block raises, the temp file is removed and path is left as it was.
+    """
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)  # left by a crashed writer that had our ids
+    try:
+        yield tmp_path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def atomic_write(path: str, data: Union[str, bytes, array]) -> None:
+    """Replaces path with data atomically; str is written as UTF-8, an array as its raw items."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
@@ -0,0 +1,260 @@
+"""
+In-process metrics in the Prometheus text format: counters, gauges and
+histograms with labels, an ASGI middleware timing every request, and a
+stage timer for the steps inside upload and /ask.
+
+Values are per worker process, like prometheus_client without its
+multiprocess mode: each uvicorn worker serves its own /metrics.
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; spans cache hits (~1 ms) to the slowest model calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTE_BUCKETS = (1 << 10, 4 << 10, 16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20)
+TOKEN_BUCKETS = (256, 1_000, 4_000, 16_000, 64_000, 128_000, 256_000, 1_000_000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values) -> object:
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self):
+        return _Value()
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        for values, child in list(self._children.items()):
+            yield self.name, dict(zip(self.labelnames, values)), child.value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), function: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labelnames)
+        # Read at scrape time instead of being kept up to date
+        self.function = function
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def samples(self):
+        if self.function is not None:
+            yield self.name, {}, float(self.function())
+            return
+        yield from super().samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values))
+            with child.lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                yield f"{self.name}_bucket", {**labels, "le": _number(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+REGISTRY: List[Metric] = []
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    out = []
+    for metric in REGISTRY:
+        out.append(f"# HELP {metric.name} {metric.help}")
+        out.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            if labels:
+                rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                out.append(f"{name}{{{rendered}}} {_number(value)}")
+            else:
+                out.append(f"{name} {_number(value)}")
+    return "\n".join(out) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# ==================== HTTP ====================
+
+HTTP_REQUESTS = Counter("septer_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_DURATION = Histogram("septer_http_request_duration_seconds", "HTTP request latency, until the response body is sent", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("septer_http_requests_in_flight", "HTTP requests being handled", ("method",))
+
+# Route templates by route object; computed once per route
+_templates: Dict[int, str] = {}
+
+
+def route_template(scope: dict, status: int) -> str:
+    """
+    The matched route with its prefix, e.g. /api/logs/{log_id}/lines, so
+    IDs in paths don't become separate series. Only known after routing.
+    """
+    route = scope.get("route")
+    if route is None:
+        # Only API routes are recorded in the scope; the others (/docs,
+        # /openapi.json) have fixed paths
+        return "unmatched" if status == 404 else scope.get("path", "")
+    template = _templates.get(id(route))
+    if template is None:
+        suffix = getattr(route, "path_format", None) or getattr(route, "path", "")
+        try:
+            rendered = suffix.format(**scope.get("path_params", {}))
+        except (KeyError, IndexError, ValueError):
+            return suffix
+        path = scope.get("path", "")
+        prefix = path[:-len(rendered)] if rendered and path.endswith(rendered) else ""
+        template = _templates[id(route)] = prefix + suffix
+    return template
+
+
+class MetricsMiddleware:
+    """Counts and times every HTTP request by route template and status."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        in_flight = HTTP_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        started = time.perf_counter()
+        status = 500
+        done = False
+
+        def record():
+            nonlocal done
+            done = True
+            in_flight.dec()
+            route = route_template(scope, status)
+            HTTP_REQUESTS.labels(method, route, status).inc()
+            HTTP_DURATION.labels(method, route).observe(time.perf_counter() - started)
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            # Background tasks (e.g. parsing an upload) run after the body
+            # is sent; they are not part of the request's latency
+            if message["type"] == "http.response.body" and not message.get("more_body") and not done:
+                record()
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            if not done:
+                record()
+
+
+# ==================== STAGES ====================
+
+STAGE_DURATION = Histogram("septer_stage_duration_seconds", "Time spent in each stage of the upload and ask paths", ("path", "stage"))
+
+
+@contextmanager
+def timed(path: str, stage: str):
+    """Records how long the block took as one stage of path ("upload", "ask", "parse")."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(path, stage).observe(time.perf_counter() - started)
@@ -0,0 +1,25 @@
+import base64
+from datetime import datetime
+from typing import Tuple
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+
+# Opaque cursors for keyset pagination over (created_at, id), newest first
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), row_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_cursor(created_at_column, id_column, cursor: str):
+    """Filter for the rows that come after cursor in (created_at, id) descending order."""
+    after_time, after_id = decode_cursor(cursor)
+    return or_(created_at_column < after_time, and_(created_at_column == after_time, id_column < after_id))
@@ -2,11 +2,14 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from core.config import settings
-from core.db import get_db
+from core.cache import TTLCache
+from core.db import get_db, AsyncSessionLocal
 from models.user import User
 import re
+import threading
 
 # ==================== JWT & ACCESS CONTROL ====================
 
@@ -20,32 +23,95 @@ def create_access_token(data: dict, expires_minutes: int = 60) -> str:
     encoded_jwt = jwt.encode(to_encode, settings.jwt_secret, algorithm="HS256")
     return encoded_jwt
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid or missing credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _user_id_from_token(token: str) -> str:
     try:
         payload = jwt.decode(token, settings.jwt_secret, algorithms=["HS256"])
         user_id: str = payload.get("sub")
         if user_id is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    return user_id
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+) -> User:
+    user_id = _user_id_from_token(token)
 
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
-        raise credentials_exception
+        raise _credentials_exception()
 
     return user
 
+class Identity:
+    """
+    The authenticated user as most endpoints need it: a detached snapshot
+    of the user row, safe to cache and share between requests. Endpoints
+    that modify the user still load the ORM object via get_current_user.
+    """
+    __slots__ = ("id", "email", "role", "gemini_api_key")
+
+    def __init__(self, id: str, email: str, role: str, gemini_api_key: str = None):
+        self.id = id
+        self.email = email
+        self.role = role
+        self.gemini_api_key = gemini_api_key
+
+    @classmethod
+    def from_user(cls, user: User) -> "Identity":
+        return cls(user.id, user.email, user.role, user.gemini_api_key)
+
+# Identities by user id. Not sliding, so changes made through another
+# worker process are picked up within the TTL
+_identities = TTLCache(settings.auth_cache_size, settings.auth_cache_ttl_seconds)
+
+# Bumped on every invalidation, so a lookup that raced with one isn't cached
+_generation = 0
+_generation_lock = threading.Lock()
+
+async def get_identity(token: str = Depends(oauth2_scheme)) -> Identity:
+    """
+    Resolves the bearer token to its user, from the in-process identity
+    cache when possible. Misses use a short-lived session, so long-running
+    requests don't pin a pooled connection for their whole duration.
+    """
+    user_id = _user_id_from_token(token)
+
+    identity = _identities.get(user_id)
+    if identity is not None:
+        return identity
+
+    generation = _generation
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).filter(User.id == user_id))).scalars().first()
+    if not user:
+        raise _credentials_exception()
+
+    identity = Identity.from_user(user)
+    with _generation_lock:
+        if generation == _generation:
+            _identities.set(user_id, identity)
+    return identity
+
+def invalidate_identity(user_id: str) -> None:
+    """Call after changing or deleting a user so this process stops serving the old identity."""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        _identities.pop(user_id)
+
 def require_guardian(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: Identity = Depends(get_identity)
+) -> Identity:
     if current_user.role != "Guardian":
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
@@ -105,14 +171,25 @@ def _derive_key(passphrase: bytes, salt: bytes) -> bytes:
     )
     return kdf.derive(passphrase)
 
-AES_KEY = _derive_key(PASSPHRASE, SALT)
+# Derived on first use rather than at import, so importing this module
+# (every worker boot, scripts, tests) doesn't pay for 100k PBKDF2 rounds.
+# Concurrent first callers wait for one derivation instead of repeating it
+_aes_key = None
+_aes_key_lock = threading.Lock()
+
+def aes_key() -> bytes:
+    global _aes_key
+    with _aes_key_lock:
+        if _aes_key is None:
+            _aes_key = _derive_key(PASSPHRASE, SALT)
+    return _aes_key
 
 # Encrypt password (AES-256-CBC, PKCS7 padded, base64 encoded)
 def encrypt_password(plaintext_password: str) -> str:
     iv = IV_BASE  # Fixed IV from .env
     padder = padding.PKCS7(128).padder()
     padded_data = padder.update(plaintext_password.encode()) + padder.finalize()
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv), backend=backend)
+    cipher = Cipher(algorithms.AES(aes_key()), modes.CBC(iv), backend=backend)
     encryptor = cipher.encryptor()
     encrypted = encryptor.update(padded_data) + encryptor.finalize()
     return base64.b64encode(iv + encrypted).decode()
@@ -122,7 +199,7 @@ def decrypt_password(encrypted_password: str) -> str:
     encrypted_data = base64.b64decode(encrypted_password)
     iv = encrypted_data[:IV_LENGTH]
     ciphertext = encrypted_data[IV_LENGTH:]
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv), backend=backend)
+    cipher = Cipher(algorithms.AES(aes_key()), modes.CBC(iv), backend=backend)
     decryptor = cipher.decryptor()
     padded_plaintext = decryptor.update(ciphertext) + decryptor.finalize()
     unpadder = padding.PKCS7(128).unpadder()
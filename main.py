@@ -1,10 +1,63 @@
+import gc
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from core.db import Base, engine
-from api import auth, hunter, logs, guardian, g_login
+from sqlalchemy.exc import IntegrityError
+from core.config import settings
+from core.db import Base, engine, SessionLocal, add_missing_columns, add_missing_indexes
+from core.metrics import MetricsMiddleware
+from core.security import aes_key
+from api import auth, hunter, logs, guardian, g_login, conversations, metrics
+from services.job_queue import job_queue
+from services.file_parser import shutdown_parser_pool
+from services.question_stats import counters_missing, rebuild_question_counts
+from services.conversation_search import ensure_search_index
+
+
+# One-time setup runs here rather than at import, so importing the app
+# (tests, scripts, worker boot) stays cheap
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create DB tables (auto-migrate if not using Alembic)
+    await asyncio.to_thread(Base.metadata.create_all, bind=engine)
+    await asyncio.to_thread(add_missing_columns, engine)
+    await asyncio.to_thread(add_missing_indexes, engine)
+    await asyncio.to_thread(ensure_search_index, engine)
+    await asyncio.to_thread(_backfill_question_counts)
+
+    # Derive the AES key off the event loop without holding up readiness
+    warm_key = asyncio.ensure_future(asyncio.to_thread(aes_key))
+
+    # Background analysis workers live as long as the app
+    job_queue.start()
+
+    # Move everything allocated by imports and setup out of the collector's
+    # reach; otherwise the first requests pay for a full pass over it
+    gc.collect()
+    gc.freeze()
+    try:
+        yield
+    finally:
+        job_queue.stop()
+        shutdown_parser_pool()
+        await warm_key
+
+
+def _backfill_question_counts():
+    # One-off for databases with conversations from before the counters
+    db = SessionLocal()
+    try:
+        if counters_missing(db):
+            rebuild_question_counts(db)
+    except IntegrityError:
+        db.rollback()  # another worker process rebuilt them first
+    finally:
+        db.close()
+
 
 # Initialize FastAPI app
-app = FastAPI(title="Septer Backend")
+app = FastAPI(title="Septer Backend", lifespan=lifespan)
 
 # Enable CORS (adjust allowed origins in prod)
 app.add_middleware(
@@ -15,12 +68,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create DB tables (auto-migrate if not using Alembic)
-Base.metadata.create_all(bind=engine)
+# Per-route request counts and latencies for /metrics
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
 
 # Register route groups
 app.include_router(guardian.router, prefix="/api/guardian", tags=["Guardian"])
 app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
 app.include_router(g_login.router, prefix="/api/g-login", tags=["Guardian-login"])
 app.include_router(hunter.router, prefix="/api/hunter", tags=["Hunter"])
-app.include_router(logs.router, prefix="/api/logs", tags=["Logs"])
\ No newline at end of file
+app.include_router(logs.router, prefix="/api/logs", tags=["Logs"])
+app.include_router(conversations.router, prefix="/api/conversations", tags=["Conversations"])
+if settings.metrics_enabled:
+    app.include_router(metrics.router, prefix="/metrics", tags=["Metrics"])
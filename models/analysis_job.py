@@ -0,0 +1,30 @@
+from sqlalchemy import Column, String, ForeignKey, DateTime, Text, Boolean, Index
+from core.db import Base
+from datetime import datetime
+import uuid
+
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    log_id = Column(String, ForeignKey("logs.id"), nullable=False)
+    question = Column(Text, nullable=False)
+    filters = Column(Text, nullable=True)  # JSON-encoded index filters
+    log_ids = Column(Text, nullable=True)  # JSON-encoded further logs to merge with log_id
+    use_cache = Column(Boolean, nullable=False, default=True)
+    compact = Column(Boolean, nullable=True, default=False)  # templated prompt, see template_miner
+    incremental = Column(Boolean, nullable=True, default=False)  # build on the last answer, see analysis.prepare_analysis
+    status = Column(String, nullable=False, default="queued")  # queued, running, done, failed, cancelled
+    conversation_id = Column(String, ForeignKey("conversations.id"), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    worker_id = Column(String, nullable=True)  # JobQueue.worker_id of the process running it
+    heartbeat_at = Column(DateTime, nullable=True)  # refreshed by that process while it runs
+
+    __table_args__ = (
+        Index("ix_analysis_jobs_status_created_at", "status", "created_at"),
+    )
\ No newline at end of file
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, String, DateTime, Integer, Text, Index
+from core.db import Base
+from datetime import datetime
+
+
+class CachedAnswer(Base):
+    __tablename__ = "answer_cache"
+
+    key = Column(String, primary_key=True)  # hash of content, question, model and prompt version
+    blob_hash = Column(String, nullable=False, index=True)
+    question = Column(Text, nullable=False)  # normalised question text
+    model = Column(String, nullable=False)
+    prompt_version = Column(String, nullable=False)
+    answer_insights = Column(Text, nullable=True)
+    answer_reasoning = Column(Text, nullable=True)
+    answer_supporting_logs = Column(Text, nullable=True)
+    answer_fixes = Column(Text, nullable=True)
+    compute_ms = Column(Integer, nullable=False, default=0)  # time the original model call took
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_hit_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_answer_cache_last_hit_at", "last_hit_at"),
+    )
\ No newline at end of file
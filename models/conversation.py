@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, ForeignKey, DateTime, Text
+from sqlalchemy import Column, String, ForeignKey, DateTime, Text, Index, Integer, BigInteger
 from core.db import Base
 from datetime import datetime
 import uuid
@@ -15,4 +15,20 @@ class Conversation(Base):
     answer_reasoning = Column(Text, nullable=True)
     answer_supporting_logs = Column(Text, nullable=True)
     answer_fixes = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    log_ids = Column(Text, nullable=True)  # JSON list of every log merged for the answer; null for one log
+    # Watermark: the answer covers lines 1..analysed_lines (analysed_bytes
+    # bytes) of the log; null for filtered, compact and merged answers
+    analysed_lines = Column(Integer, nullable=True)
+    analysed_bytes = Column(BigInteger, nullable=True)
+    # Stable id of the row in the full-text index, assigned by a trigger
+    # (see conversation_search); the implicit rowid can change on VACUUM
+    search_rowid = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Keyset pagination of the Guardian dashboard (newest first, id breaks ties)
+        Index("ix_conversations_created_at_id", "created_at", "id"),
+        Index("ix_conversations_user_id_created_at", "user_id", "created_at"),
+        Index("ix_conversations_log_id", "log_id"),
+        Index("ix_conversations_search_rowid", "search_rowid", unique=True),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, ForeignKey, DateTime
+from sqlalchemy import Column, String, ForeignKey, DateTime, Integer, BigInteger
 from core.db import Base
 from datetime import datetime
 import uuid
@@ -11,4 +11,7 @@ class Log(Base):
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     type = Column(String, nullable=False)  # log type: txt, json, etc.
     uploaded_at = Column(DateTime, default=datetime.utcnow)
-    file_path = Column(String, nullable=False)
\ No newline at end of file
+    file_path = Column(String, nullable=False)
+    file_hash = Column(String, ForeignKey("log_blobs.sha256"), nullable=True)  # content address of the blob
+    size_bytes = Column(BigInteger, nullable=True)
+    line_count = Column(Integer, nullable=True)
\ No newline at end of file
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, String, DateTime, Integer, BigInteger
+from core.db import Base
+from datetime import datetime
+
+
+class LogBlob(Base):
+    __tablename__ = "log_blobs"
+
+    sha256 = Column(String, primary_key=True)  # content address of the stored file
+    file_path = Column(String, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    line_count = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # number of Log rows pointing here
+    created_at = Column(DateTime, default=datetime.utcnow)
+    indexed_at = Column(DateTime, nullable=True)  # set once the inverted index is built
+    record_format = Column(String, nullable=True)  # text, json or sarif, as detected by file_parser
+    record_count = Column(Integer, nullable=True)
+    parsed_at = Column(DateTime, nullable=True)  # set once the normalised record store is written
+    parse_error = Column(String, nullable=True)  # why the last parse failed; cleared when it is retried
+    # Set once a Log appends to the blob: it is then that Log's private copy
+    # under a random id rather than a content address (see log_append)
+    live_since = Column(DateTime, nullable=True)
+    content_hash = Column(String, nullable=True)  # live blobs: digest chained over every append
\ No newline at end of file
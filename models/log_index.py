@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, ForeignKey, Integer, LargeBinary, Index
+from core.db import Base
+
+
+class LogIndexTerm(Base):
+    __tablename__ = "log_index_terms"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    blob_hash = Column(String, ForeignKey("log_blobs.sha256"), nullable=False)
+    field = Column(String, nullable=False)  # ip, user, status, port, url, rule_id, severity
+    value = Column(String, nullable=False)
+    lines = Column(LargeBinary, nullable=False)  # packed uint32 line numbers, ascending; appends add rows
+
+    __table_args__ = (
+        Index("ix_log_index_terms_lookup", "blob_hash", "field", "value"),
+    )
\ No newline at end of file
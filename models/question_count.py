@@ -0,0 +1,20 @@
+from sqlalchemy import Column, String, ForeignKey, Integer, Date
+from core.db import Base
+
+
+# Running question counts, kept in step with the conversations table by
+# services.question_stats so the Guardian dashboard never scans history
+
+class UserQuestionCount(Base):
+    __tablename__ = "question_counts_by_user"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    questions = Column(Integer, nullable=False, default=0)
+
+
+class DailyQuestionCount(Base):
+    __tablename__ = "question_counts_by_day"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)  # UTC date the questions were asked
+    questions = Column(Integer, nullable=False, default=0)
@@ -1,10 +1,30 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Dict, List, Optional
+from schemas.log import LogLine
 
 
 class AIQuery(BaseModel):
     log_id: str
     question: str
+    # Further logs to correlate with log_id: all of them are merged into
+    # one time-ordered view, and answers cite lines as <letter>:<line>
+    # (A is log_id, then log_ids in order)
+    log_ids: Optional[List[str]] = None
+    # Optional index filters (e.g. {"ip": ["10.0.0.5"], "status": ["401"]})
+    # that limit the prompt to the matching lines
+    filters: Optional[Dict[str, List[str]]] = None
+    # Set to false to skip the answer cache and force a fresh model call
+    use_cache: bool = True
+    # Queue the analysis and return a job id instead of waiting for the answer
+    background: bool = False
+    # Send the log as mined templates plus its rare lines instead of in full:
+    # one model call however large the log, at some loss of detail
+    compact: bool = False
+    # Build on the last answer to the same question about this log: only
+    # the lines appended since are sent, with that answer, and merged into
+    # an updated one (single log, no filters or compact)
+    incremental: bool = False
 
 
 class AIAnswer(BaseModel):
@@ -12,15 +32,91 @@ class AIAnswer(BaseModel):
     reasoning: str
     supporting_logs: str
     fixes: str
+    # The log lines cited in supporting_logs, and cited numbers past the end of the log
+    cited_lines: List[LogLine] = []
+    invalid_citations: List[int] = []
+    # Answers about several logs: letter -> log id, and cited B:120 style
+    # references that don't exist
+    sources: Dict[str, str] = {}
+    invalid_source_citations: List[str] = []
+
+
+class AIBatchQuery(BaseModel):
+    log_id: str
+    # Answered together, in as few model calls as the token budget allows
+    questions: List[str]
+    # As in AIQuery, applied to every question
+    filters: Optional[Dict[str, List[str]]] = None
+    use_cache: bool = True
+    compact: bool = False
+
+
+class AIBatchItem(AIAnswer):
+    question: str
+    conversation_id: str
+    cached: bool = False
+    # From the start of the request until this answer was ready
+    latency_ms: int
+    # Estimated tokens: the prompt tokens spent on this question (an even
+    # share of each prompt it was sent in with others) and its answer's
+    prompt_tokens: int = 0
+    answer_tokens: int = 0
+
+
+class AIBatchAnswer(BaseModel):
+    log_id: str
+    answers: List[AIBatchItem]
+    # For the whole batch
+    model_calls: int
+    prompt_tokens: int
+    latency_ms: int
 
 
 class ConversationOut(BaseModel):
     id: str
     user_id: str
     log_id: str
+    log_ids: Optional[List[str]] = None
     question: str
     answer: AIAnswer
     created_at: datetime
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+class JobOut(BaseModel):
+    id: str
+    status: str
+    log_id: str
+    log_ids: Optional[List[str]] = None
+    question: str
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    conversation_id: Optional[str] = None
+    answer: Optional[AIAnswer] = None
+
+class ConversationSummary(BaseModel):
+    id: str
+    log_id: str
+    question: str
+    created_at: datetime
+
+
+class ConversationPage(BaseModel):
+    conversations: List[ConversationSummary]
+    next_cursor: Optional[str] = None
+
+
+class ConversationHit(ConversationSummary):
+    user_id: str
+    snippet: Optional[str] = None  # matched terms in [brackets]
+    score: Optional[float] = None  # higher is more relevant
+
+
+class ConversationSearchResult(BaseModel):
+    query: str
+    hits: List[ConversationHit]
+    next_offset: Optional[int] = None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Literal
+from typing import List, Literal, Optional, Tuple
 from datetime import datetime
 
 
@@ -22,4 +22,93 @@ class LogOut(BaseModel):
     file_path: str
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+class LogLine(BaseModel):
+    line: int
+    text: str
+    log_id: Optional[str] = None  # set where lines of several logs are mixed
+
+
+class MergedSearchResult(BaseModel):
+    log_ids: List[str]
+    total_matches: int
+    lines: List[LogLine]  # in timestamp order across the logs
+
+
+class LogSearchResult(BaseModel):
+    log_id: str
+    total_matches: int
+    lines: List[LogLine]
+
+
+class LogAppendResult(BaseModel):
+    log_id: str
+    appended_lines: int
+    line_count: int  # of the whole log after the append
+    size_bytes: int
+
+
+class LogLines(BaseModel):
+    log_id: str
+    start: int
+    end: int
+    total_lines: int
+    lines: List[LogLine]
+
+
+class Talker(BaseModel):
+    value: str
+    events: int
+    errors: int
+    auth_failures: int
+    first_seen: Optional[str] = None
+    last_seen: Optional[str] = None
+    buckets: List[Tuple[Optional[str], int]]  # (bucket start, events) for buckets with activity
+
+
+class Finding(BaseModel):
+    type: str  # brute_force, port_scan, fan_out, rate_spike, error_spike
+    subject: str
+    count: int
+    window_start: Optional[str] = None
+    detail: str
+    lines: List[int]  # sample line numbers
+
+
+class LogFindings(BaseModel):
+    log_id: str
+    records: int
+    bucket_seconds: int
+    first_seen: Optional[str] = None
+    last_seen: Optional[str] = None
+    top_ips: List[Talker]
+    top_users: List[Talker]
+    findings: List[Finding]
+
+
+class TemplateValues(BaseModel):
+    top: List[Tuple[str, int]]  # most common values with their counts
+    other: int  # lines with any other value
+
+
+class LogTemplate(BaseModel):
+    template: str  # <*> marks a variable token
+    count: int
+    first_line: int
+    last_line: int
+    samples: List[Tuple[int, List[str]]]  # (line, values of the <*> tokens)
+    values: List[TemplateValues]  # one per <*>, in order
+
+
+class LogTemplates(BaseModel):
+    log_id: str
+    lines: int
+    template_count: int
+    raw_chars: int
+    compact_chars: int
+    compression_ratio: float
+    raw_tokens: int  # estimated, as for prompt budgeting
+    compact_tokens: int
+    templates: List[LogTemplate]
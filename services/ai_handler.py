@@ -1,10 +1,82 @@
-import google.generativeai as genai
+import re
+import time
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from fastapi import HTTPException, status
-from typing import Dict
+from typing import AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Tuple
 from pathlib import Path
+from core.config import settings
+from core.metrics import Counter, Gauge, Histogram, BYTE_BUCKETS, TOKEN_BUCKETS, timed
+from services.blob_compression import blob_size
+from services.gemini_clients import get_model
+from services.log_merge import MergeSource, merged_lines, legend
+from services.record_store import iter_log_lines, load_log_text
+from services.template_miner import load_templates, mine, render_compact
+from services.threat_analysis import prompt_summary
 
+# Rough token estimate used for chunk budgeting (Gemini averages ~4 chars/token)
+CHARS_PER_TOKEN = 4
 
-def build_prompt(question: str, log_text: str) -> str:
+SECTION_KEYS = ["insights", "reasoning", "supporting_logs", "fixes"]
+
+# Emoji headers that open each section of a model response
+SECTION_HEADERS = [
+    ("🔍", "insights"),
+    ("🧠", "reasoning"),
+    ("📄", "supporting_logs"),
+    ("🛠️", "fixes"),
+]
+
+# Citations of log lines in the Supporting Logs section
+CITATION = re.compile(r"\b[Ll]ines? ?#?(\d+)(?:\s*(?:-|–|to)\s*(\d+))?|^\s*(?:[-*•]\s*)?(\d+):\s", re.MULTILINE)
+MAX_CITED_LINES = 200
+
+# Line opening each answer in the response to a batch prompt ("### Question 2")
+BATCH_ANSWER = re.compile(r"^[\s#*]*Question\s+(\d+)\b", re.MULTILINE)
+
+# Bump whenever the prompts change so cached answers from older prompts are not reused
+PROMPT_VERSION = "5"
+
+PROMPT_BYTES = Histogram("septer_prompt_bytes", "Size of each prompt sent to the model", buckets=BYTE_BUCKETS)
+PROMPT_TOKENS = Histogram("septer_prompt_tokens_estimated", "Estimated tokens of each prompt sent to the model", buckets=TOKEN_BUCKETS)
+MODEL_ERRORS = Counter("septer_model_errors_total", "Failed model calls: client setup, API errors and timeouts", ("kind",))
+MODEL_IN_FLIGHT = Gauge("septer_model_calls_in_flight", "Model calls running in this worker")
+MODEL_WAITING = Gauge("septer_model_calls_waiting", "Model calls waiting for one of the ai_max_inflight slots")
+
+
+class PriorAnswer(NamedTuple):
+    # An earlier answer to the same question, which analysed lines 1..lines
+    # of the log; incremental asks send only what came after it
+    lines: int
+    sections: Dict[str, str]
+
+
+class BatchAnswer(NamedTuple):
+    # One question's answer from call_gemini_batch_async, when it was ready
+    # (a time.perf_counter() reading) and the estimated prompt tokens spent
+    # on it: an even share of the calls it went into with other questions,
+    # plus any calls of its own
+    sections: Dict[str, str]
+    ready_at: float
+    prompt_tokens: int
+
+
+class PromptUsage:
+    """Model calls and estimated prompt tokens counted by prompt_usage."""
+
+    def __init__(self, parent: Optional["PromptUsage"] = None):
+        self.parent = parent
+        self.calls = 0
+        self.tokens = 0
+
+
+_usage: ContextVar[Optional[PromptUsage]] = ContextVar("prompt_usage", default=None)
+
+
+def build_prompt(question: str, log_text: str, summary: Optional[str] = None) -> str:
     return (
         f"""
         You are a cyber forensics expert in log analysis. Analyze system/network/application logs to detect malicious activity. An "attack" is any behavior from a source IP/entity attempting unauthorized access, disruption, or exploitation—like a hacker would.
@@ -14,9 +86,166 @@ def build_prompt(question: str, log_text: str) -> str:
 
         The hunter asks:
         {question}
+{_pre_analysis(summary)}
+        Here is the log data:
+        {log_text}
+
+        Please respond using the following format:
+
+        🔍 Insights  
+        🧠 Reasoning  
+        📄 Supporting Logs: Line number, log line, interesting part of log  
+        🛠️ Fixes or security measures that can be employed to prevent such attacks.
+        """
+    )
+
+
+def build_chunk_prompt(question: str, chunk_text: str, first_line: int, last_line: int, summary: Optional[str] = None) -> str:
+    return (
+        f"""
+        You are a cyber forensics expert in log analysis. Analyze system/network/application logs to detect malicious activity. An "attack" is any behavior from a source IP/entity attempting unauthorized access, disruption, or exploitation—like a hacker would.
+        You are looking at lines {first_line} to {last_line} of a larger log. Each line is prefixed with its line number; always cite those numbers.
+
+        The hunter asks:
+        {question}
+{_pre_analysis(summary)}
+        Here is the log data:
+        {chunk_text}
+
+        Please respond using the following format:
+
+        🔍 Insights  
+        🧠 Reasoning  
+        📄 Supporting Logs: Line number, log line, interesting part of log  
+        🛠️ Fixes or security measures that can be employed to prevent such attacks.
+        """
+    )
+
+
+def build_incremental_prompt(question: str, prior: PriorAnswer, new_text: str, first_line: int, last_line: int, summary: Optional[str] = None) -> str:
+    return (
+        f"""
+        You are a cyber forensics expert in log analysis. Analyze system/network/application logs to detect malicious activity. An "attack" is any behavior from a source IP/entity attempting unauthorized access, disruption, or exploitation—like a hacker would.
+        The log has grown since the hunter's question was last answered. Below are the earlier answer, which covered lines 1 to {prior.lines}, and the new lines {first_line} to {last_line}, each prefixed with its line number.
+        Update the answer with what the new lines show: keep earlier findings that still hold, revise those the new lines change, add new ones, and cite line numbers from either part.
+
+        The hunter asks:
+        {question}
+{_pre_analysis(summary)}
+        Earlier answer (lines 1-{prior.lines}):
+        Insights: {prior.sections['insights']}
+        Reasoning: {prior.sections['reasoning']}
+        Supporting Logs: {prior.sections['supporting_logs']}
+        Fixes: {prior.sections['fixes']}
+
+        Here is the new log data:
+        {new_text}
+
+        Please respond using the following format:
+
+        🔍 Insights  
+        🧠 Reasoning  
+        📄 Supporting Logs: Line number, log line, interesting part of log  
+        🛠️ Fixes or security measures that can be employed to prevent such attacks.
+        """
+    )
+
+
+def build_batch_prompt(questions: List[str], log_text: str, summary: Optional[str] = None) -> str:
+    return (
+        f"""
+        You are a cyber forensics expert in log analysis. Analyze system/network/application logs to detect malicious activity. An "attack" is any behavior from a source IP/entity attempting unauthorized access, disruption, or exploitation—like a hacker would.
+        You'll be given:
+        - {len(questions)} numbered questions from a Hunter (analyst)
+        - A log snippet (.log, .json, .txt, or SARIF)
 
+        The hunter asks:
+{_numbered(questions)}
+{_pre_analysis(summary)}
         Here is the log data:
         {log_text}
+{_batch_format()}
+        """
+    )
+
+
+def build_batch_chunk_prompt(questions: List[str], chunk_text: str, first_line: int, last_line: int, summary: Optional[str] = None) -> str:
+    return (
+        f"""
+        You are a cyber forensics expert in log analysis. Analyze system/network/application logs to detect malicious activity. An "attack" is any behavior from a source IP/entity attempting unauthorized access, disruption, or exploitation—like a hacker would.
+        You are looking at lines {first_line} to {last_line} of a larger log. Each line is prefixed with its line number; always cite those numbers.
+
+        The hunter asks {len(questions)} numbered questions:
+{_numbered(questions)}
+{_pre_analysis(summary)}
+        Here is the log data:
+        {chunk_text}
+{_batch_format()}
+        """
+    )
+
+
+def _numbered(questions: List[str]) -> str:
+    return "\n".join(f"        Question {n}: {' '.join(q.split())}" for n, q in enumerate(questions, start=1))
+
+
+def _batch_format() -> str:
+    return """
+        Answer every question separately, in order. Start each answer with a line "### Question <number>", then use the following format:
+
+        🔍 Insights  
+        🧠 Reasoning  
+        📄 Supporting Logs: Line number, log line, interesting part of log  
+        🛠️ Fixes or security measures that can be employed to prevent such attacks."""
+
+
+def build_merged_chunk_prompt(question: str, chunk_text: str, first: int, last: int, sources: List[MergeSource], summary: Optional[str] = None) -> str:
+    return (
+        f"""
+        You are a cyber forensics expert in log analysis. Analyze system/network/application logs to detect malicious activity. An "attack" is any behavior from a source IP/entity attempting unauthorized access, disruption, or exploitation—like a hacker would.
+        You are looking at lines {first} to {last} of a timeline merged from several logs in timestamp order, so events from different sources that happened together are next to each other. Correlate them across sources.
+        Each line is prefixed with its log's letter and its line number in that log, e.g. B:120; always cite lines that way.
+
+        The logs are:
+{_indent(legend(sources))}
+
+        The hunter asks:
+        {question}
+{_pre_analysis(summary)}
+        Here is the log data:
+        {chunk_text}
+
+        Please respond using the following format:
+
+        🔍 Insights  
+        🧠 Reasoning  
+        📄 Supporting Logs: Line reference (e.g. B:120), log line, interesting part of log  
+        🛠️ Fixes or security measures that can be employed to prevent such attacks.
+        """
+    )
+
+
+def build_reduce_prompt(question: str, partials: List[Tuple[int, int, Dict[str, str]]], summary: Optional[str] = None, sources: Optional[List[MergeSource]] = None) -> str:
+    if sources:
+        return build_merged_reduce_prompt(question, partials, summary, sources)
+    findings = "\n\n".join(
+        f"Lines {first}-{last}:\n"
+        f"Insights: {sections['insights']}\n"
+        f"Reasoning: {sections['reasoning']}\n"
+        f"Supporting Logs: {sections['supporting_logs']}\n"
+        f"Fixes: {sections['fixes']}"
+        for first, last, sections in partials
+    )
+    return (
+        f"""
+        You are a cyber forensics expert in log analysis. A large log was analysed in parts and the findings for each part are below.
+        Merge them into one answer to the hunter's question: combine related insights, drop duplicates, and keep the original line numbers when citing supporting logs.
+
+        The hunter asks:
+        {question}
+{_pre_analysis(summary)}
+        Findings per part:
+        {findings}
 
         Please respond using the following format:
 
@@ -28,30 +257,738 @@ def build_prompt(question: str, log_text: str) -> str:
     )
 
 
-def call_gemini(log_file_path: Path, question: str, user) -> Dict[str, str]:
+def build_merged_reduce_prompt(question: str, partials: List[Tuple[int, int, Dict[str, str]]], summary: Optional[str], sources: List[MergeSource]) -> str:
+    findings = "\n\n".join(
+        f"Timeline lines {first}-{last}:\n"
+        f"Insights: {sections['insights']}\n"
+        f"Reasoning: {sections['reasoning']}\n"
+        f"Supporting Logs: {sections['supporting_logs']}\n"
+        f"Fixes: {sections['fixes']}"
+        for first, last, sections in partials
+    )
+    return (
+        f"""
+        You are a cyber forensics expert in log analysis. Several logs were merged into one timeline in timestamp order, analysed in parts, and the findings for each part are below.
+        Merge them into one answer to the hunter's question: correlate events across the logs, combine related insights, drop duplicates, and keep the letter:line references (e.g. B:120) when citing supporting logs.
+
+        The logs are:
+{_indent(legend(sources))}
+
+        The hunter asks:
+        {question}
+{_pre_analysis(summary)}
+        Findings per part:
+        {findings}
+
+        Please respond using the following format:
+
+        🔍 Insights  
+        🧠 Reasoning  
+        📄 Supporting Logs: Line reference (e.g. B:120), log line, interesting part of log  
+        🛠️ Fixes or security measures that can be employed to prevent such attacks.
+        """
+    )
+
+
+def merged_summary(sources: List[MergeSource]) -> Optional[str]:
+    """The pre-analysis of each log under its letter; None if no log has one."""
+    parts = []
+    for source in sources:
+        summary = prompt_summary(source.path)
+        if summary:
+            parts.append(f"Log {source.tag} (cite its lines as {source.tag}:<line>):\n{summary}")
+    return "\n".join(parts) or None
+
+
+def _indent(text: str) -> str:
+    return "\n".join(f"        {line}" for line in text.splitlines())
+
+
+def _pre_analysis(summary: Optional[str]) -> str:
+    # Deterministic aggregates over the whole log (see threat_analysis); empty when unavailable
+    if not summary:
+        return ""
+    return f"\n        Deterministic pre-analysis of the whole log (exact counts over every record; cite the line numbers it gives):\n{_indent(summary)}\n"
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+async def generate_async(model, prompt: str) -> Dict[str, str]:
+    raw_text = await generate_text_async(model, prompt)
+    with timed("ask", "extract_sections"):
+        return extract_sections(raw_text)
+
+
+async def generate_text_async(model, prompt: str) -> str:
+    _record_prompt(prompt)
+    async with _model_slot():
+        try:
+            with timed("ask", "model_call"):
+                if hasattr(model, "generate_content_async"):
+                    response = await model.generate_content_async(prompt, stream=False)
+                else:
+                    response = await asyncio.to_thread(model.generate_content, prompt, stream=False)
+        except Exception as e:
+            MODEL_ERRORS.labels("api_error").inc()
+            raise HTTPException(status_code=500, detail=f"Gemini API request failed: {str(e)}")
+
+    return (response.text if hasattr(response, "text") else "") or ""
+
+
+def _record_prompt(prompt: str) -> None:
+    tokens = estimate_tokens(prompt)
+    PROMPT_BYTES.observe(len(prompt.encode("utf-8", "replace")))
+    PROMPT_TOKENS.observe(tokens)
+    usage = _usage.get()
+    while usage is not None:
+        usage.calls += 1
+        usage.tokens += tokens
+        usage = usage.parent
+
+
+@contextmanager
+def prompt_usage() -> Iterator[PromptUsage]:
+    """
+    Tallies the model calls made and prompt tokens sent by the current task
+    and the tasks it starts until the block exits, also into any enclosing
+    tally. Tasks started inside a tally stay in it even after it exits.
+    """
+    usage = PromptUsage(_usage.get())
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+# Every upstream call in this process shares one limiter, whichever event
+# loop it runs on (the server's, or a job worker's), so a burst of slow
+# analyses queues here instead of piling onto the model API
+_model_slots = threading.BoundedSemaphore(max(1, settings.ai_max_inflight))
+
+# Waits for a slot off the event loop. One thread serves the waiters in
+# turn, so waiting never ties up the default executor the model calls need
+_slot_waiter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-slot")
+
+
+@asynccontextmanager
+async def _model_slot():
+    MODEL_WAITING.inc()
+    try:
+        with timed("ask", "model_queue"):
+            await _acquire_model_slot()
+    finally:
+        MODEL_WAITING.dec()
+    MODEL_IN_FLIGHT.inc()
+    try:
+        yield
+    finally:
+        MODEL_IN_FLIGHT.dec()
+        _model_slots.release()
+
+
+async def _acquire_model_slot() -> None:
+    if _model_slots.acquire(blocking=False):
+        return
+    waiting = _slot_waiter.submit(_model_slots.acquire)
+    try:
+        await asyncio.wrap_future(waiting)
+    except asyncio.CancelledError:
+        # The wait is cancelled with us unless it already started; then the
+        # slot it goes on to take is handed straight back
+        waiting.add_done_callback(_release_unused_slot)
+        raise
+
+
+def _release_unused_slot(waiting: Future) -> None:
+    if not waiting.cancelled():
+        _model_slots.release()
+
+
+def call_gemini(log_file_path: Path, question: str, user, model=None, line_numbers: Optional[List[int]] = None, compact: bool = False, sources: Optional[List[MergeSource]] = None, prior: Optional[PriorAnswer] = None) -> Dict[str, str]:
+    # Blocking entry point for callers outside the event loop (scripts, worker threads)
+    return asyncio.run(call_gemini_async(log_file_path, question, user, model, line_numbers, compact, sources, prior))
+
+
+async def call_gemini_async(log_file_path: Path, question: str, user, model=None, line_numbers: Optional[List[int]] = None, compact: bool = False, sources: Optional[List[MergeSource]] = None, prior: Optional[PriorAnswer] = None) -> Dict[str, str]:
+    """
+    Answers question about the log at log_file_path, or, if sources is
+    given, about the time-ordered merge of those logs (see log_merge).
+    With prior, line_numbers are the lines added since that answer, which
+    is updated with what they show rather than analysing the whole log.
+    """
+    model = _user_model(user, model)
+
+    try:
+        return await asyncio.wait_for(
+            _analyse(log_file_path, question, model, line_numbers, compact, sources, prior),
+            timeout=settings.ai_request_timeout_seconds
+        )
+    except asyncio.TimeoutError:
+        MODEL_ERRORS.labels("timeout").inc()
+        raise HTTPException(status_code=504, detail="Gemini analysis timed out")
+
+
+def _user_model(user, model=None):
+    # The model to call for user: model if given, else one on the user's own key
     if not user or not user.id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated.")
 
     if not user.gemini_api_key:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Gemini API key is not set.")
 
+    if model is not None:
+        return model
+    try:
+        return get_model(user)
+    except Exception as e:
+        MODEL_ERRORS.labels("client").inc()
+        raise HTTPException(status_code=500, detail=f"Gemini API request failed: {str(e)}")
+
+
+async def _analyse(log_file_path: Path, question: str, model, line_numbers: Optional[List[int]], compact: bool = False, sources: Optional[List[MergeSource]] = None, prior: Optional[PriorAnswer] = None) -> Dict[str, str]:
+    budget = settings.ai_chunk_token_budget
+    if sources:
+        # Merged timelines always go through the chunked path, which numbers
+        # every line; one that fits the budget is still a single call
+        with timed("ask", "pre_analysis"):
+            summary = await asyncio.to_thread(merged_summary, sources)
+        with timed("ask", "map_reduce"):
+            return await call_gemini_chunked(log_file_path, question, model, budget, None, summary, sources)
+
     try:
-        log_text = log_file_path.read_text(encoding='utf-8')
+        file_size = blob_size(str(log_file_path))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to read log file: {str(e)}")
 
-    prompt = build_prompt(question, log_text)
+    with timed("ask", "pre_analysis"):
+        summary = await asyncio.to_thread(prompt_summary, str(log_file_path))
+    if prior is not None:
+        prompt = await incremental_prompt(log_file_path, question, budget, line_numbers, prior, summary)
+        if prompt is not None:
+            return await generate_async(model, prompt)
+    if compact:
+        return await generate_async(model, await compact_prompt(log_file_path, question, budget, line_numbers, summary))
+
+    # Prompts scoped to index matches always carry global line numbers;
+    # otherwise map-reduce only when the log would not fit in a single prompt
+    if line_numbers is not None or file_size // CHARS_PER_TOKEN > budget:
+        with timed("ask", "map_reduce"):
+            return await call_gemini_chunked(log_file_path, question, model, budget, line_numbers, summary, prior=prior)
 
     try:
-        genai.configure(api_key=user.gemini_api_key)
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt, stream=False)
+        with timed("ask", "read_log"):
+            log_text = await asyncio.to_thread(load_log_text, log_file_path)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Gemini API request failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to read log file: {str(e)}")
+
+    with timed("ask", "build_prompt"):
+        prompt = build_prompt(question, log_text, summary)
+    return await generate_async(model, prompt)
+
+
+async def call_gemini_batch_async(log_file_path: Path, questions: List[str], user, model=None, line_numbers: Optional[List[int]] = None, compact: bool = False) -> Tuple[List[BatchAnswer], PromptUsage]:
+    """
+    Answers several questions about one log in as few model calls as
+    possible: the log is read once and sent with groups of the questions
+    (see batch_groups), and each response is split into one answer per
+    question. Logs too large for one prompt go through the map step with
+    a group's questions together, then each question gets its own reduce.
+    Returns the answers in the order of questions, and what all of it took.
+    """
+    model = _user_model(user, model)
+    with prompt_usage() as usage:
+        try:
+            answers = await asyncio.wait_for(
+                _analyse_batch(log_file_path, questions, model, line_numbers, compact),
+                timeout=settings.ai_request_timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            MODEL_ERRORS.labels("timeout").inc()
+            raise HTTPException(status_code=504, detail="Gemini analysis timed out")
+    return answers, usage
+
+
+async def _analyse_batch(log_file_path: Path, questions: List[str], model, line_numbers: Optional[List[int]], compact: bool) -> List[BatchAnswer]:
+    budget = settings.ai_chunk_token_budget
+    try:
+        file_size = blob_size(str(log_file_path))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read log file: {str(e)}")
+
+    with timed("ask", "pre_analysis"):
+        summary = await asyncio.to_thread(prompt_summary, str(log_file_path))
+    groups, alone = batch_groups(questions, budget, summary)
+
+    # The log goes into every group's prompt as the same text, read (or
+    # compacted) once to fit beside the group with the longest questions
+    log_text = None
+    room = budget - max((estimate_tokens(build_batch_prompt([questions[i] for i in g], "", summary)) for g in groups), default=0)
+    if compact and groups:
+        log_text = await compact_text(log_file_path, room * CHARS_PER_TOKEN, line_numbers)
+    elif groups and line_numbers is None and file_size // CHARS_PER_TOKEN <= room:
+        try:
+            with timed("ask", "read_log"):
+                log_text = await asyncio.to_thread(load_log_text, log_file_path)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to read log file: {str(e)}")
+
+    async def answer_group(group: List[int]) -> List[BatchAnswer]:
+        asked = [questions[i] for i in group]
+        with prompt_usage() as shared:
+            if log_text is not None:
+                response = await generate_text_async(model, build_batch_prompt(asked, log_text, summary))
+                finishing = [{"sections": sections} for sections in split_batch_answers(response, len(asked))]
+            else:
+                with timed("ask", "map_reduce"):
+                    parts = await map_batch_chunks(log_file_path, asked, model, room, line_numbers, summary)
+                finishing = [{"partials": partials} for partials in parts]
+        share = shared.tokens // len(asked)
+        return list(await asyncio.gather(*(finish(q, share, **f) for q, f in zip(asked, finishing))))
+
+    async def finish(question: str, share: int, sections: Optional[Dict[str, str]] = None, partials: Optional[List[Tuple[int, int, Dict[str, str]]]] = None) -> BatchAnswer:
+        with prompt_usage() as own:
+            if partials:
+                sections = await reduce_partials(question, partials, model, budget, summary)
+            if not sections or not any(sections.values()):
+                # Left out of the batch's response, or too long to batch; asked on its own
+                sections = await _analyse(log_file_path, question, model, line_numbers, compact)
+        return BatchAnswer(sections, time.perf_counter(), share + own.tokens)
+
+    async def answer_alone(i: int) -> List[BatchAnswer]:
+        return [await finish(questions[i], 0)]
+
+    results = await asyncio.gather(*map(answer_group, groups), *map(answer_alone, alone))
+    answers: List[Optional[BatchAnswer]] = [None] * len(questions)
+    for indexes, result in zip([*groups, *([i] for i in alone)], results):
+        for i, answer in zip(indexes, result):
+            answers[i] = answer
+    return answers
+
+
+def batch_groups(questions: List[str], token_budget: int, summary: Optional[str] = None) -> Tuple[List[List[int]], List[int]]:
+    """
+    Splits questions (by index) into groups to send together: at most
+    settings.ai_batch_questions_per_call each, which bounds the length of
+    the response, and small enough that the log keeps at least half of the
+    prompt budget. Questions too long to share a prompt are returned
+    separately, to be asked on their own.
+    """
+    limit = max(1, settings.ai_batch_questions_per_call)
+    groups, group, alone = [], [], []
+    for i, question in enumerate(questions):
+        if estimate_tokens(build_batch_prompt([question], "", summary)) > token_budget // 2:
+            alone.append(i)
+            continue
+        candidate = [questions[j] for j in group] + [question]
+        if group and (len(group) >= limit or estimate_tokens(build_batch_prompt(candidate, "", summary)) > token_budget // 2):
+            groups.append(group)
+            group = []
+        group.append(i)
+    if group:
+        groups.append(group)
+    return groups, alone
+
+
+async def map_batch_chunks(log_file_path: Path, questions: List[str], model, token_budget: int, line_numbers: Optional[List[int]] = None, summary: Optional[str] = None) -> List[List[Tuple[int, int, Dict[str, str]]]]:
+    """
+    Map step for a group of questions: each chunk is sent once with all of
+    them. Returns every question's partials, leaving out chunks whose
+    response had no answer to it. As in map_chunks, a single chunk's prompt
+    carries summary.
+    """
+    async def analyse(chunk, alone):
+        first, last, text = chunk
+        response = await generate_text_async(model, build_batch_chunk_prompt(questions, text, first, last, summary if alone else None))
+        return first, last, split_batch_answers(response, len(questions))
+
+    results = await _map(iter_log_chunks(log_file_path, token_budget, line_numbers), analyse)
+    return [
+        [(first, last, answers[i]) for first, last, answers in results if any(answers[i].values())]
+        for i in range(len(questions))
+    ]
+
+
+async def compact_prompt(log_file_path: Path, question: str, token_budget: int, line_numbers: Optional[List[int]] = None, summary: Optional[str] = None) -> str:
+    """
+    Single prompt carrying the log as mined templates plus its rare lines,
+    cut to fit token_budget. Whole logs use the templates mined at upload;
+    index-filtered lines are mined on the fly.
+    """
+    max_chars = token_budget * CHARS_PER_TOKEN - len(build_prompt(question, "", summary))
+    return build_prompt(question, await compact_text(log_file_path, max_chars, line_numbers), summary)
+
+
+async def compact_text(log_file_path: Path, max_chars: int, line_numbers: Optional[List[int]] = None) -> str:
+    """The log as templates plus rare lines in at most max_chars (see compact_prompt)."""
+    def render():
+        doc = load_templates(str(log_file_path)) if line_numbers is None else None
+        if doc is None:
+            doc = mine(iter_log_lines(log_file_path, line_numbers))
+        return render_compact(doc, max_chars)
+
+    try:
+        with timed("ask", "compact_prompt"):
+            return await asyncio.to_thread(render)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read log file: {str(e)}")
+
+
+async def call_gemini_chunked(log_file_path: Path, question: str, model, token_budget: int, line_numbers: Optional[List[int]] = None, summary: Optional[str] = None, sources: Optional[List[MergeSource]] = None, prior: Optional[PriorAnswer] = None) -> Dict[str, str]:
+    """
+    Analyses a large log in line-aligned chunks of at most token_budget
+    estimated tokens, at most settings.ai_max_concurrency at a time, then
+    merges the per-chunk answers with a final reduce call.
+    If line_numbers is given only those lines are analysed; if sources is
+    given the chunks are cut from their merged timeline instead. summary,
+    the whole-log pre-analysis, goes into the reduce prompt, or into the
+    chunk's prompt if there is only one. prior, an earlier answer about the
+    lines before line_numbers, is merged in as the first part.
+    """
+    partials = await map_chunks(log_file_path, question, model, token_budget, line_numbers, sources, summary if prior is None else None)
+    if prior is not None:
+        partials.insert(0, (1, prior.lines, prior.sections))
+    return await reduce_partials(question, partials, model, token_budget, summary, sources)
+
+
+async def incremental_prompt(log_file_path: Path, question: str, token_budget: int, line_numbers: List[int], prior: PriorAnswer, summary: Optional[str] = None) -> Optional[str]:
+    """
+    One prompt updating prior with the new lines (line_numbers), or None
+    if they don't fit in the budget alongside it, in which case they are
+    analysed in chunks and merged with prior (see call_gemini_chunked).
+    """
+    room = token_budget - estimate_tokens(build_incremental_prompt(question, prior, "", 0, 0, summary))
+    if room <= 0:
+        return None
 
-    raw_text = response.text if hasattr(response, "text") else ""
+    def first_chunks():
+        chunks = iter_log_chunks(log_file_path, room, line_numbers)
+        try:
+            return next(chunks, None), next(chunks, None)
+        finally:
+            chunks.close()
+
+    try:
+        with timed("ask", "read_log"):
+            chunk, rest = await asyncio.to_thread(first_chunks)
+    except (UnicodeDecodeError, OSError) as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read log file: {str(e)}")
+    if chunk is None or rest is not None:
+        return None
+    first, last, text = chunk
+    return build_incremental_prompt(question, prior, text, first, last, summary)
+
+
+async def map_chunks(log_file_path: Path, question: str, model, token_budget: int, line_numbers: Optional[List[int]] = None, sources: Optional[List[MergeSource]] = None, summary: Optional[str] = None) -> List[Tuple[int, int, Dict[str, str]]]:
+    """
+    Runs the map step of call_gemini_chunked; returns (first_line,
+    last_line, sections) per chunk, in timeline lines for merged sources.
+    A single chunk's answer is final, with no reduce call, so its prompt
+    carries summary instead.
+    """
+    async def analyse(chunk, alone):
+        first, last, text = chunk
+        if sources:
+            prompt = build_merged_chunk_prompt(question, text, first, last, sources, summary if alone else None)
+        else:
+            prompt = build_chunk_prompt(question, text, first, last, summary if alone else None)
+        return first, last, await generate_async(model, prompt)
+
+    if sources:
+        chunks = iter_merged_chunks(sources, token_budget)
+    else:
+        chunks = iter_log_chunks(log_file_path, token_budget, line_numbers)
+    return await _map(chunks, analyse)
+
+
+async def _map(chunks: Iterator[Tuple[int, int, str]], analyse) -> list:
+    """
+    Runs analyse(chunk, alone) over chunks, at most
+    settings.ai_max_concurrency at a time, where alone is whether it is the
+    only chunk; returns its (first, last, ...) results in line order.
+    """
+    partials = []
+    max_workers = max(1, settings.ai_max_concurrency)
+    pending = set()
+    try:
+        # Keep at most max_workers chunks in flight, plus the one read ahead
+        # to tell a lone chunk, so memory stays bounded; chunks are read off
+        # the event loop
+        chunk = await asyncio.to_thread(next, chunks, None)
+        first = True
+        while chunk is not None:
+            following = await asyncio.to_thread(next, chunks, None)
+            if len(pending) >= max_workers:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                partials.extend(t.result() for t in done)
+            pending.add(asyncio.ensure_future(analyse(chunk, first and following is None)))
+            chunk, first = following, False
+        if pending:
+            done, pending = await asyncio.wait(pending)
+            partials.extend(t.result() for t in done)
+    except (UnicodeDecodeError, OSError) as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read log file: {str(e)}")
+    finally:
+        for task in pending:
+            task.cancel()
+        chunks.close()
+
+    if not partials:
+        raise HTTPException(status_code=404, detail="No log lines to analyse")
+
+    partials.sort(key=lambda p: p[0])
+    return partials
+
+
+async def reduce_partials(question: str, partials: List[Tuple[int, int, Dict[str, str]]], model, token_budget: int, summary: Optional[str] = None, sources: Optional[List[MergeSource]] = None) -> Dict[str, str]:
+    """Merges per-chunk answers into one with a final reduce call."""
+    shrunk = await shrink_partials(question, partials, model, token_budget, summary, sources)
+    if _is_final(partials, shrunk, summary):
+        return shrunk[0][2]
+
+    merged = await generate_async(model, build_reduce_prompt(question, shrunk, summary, sources))
+    if not any(merged.values()):
+        merged = merge_sections([sections for _, _, sections in shrunk])
+    return merged
+
+
+def _is_final(partials: list, shrunk: list, summary: Optional[str]) -> bool:
+    # A lone chunk's answer is final, as its prompt carried summary; parts
+    # merged down to one by shrink_partials still need a reduce that adds it
+    return len(shrunk) == 1 and (len(partials) == 1 or not summary)
+
+
+async def shrink_partials(question: str, partials: List[Tuple[int, int, Dict[str, str]]], model, token_budget: int, summary: Optional[str] = None, sources: Optional[List[MergeSource]] = None) -> List[Tuple[int, int, Dict[str, str]]]:
+    """
+    While the final merge prompt for all partials (which also carries the
+    summary) would exceed the budget, merges neighbouring partials in
+    groups that would fit in it, summary included.
+    """
+    while len(partials) > 1 and estimate_tokens(build_reduce_prompt(question, partials, summary, sources)) > token_budget:
+        groups, group = [], []
+        for partial in partials:
+            if group and estimate_tokens(build_reduce_prompt(question, group + [partial], summary, sources)) > token_budget:
+                groups.append(group)
+                group = []
+            group.append(partial)
+        groups.append(group)
+
+        async def merge(group):
+            if len(group) == 1:
+                return group[0]
+            merged = await generate_async(model, build_reduce_prompt(question, group, sources=sources))
+            if not any(merged.values()):
+                merged = merge_sections([sections for _, _, sections in group])
+            return group[0][0], group[-1][1], merged
+
+        reduced = list(await asyncio.gather(*(merge(g) for g in groups)))
+
+        # Each pass must shrink the list; fall back to a plain merge if it can't
+        if len(reduced) == len(partials):
+            merged = merge_sections([sections for _, _, sections in partials])
+            return [(partials[0][0], partials[-1][1], merged)]
+        partials = reduced
+
+    return partials
+
+
+async def stream_gemini_async(log_file_path: Path, question: str, user, model=None, line_numbers: Optional[List[int]] = None, compact: bool = False, sources: Optional[List[MergeSource]] = None, prior: Optional[PriorAnswer] = None) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of call_gemini_async: yields the raw response text
+    as the model produces it. Large logs still go through the map step and
+    only the final reduce call is streamed.
+    """
+    model = _user_model(user, model)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.ai_request_timeout_seconds
+    budget = settings.ai_chunk_token_budget
+    try:
+        file_size = blob_size(str(log_file_path))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read log file: {str(e)}")
+
+    with timed("ask", "pre_analysis"):
+        if sources:
+            summary = await asyncio.to_thread(merged_summary, sources)
+        else:
+            summary = await asyncio.to_thread(prompt_summary, str(log_file_path))
+    incremental = None
+    if prior is not None:
+        incremental = await _before_deadline(incremental_prompt(log_file_path, question, budget, line_numbers, prior, summary), deadline)
+    if incremental is not None:
+        prompt = incremental
+    elif compact:
+        prompt = await _before_deadline(compact_prompt(log_file_path, question, budget, line_numbers, summary), deadline)
+    elif sources or line_numbers is not None or file_size // CHARS_PER_TOKEN > budget:
+        async def prepare():
+            partials = await map_chunks(log_file_path, question, model, budget, line_numbers, sources, summary if prior is None else None)
+            if prior is not None:
+                partials.insert(0, (1, prior.lines, prior.sections))
+            return partials, await shrink_partials(question, partials, model, budget, summary, sources)
+
+        with timed("ask", "map_reduce"):
+            partials, shrunk = await _before_deadline(prepare(), deadline)
+        if _is_final(partials, shrunk, summary):
+            yield render_sections(shrunk[0][2])
+            return
+        prompt = build_reduce_prompt(question, shrunk, summary, sources)
+    else:
+        try:
+            with timed("ask", "read_log"):
+                log_text = await asyncio.to_thread(load_log_text, log_file_path)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to read log file: {str(e)}")
+        with timed("ask", "build_prompt"):
+            prompt = build_prompt(question, log_text, summary)
+
+    stream = generate_stream_async(model, prompt)
+    try:
+        while True:
+            try:
+                text = await _before_deadline(stream.__anext__(), deadline)
+            except StopAsyncIteration:
+                break
+            yield text
+    finally:
+        await stream.aclose()
+
+
+async def generate_stream_async(model, prompt: str) -> AsyncIterator[str]:
+    _record_prompt(prompt)
+    async with _model_slot():
+        try:
+            if hasattr(model, "generate_content_async"):
+                response = await model.generate_content_async(prompt, stream=True)
+                async for chunk in response:
+                    text = chunk.text if hasattr(chunk, "text") else ""
+                    if text:
+                        yield text
+            else:
+                response = await asyncio.to_thread(model.generate_content, prompt, stream=False)
+                yield response.text if hasattr(response, "text") else ""
+        except Exception as e:
+            MODEL_ERRORS.labels("api_error").inc()
+            raise HTTPException(status_code=500, detail=f"Gemini API request failed: {str(e)}")
 
-    return extract_sections(raw_text)
+
+async def _before_deadline(awaitable, deadline: float):
+    remaining = deadline - asyncio.get_running_loop().time()
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(0, remaining))
+    except asyncio.TimeoutError:
+        MODEL_ERRORS.labels("timeout").inc()
+        raise HTTPException(status_code=504, detail="Gemini analysis timed out")
+
+
+def iter_log_chunks(log_file_path: Path, token_budget: int, line_numbers: Optional[List[int]] = None) -> Iterator[Tuple[int, int, str]]:
+    """
+    Yields (first_line, last_line, text) chunks of the log, split on line
+    boundaries. Every line carries its global line number so that cited
+    supporting logs refer to the whole file rather than to the chunk.
+    """
+    max_chars = token_budget * CHARS_PER_TOKEN
+    lines = []
+    size = 0
+    first_line = last_line = 0
+
+    for line_no, line in iter_log_lines(log_file_path, line_numbers):
+        numbered = f"{line_no}: {line.rstrip()}"
+        if len(numbered) > max_chars:
+            numbered = numbered[:max_chars] + " …[truncated]"
+
+        if lines and size + len(numbered) + 1 > max_chars:
+            yield first_line, last_line, "\n".join(lines)
+            lines, size = [], 0
+
+        if not lines:
+            first_line = line_no
+        lines.append(numbered)
+        size += len(numbered) + 1
+        last_line = line_no
+
+    if lines:
+        yield first_line, last_line, "\n".join(lines)
+
+
+def iter_merged_chunks(sources: List[MergeSource], token_budget: int) -> Iterator[Tuple[int, int, str]]:
+    """
+    Like iter_log_chunks over the merged timeline of sources. Lines carry
+    their source's letter and own line number (B:120); first and last
+    count lines of the timeline.
+    """
+    max_chars = token_budget * CHARS_PER_TOKEN
+    lines = []
+    size = 0
+    first = position = 0
+
+    for position, (_, index, line_no, line) in enumerate(merged_lines(sources), start=1):
+        numbered = f"{sources[index].tag}:{line_no}: {line.rstrip()}"
+        if len(numbered) > max_chars:
+            numbered = numbered[:max_chars] + " …[truncated]"
+
+        if lines and size + len(numbered) + 1 > max_chars:
+            yield first, position - 1, "\n".join(lines)
+            lines, size = [], 0
+
+        if not lines:
+            first = position
+        lines.append(numbered)
+        size += len(numbered) + 1
+
+    if lines:
+        yield first, position, "\n".join(lines)
+
+
+def render_sections(sections: Dict[str, str]) -> str:
+    # Inverse of extract_sections, for replaying a stored answer as a response
+    return "\n".join(
+        f"{header} {key.replace('_', ' ').title()}\n{sections[key]}"
+        for header, key in SECTION_HEADERS
+    ) + "\n"
+
+
+def merge_sections(parts: List[Dict[str, str]]) -> Dict[str, str]:
+    # Fallback reduce when the model's merge response is unusable
+    return {
+        key: "\n".join(p[key] for p in parts if p[key]).strip()
+        for key in SECTION_KEYS
+    }
+
+
+def cited_line_numbers(supporting_logs: str) -> List[int]:
+    """
+    Line numbers cited in a Supporting Logs section: "Line 12", "Lines
+    10-14", or a line starting with a bare "12: " (the prefix the chunked
+    prompts number lines with). Ranges are capped so a loose
+    "Lines 1-100000" can't explode.
+    """
+    cited = set()
+    for m in CITATION.finditer(supporting_logs):
+        first = int(m.group(1) or m.group(3))
+        last = int(m.group(2)) if m.group(2) else first
+        for line_no in range(first, min(last, first + MAX_CITED_LINES) + 1):
+            cited.add(line_no)
+    return sorted(cited)[:MAX_CITED_LINES]
+
+
+def split_batch_answers(response_text: str, count: int) -> List[Dict[str, str]]:
+    """
+    Splits the response to a batch prompt into the sections of each of its
+    count answers, by the "### Question <n>" line opening each. Answers the
+    response doesn't have come back with every section empty.
+    """
+    answers = [dict.fromkeys(SECTION_KEYS, "") for _ in range(count)]
+    marks = list(BATCH_ANSWER.finditer(response_text))
+    if not marks and count == 1:
+        answers[0] = extract_sections(response_text)
+    for mark, following in zip(marks, marks[1:] + [None]):
+        index = int(mark.group(1)) - 1
+        if 0 <= index < count and not any(answers[index].values()):
+            answers[index] = extract_sections(response_text[mark.end():following.start() if following else None])
+    return answers
 
 
 def extract_sections(response_text: str) -> Dict[str, str]:
@@ -83,3 +1020,89 @@ def extract_sections(response_text: str) -> Dict[str, str]:
             sections[current_key] += striped_line + "\n"
 
     return {k: v.strip() for k, v in sections.items()}
+
+
+class SectionStreamParser:
+    """
+    Incremental version of extract_sections for streamed responses.
+    feed() takes text as it arrives and returns (section, text) pieces to
+    forward, holding back only the start of a line until it is clear
+    whether the line is a section header, so headers split across chunk
+    boundaries are still recognised. sections() gives the same result as
+    extract_sections on the full text.
+    """
+
+    MAX_HEADER_LEN = max(len(header) for header, _ in SECTION_HEADERS)
+
+    def __init__(self):
+        self.current_key = None
+        self._parts = {key: [] for key in SECTION_KEYS}
+        self._line = ""        # the whole current line, for the final sections
+        self._undecided = ""   # start of the line not yet forwarded
+        self._is_header = None  # None until the line start has been classified
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        events = []
+        while text:
+            newline = text.find("\n")
+            piece, text = (text, "") if newline < 0 else (text[:newline], text[newline + 1:])
+            self._consume(piece, events)
+            if newline >= 0:
+                self._end_line(events)
+        return events
+
+    def finish(self) -> List[Tuple[str, str]]:
+        events = []
+        if self._line or self._undecided:
+            self._end_line(events, trailing_newline=False)
+        return events
+
+    def sections(self) -> Dict[str, str]:
+        return {key: "".join(parts).strip() for key, parts in self._parts.items()}
+
+    def _consume(self, piece: str, events: List[Tuple[str, str]]) -> None:
+        self._line += piece
+        if self._is_header is None:
+            self._undecided += piece
+            self._classify()
+            if self._is_header is False:
+                self._emit(self._undecided, events)
+                self._undecided = ""
+        elif self._is_header is False:
+            self._emit(piece, events)
+
+    def _classify(self) -> None:
+        start = self._undecided.lstrip()
+        if not start:
+            return
+        for header, _ in SECTION_HEADERS:
+            if start.startswith(header):
+                self._is_header = True
+                return
+        # Still a possible prefix of a header: wait for more text
+        if len(start) < self.MAX_HEADER_LEN and any(h.startswith(start) for h, _ in SECTION_HEADERS):
+            return
+        self._is_header = False
+
+    def _end_line(self, events: List[Tuple[str, str]], trailing_newline: bool = True) -> None:
+        stripped = self._line.strip()
+        header_key = next((key for header, key in SECTION_HEADERS if stripped.startswith(header)), None)
+        if header_key:
+            self.current_key = header_key
+            events.append(("section", header_key))
+        else:
+            if self._is_header is None:
+                self._emit(self._undecided, events)
+            if self.current_key:
+                self._parts[self.current_key].append(stripped + "\n")
+            if trailing_newline:
+                self._emit("\n", events)
+
+        self._line = ""
+        self._undecided = ""
+        self._is_header = None
+
+    def _emit(self, text: str, events: List[Tuple[str, str]]) -> None:
+        # Text before the first header is ignored, as in extract_sections
+        if text and self.current_key:
+            events.append((self.current_key, text))
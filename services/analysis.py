@@ -0,0 +1,300 @@
+import json
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from models.log import Log
+from models.log_blob import LogBlob
+from models.conversation import Conversation
+from models.user import User
+from services.blob_store import require_parsed
+from services.log_indexer import INDEX_FIELDS, search_lines
+from services.answer_cache import cache_key, get_cached_answer, record_bypass, normalise_question
+from services.ai_handler import PriorAnswer, cited_line_numbers
+from services.line_index import read_cited_lines
+from services.record_store import structured_lines
+from services.question_stats import count_questions
+from services.log_merge import MAX_MERGED_LOGS, MergeSource, source_tags, cited_source_lines
+
+class Progress(NamedTuple):
+    # How much of a log an answer covers (lines 1..lines, size_bytes bytes),
+    # recorded with its conversation, and for an incremental ask the
+    # earlier answer it builds on
+    lines: int
+    size_bytes: Optional[int]
+    prior: Optional[PriorAnswer] = None
+
+
+# Everything /ask needs once the request is validated
+AnalysisTarget = Tuple[Log, Path, Optional[List[int]], Optional[str], Optional[List[MergeSource]], Optional[Progress]]
+
+# /ask/batch: the same for several questions, with a cache key per question
+BatchTarget = Tuple[Log, Path, Optional[List[int]], List[Optional[str]], Optional[Progress]]
+
+# Most questions one /ask/batch request may carry
+MAX_BATCH_QUESTIONS = 20
+
+
+def prepare_analysis(db: Session, user: User, log_id: str, question: str, filters: Optional[dict], compact: bool = False, log_ids: Optional[List[str]] = None, incremental: bool = False) -> AnalysisTarget:
+    """
+    Shared validation for every way of asking a question (sync, streamed,
+    queued). Returns the log, its path, the index-matched line numbers if
+    filters were given, the answer cache key, the sources to merge if
+    log_ids names further logs (None otherwise), and how much of the log
+    the answer will cover (None for filtered, compact and merged answers).
+    With incremental, an earlier answer to the same question is built on:
+    the line numbers are then those added since, and there is no cache key,
+    as the answer depends on the earlier one.
+    """
+    log = db.query(Log).filter(Log.id == log_id, Log.user_id == user.id).first()
+    if not log:
+        raise HTTPException(status_code=404, detail="Log not found or not authorized")
+
+    if not user.gemini_api_key:
+        raise HTTPException(status_code=403, detail="Gemini API key not set for this user")
+
+    log_path = Path(log.file_path)
+    if not log_path.exists():
+        raise HTTPException(status_code=404, detail="Log file not found on disk")
+
+    ids = merged_log_ids(log_id, log_ids)
+    if len(ids) > 1:
+        if compact:
+            raise HTTPException(status_code=400, detail="compact is not supported when asking about several logs")
+        if incremental:
+            raise HTTPException(status_code=400, detail="incremental is not supported when asking about several logs")
+        sources = merge_sources(db, user.id, ids, filters)
+        if filters and not any(s.line_numbers for s in sources):
+            raise HTTPException(status_code=404, detail="No log lines match the given filters")
+        # The merged content is identified by every blob, in letter order
+        hashes = content_hashes(db, ids)
+        key = cache_key(",".join(hashes[i] for i in ids), question, filters)
+        return log, log_path, None, key, sources, None
+
+    if incremental and (filters or compact):
+        raise HTTPException(status_code=400, detail="incremental can't be combined with filters or compact")
+
+    # Scope the prompt to the lines matching the index filters, if any
+    line_numbers = None
+    if filters:
+        line_numbers = search_index(db, log, filters)
+        if not line_numbers:
+            raise HTTPException(status_code=404, detail="No log lines match the given filters")
+
+    # Identical content, question, model and prompt give the same answer
+    key = cache_key(content_hashes(db, [log.id])[log.id], question, filters, compact) if log.file_hash else None
+
+    # Taken now: lines appended while the model works are left to the next
+    # ask. Compact answers cover the log only in part, so none is recorded
+    # for them, and incremental asks never build on one
+    progress = Progress(log.line_count, log.size_bytes) if not filters and not compact and log.line_count is not None else None
+    if incremental and progress:
+        prior = prior_answer(db, user.id, log.id, question)
+        if prior:
+            progress = progress._replace(prior=prior)
+            line_numbers = range(prior.lines + 1, progress.lines + 1)
+            key = None
+
+    return log, log_path, line_numbers, key, None, progress
+
+
+def prepare_batch(db: Session, user: User, log_id: str, questions: List[str], filters: Optional[dict], compact: bool = False) -> BatchTarget:
+    """
+    prepare_analysis for several questions about one log: the log is
+    checked and filters are searched once, and each question gets its own
+    answer cache key.
+    """
+    if not questions:
+        raise HTTPException(status_code=400, detail="At least one question is required")
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUESTIONS} questions can be asked at once")
+    if not all(q.strip() for q in questions):
+        raise HTTPException(status_code=400, detail="Questions can't be empty")
+
+    log, log_path, line_numbers, key, _, progress = prepare_analysis(db, user, log_id, questions[0], filters, compact)
+    keys = [key]
+    if key:
+        content = content_hashes(db, [log.id])[log.id]
+        keys += [cache_key(content, q, filters, compact) for q in questions[1:]]
+    else:
+        keys += [None] * (len(questions) - 1)
+    return log, log_path, line_numbers, keys, progress
+
+
+def prior_answer(db: Session, user_id: str, log_id: str, question: str) -> Optional[PriorAnswer]:
+    """
+    The user's answer to the same question (as normalised for the answer
+    cache) about this log that covers the most of it; None if there is
+    none with a recorded watermark.
+    """
+    wanted = normalise_question(question)
+    convos = (db.query(Conversation)
+              .filter(Conversation.log_id == log_id, Conversation.user_id == user_id,
+                      Conversation.analysed_lines.isnot(None))
+              .order_by(Conversation.analysed_lines.desc(), Conversation.created_at.desc()))
+    for convo in convos:
+        if normalise_question(convo.question) == wanted:
+            return PriorAnswer(convo.analysed_lines, answer_sections(convo))
+    return None
+
+
+def content_hashes(db: Session, log_ids: List[str]) -> Dict[str, str]:
+    """
+    What identifies each log's current content: its blob's address, or for
+    a log being appended to (whose blob keeps its id) the chained digest.
+    """
+    rows = (db.query(Log.id, Log.file_hash, LogBlob.content_hash)
+            .outerjoin(LogBlob, LogBlob.sha256 == Log.file_hash)
+            .filter(Log.id.in_(log_ids)))
+    return {log_id: content_hash or file_hash for log_id, file_hash, content_hash in rows}
+
+
+def merged_log_ids(log_id: str, log_ids: Optional[List[str]]) -> List[str]:
+    """log_id followed by the other ids in log_ids, without duplicates; the order sets the letters."""
+    return list(dict.fromkeys([log_id, *(log_ids or [])]))
+
+
+def merge_sources(db: Session, user_id: str, log_ids: List[str], filters: Optional[dict] = None) -> List[MergeSource]:
+    """
+    The user's logs to merge into one timeline, lettered in the given
+    order. Every log must be parsed, since the merge orders lines by the
+    timestamps parsed at upload. With filters, each log contributes only
+    its index-matched lines.
+    """
+    if len(log_ids) > MAX_MERGED_LOGS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_MERGED_LOGS} logs can be merged")
+
+    logs = {log.id: log for log in db.query(Log).filter(Log.id.in_(log_ids), Log.user_id == user_id)}
+    sources = []
+    for tag, log_id in zip(source_tags(len(log_ids)), log_ids):
+        log = logs.get(log_id)
+        if not log:
+            raise HTTPException(status_code=404, detail=f"Log {log_id} not found or not authorized")
+        blob = db.query(LogBlob).filter(LogBlob.sha256 == log.file_hash).first() if log.file_hash else None
+        if not blob:
+            raise HTTPException(status_code=409, detail=f"Log {log_id} was uploaded before parsing was available")
+        require_parsed(blob, f"Log {log_id}")
+
+        line_numbers = search_index(db, log, filters) if filters else None
+        sources.append(MergeSource(tag, log.id, log.type, log.file_path, line_numbers))
+    return sources
+
+
+def search_index(db: Session, log: Log, filters: dict) -> List[int]:
+    unknown = set(filters) - set(INDEX_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown search fields: {', '.join(sorted(unknown))}")
+    if not any(filters.values()):
+        raise HTTPException(status_code=400, detail="At least one search field is required")
+
+    blob = db.query(LogBlob).filter(LogBlob.sha256 == log.file_hash).first() if log.file_hash else None
+    if not blob:
+        raise HTTPException(status_code=409, detail="Log was uploaded before indexing was available")
+    if blob.parse_error is not None:
+        require_parsed(blob)
+    if blob.indexed_at is None:
+        raise HTTPException(status_code=409, detail="Log index is still being built, try again shortly")
+
+    return search_lines(db, blob.sha256, filters)
+
+
+def lookup_cached(db: Session, key: Optional[str], use_cache: bool, progress: Optional[Progress] = None) -> Optional[Dict[str, str]]:
+    if progress and progress.prior and progress.prior.lines >= progress.lines:
+        return progress.prior.sections  # nothing was appended since the earlier answer
+    if key and use_cache:
+        return get_cached_answer(db, key)
+    if key:
+        record_bypass()
+    return None
+
+
+def save_conversation(db: Session, user_id: str, log_id: str, question: str, result: Dict[str, str], sources: Optional[List[MergeSource]] = None, progress: Optional[Progress] = None) -> str:
+    convo = Conversation(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        log_id=log_id,
+        log_ids=json.dumps([s.log_id for s in sources]) if sources else None,
+        question=question,
+        answer_insights=result["insights"],
+        answer_reasoning=result["reasoning"],
+        answer_supporting_logs=result["supporting_logs"],
+        answer_fixes=result["fixes"],
+        analysed_lines=progress.lines if progress else None,
+        analysed_bytes=progress.size_bytes if progress else None,
+        created_at=datetime.utcnow()
+    )
+    db.add(convo)
+    count_questions(db, user_id, convo.created_at)
+    db.commit()
+    return convo.id
+
+
+def citation_sources(db: Session, log_ids: List[str]) -> List[MergeSource]:
+    """
+    Sources to resolve a stored merged answer's citations against, lettered
+    as when it was asked; logs deleted since are left out.
+    """
+    logs = {log.id: log for log in db.query(Log).filter(Log.id.in_(log_ids))}
+    return [
+        MergeSource(tag, log_id, logs[log_id].type, logs[log_id].file_path)
+        for tag, log_id in zip(source_tags(len(log_ids)), log_ids) if log_id in logs
+    ]
+
+
+def answer_sections(convo: Conversation) -> Dict[str, str]:
+    return {
+        "insights": convo.answer_insights or "",
+        "reasoning": convo.answer_reasoning or "",
+        "supporting_logs": convo.answer_supporting_logs or "",
+        "fixes": convo.answer_fixes or ""
+    }
+
+
+def resolve_citations(log_path: Path, result: Dict[str, str], sources: Optional[List[MergeSource]] = None) -> dict:
+    """
+    Checks the line numbers cited in an answer's Supporting Logs against
+    the log and returns the exact cited lines, plus any numbers that don't
+    exist in the file. Structured logs show the parsed record for a line.
+    Answers about merged sources cite lines as B:120 and are checked
+    against each log.
+    """
+    if sources is not None:
+        return _resolve_source_citations(sources, result)
+
+    cited = cited_line_numbers(result.get("supporting_logs") or "")
+    if not cited:
+        return {"cited_lines": [], "invalid_citations": []}
+
+    found, invalid = _read_cited(str(log_path), cited)
+    return {
+        "cited_lines": [{"line": n, "text": text} for n, text in found],
+        "invalid_citations": invalid
+    }
+
+
+def _resolve_source_citations(sources: List[MergeSource], result: Dict[str, str]) -> dict:
+    by_tag = {source.tag: source for source in sources}
+    cited_lines, invalid = [], []
+    for tag, cited in cited_source_lines(result.get("supporting_logs") or "").items():
+        source = by_tag.get(tag)
+        if source is None:
+            invalid.extend(f"{tag}:{n}" for n in cited)
+            continue
+        found, missing = _read_cited(source.path, cited)
+        cited_lines.extend({"line": n, "text": text, "log_id": source.log_id} for n, text in found)
+        invalid.extend(f"{tag}:{n}" for n in missing)
+    return {
+        "cited_lines": cited_lines,
+        "invalid_citations": [],
+        "invalid_source_citations": invalid,
+        "sources": {source.tag: source.log_id for source in sources}
+    }
+
+
+def _read_cited(log_path: str, cited: List[int]) -> Tuple[List[Tuple[int, str]], List[int]]:
+    found, invalid = read_cited_lines(log_path, cited)
+    records = structured_lines(log_path, [n for n, _ in found])
+    rendered = dict(records) if records is not None else {}
+    return [(n, rendered.get(n, text)) for n, text in found], invalid
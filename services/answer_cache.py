@@ -0,0 +1,159 @@
+import re
+import json
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from core.cache import TTLCache
+from core.config import settings
+from core.metrics import Counter
+from models.answer_cache import CachedAnswer
+from services.ai_handler import PROMPT_VERSION
+
+# In-process tier; the DB tier below it survives restarts and is shared by workers
+_memory = TTLCache(settings.answer_cache_memory_entries, settings.answer_cache_ttl_seconds)
+
+_stats_lock = threading.Lock()
+_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "bypassed": 0, "latency_saved_ms": 0}
+
+LOOKUPS = Counter("septer_answer_cache_lookups_total", "Answer cache lookups by outcome", ("result",))
+SAVED_SECONDS = Counter("septer_answer_cache_saved_seconds_total", "Model time saved by answer cache hits")
+RESULTS = {"memory_hits": "memory_hit", "db_hits": "db_hit", "misses": "miss", "bypassed": "bypass"}
+
+# Eviction counts the whole table, so it runs once per this many stores in
+# each worker rather than on every one; the table can run over
+# answer_cache_max_rows by about this many rows per worker in between
+EVICT_EVERY_STORES = 100
+_stores_lock = threading.Lock()
+_stores_since_eviction = 0
+
+
+def normalise_question(question: str) -> str:
+    # "Any brute force?" and "any  brute force" should share an entry
+    text = re.sub(r"\s+", " ", question.strip().lower())
+    return text.rstrip("?.! ")
+
+
+def cache_key(blob_hash: str, question: str, filters: Optional[dict] = None, compact: bool = False) -> str:
+    material = {
+        "blob": blob_hash,
+        "question": normalise_question(question),
+        "filters": {k: sorted(v) for k, v in sorted((filters or {}).items()) if v},
+        "model": settings.gemini_model,
+        "prompt_version": PROMPT_VERSION,
+    }
+    # Only present when set, so keys for full-log answers are unchanged
+    if compact:
+        material["compact"] = True
+    material = json.dumps(material, sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def get_cached_answer(db: Session, key: str) -> Optional[Dict[str, str]]:
+    entry = _memory.get(key)
+    if entry is not None:
+        _record("memory_hits", entry["compute_ms"])
+        return entry["answer"]
+
+    row = db.query(CachedAnswer).filter(CachedAnswer.key == key).first()
+    ttl = timedelta(seconds=settings.answer_cache_ttl_seconds)
+    if not row or row.created_at < datetime.utcnow() - ttl:
+        _record("misses")
+        return None
+
+    row.hits += 1
+    row.last_hit_at = datetime.utcnow()
+    db.commit()
+
+    answer = {
+        "insights": row.answer_insights or "",
+        "reasoning": row.answer_reasoning or "",
+        "supporting_logs": row.answer_supporting_logs or "",
+        "fixes": row.answer_fixes or "",
+    }
+    _memory.set(key, {"answer": answer, "compute_ms": row.compute_ms})
+    _record("db_hits", row.compute_ms)
+    return answer
+
+
+def store_answer(db: Session, key: str, blob_hash: str, question: str, answer: Dict[str, str], compute_ms: int) -> None:
+    now = datetime.utcnow()
+    values = {
+        "question": normalise_question(question),
+        "model": settings.gemini_model,
+        "prompt_version": PROMPT_VERSION,
+        "answer_insights": answer["insights"],
+        "answer_reasoning": answer["reasoning"],
+        "answer_supporting_logs": answer["supporting_logs"],
+        "answer_fixes": answer["fixes"],
+        "compute_ms": compute_ms,
+        "created_at": now,
+        "last_hit_at": now,
+    }
+    query = db.query(CachedAnswer).filter(CachedAnswer.key == key)
+    if not query.update(values, synchronize_session=False):
+        try:
+            with db.begin_nested():
+                db.add(CachedAnswer(key=key, blob_hash=blob_hash, hits=0, **values))
+        except IntegrityError:
+            # The same question was answered and stored concurrently
+            query.update(values, synchronize_session=False)
+    db.commit()
+
+    _memory.set(key, {"answer": dict(answer), "compute_ms": compute_ms})
+    if _eviction_due():
+        evict_answers(db)
+
+
+def evict_answers(db: Session) -> int:
+    """Drops expired rows, then the least recently hit rows beyond answer_cache_max_rows."""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.answer_cache_ttl_seconds)
+    removed = db.query(CachedAnswer).filter(CachedAnswer.created_at < cutoff).delete(synchronize_session=False)
+
+    overflow = db.query(CachedAnswer).count() - settings.answer_cache_max_rows
+    if overflow > 0:
+        oldest = (
+            select(CachedAnswer.key)
+            .order_by(CachedAnswer.last_hit_at.asc())
+            .limit(overflow)
+        )
+        removed += db.query(CachedAnswer).filter(CachedAnswer.key.in_(oldest)).delete(synchronize_session=False)
+
+    db.commit()
+    return removed
+
+
+def _eviction_due() -> bool:
+    global _stores_since_eviction
+    with _stores_lock:
+        _stores_since_eviction += 1
+        if _stores_since_eviction < EVICT_EVERY_STORES:
+            return False
+        _stores_since_eviction = 0
+        return True
+
+
+def record_bypass() -> None:
+    _record("bypassed")
+
+
+def cache_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    hits = stats["memory_hits"] + stats["db_hits"]
+    lookups = hits + stats["misses"]
+    stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+    stats["memory_entries"] = len(_memory)
+    return stats
+
+
+def _record(counter: str, saved_ms: int = 0) -> None:
+    with _stats_lock:
+        _stats[counter] += 1
+        _stats["latency_saved_ms"] += saved_ms
+    LOOKUPS.labels(RESULTS[counter]).inc()
+    if saved_ms:
+        SAVED_SECONDS.inc(saved_ms / 1000)
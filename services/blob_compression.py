@@ -0,0 +1,286 @@
+"""
+Compressed blobs. Logs uploaded gzip- or zstd-compressed are stored
+compressed, as independently compressed blocks of BLOCK_BYTES each (like
+BGZF), so the stored file is still a valid .gz / .zst for standard tools
+and a small block index next to it (see blob_path) lets LineIndex fetch
+any line by decompressing a single block.
+
+Readers go through open_blob / open_blob_text, which decompress on the
+fly; plain blobs are read as before.
+"""
+import io
+import os
+import sys
+import gzip
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import BinaryIO, Optional, TextIO, Tuple
+from core.files import atomic_write
+
+try:
+    import zstandard
+except ImportError:  # zstd uploads are refused without it
+    zstandard = None
+
+# Decompressed start and stored start of every block, as little-endian
+# uint64 pairs, ending with the totals; stored next to the blob
+BLOCKS_SUFFIX = ".blocks"
+
+BLOCK_BYTES = 256 * 1024
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Decompressed blocks kept per reader, so neighbouring lines don't decompress again
+CACHED_BLOCKS = 4
+
+READ_CHUNK_BYTES = 1 << 20
+
+# Compressed bytes decompressed per step when reading an upload
+ZSTD_FEED_BYTES = 256
+
+# Raised reading corrupt or truncated compressed data
+COMPRESSED_ERRORS = (gzip.BadGzipFile, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+def detect_compression(head: bytes) -> Optional[str]:
+    """"gzip" or "zstd" from a file's first bytes, or None for plain content."""
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def blob_compression(path: str) -> Optional[str]:
+    with open(path, "rb") as f:
+        return detect_compression(f.read(4))
+
+
+def blocks_path(blob_file_path: str) -> str:
+    return blob_file_path + BLOCKS_SUFFIX
+
+
+def open_blob(path: str) -> BinaryIO:
+    """The blob's content as a binary stream, decompressed on the fly if it is stored compressed."""
+    kind = blob_compression(path)
+    if kind == "gzip":
+        return gzip.open(path, "rb")
+    if kind == "zstd":
+        _require_zstd()
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+        return io.BufferedReader(reader, READ_CHUNK_BYTES)
+    return open(path, "rb")
+
+
+def open_blob_text(path: str, errors: str = "strict") -> TextIO:
+    """Like open(path, "r", encoding="utf-8"), decompressing on the fly."""
+    if blob_compression(path) is None:
+        return open(path, "r", encoding="utf-8", errors=errors)
+    return io.TextIOWrapper(open_blob(path), encoding="utf-8", errors=errors)
+
+
+def blob_size(path: str) -> int:
+    """Decompressed size of a blob in bytes."""
+    if blob_compression(path) is None:
+        return os.path.getsize(path)
+    return int(_load_index(path)[0][-1])
+
+
+def compress_block(data: bytes, kind: str) -> bytes:
+    if kind == "gzip":
+        return gzip.compress(data, GZIP_LEVEL, mtime=0)
+    _require_zstd()
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+def decompress_block(data: bytes, kind: str) -> bytes:
+    if kind == "gzip":
+        return gzip.decompress(data)
+    _require_zstd()
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def decompressing_reader(raw: BinaryIO, kind: str) -> BinaryIO:
+    """
+    Decompressed view of an untrusted compressed stream (every gzip member /
+    zstd frame). Truncated input raises EOFError once reached.
+    """
+    if kind == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    _require_zstd()
+    return _ZstdFrames(raw)
+
+
+def zstd_available() -> bool:
+    return zstandard is not None
+
+
+def _require_zstd() -> None:
+    if zstandard is None:
+        raise RuntimeError("zstd support requires the zstandard package")
+
+
+class _ZstdFrames:
+    """
+    Reads every frame of a zstd stream. Unlike stream_reader it notices a
+    stream cut off mid-frame, and input is fed in small slices so one read
+    can't expand into more than about 8 MB (the format's worst case).
+    """
+
+    def __init__(self, raw: BinaryIO):
+        self.raw = raw
+        self._frame = None
+        self._unused = b""
+        self._buffer = bytearray()
+        self._eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            data = self._unused or self.raw.read(ZSTD_FEED_BYTES)
+            self._unused = b""
+            if not data:
+                if self._frame is not None:
+                    raise EOFError("zstd stream ends mid-frame")
+                self._eof = True
+                break
+            if self._frame is None:
+                self._frame = zstandard.ZstdDecompressor().decompressobj()
+            self._buffer += self._frame.decompress(data)
+            if self._frame.eof:
+                self._unused = self._frame.unused_data
+                self._frame = None
+        size = len(self._buffer) if size < 0 else size
+        out = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return out
+
+
+class BlockWriter:
+    """Compresses bytes written to it in blocks of BLOCK_BYTES, recording where each block starts."""
+
+    def __init__(self, out: BinaryIO, kind: str):
+        self.out = out
+        self.kind = kind
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.offsets = array("Q", [0, 0])
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        while len(self._buffer) >= BLOCK_BYTES:
+            self._flush(BLOCK_BYTES)
+
+    def close(self) -> None:
+        if self._buffer:
+            self._flush(len(self._buffer))
+
+    def write_index(self, path: str) -> None:
+        write_block_index(path, self.offsets)
+
+    def _flush(self, size: int) -> None:
+        block = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        stored = compress_block(block, self.kind)
+        self.out.write(stored)
+        self.raw_bytes += size
+        self.stored_bytes += len(stored)
+        self.offsets.extend((self.raw_bytes, self.stored_bytes))
+
+
+def write_block_index(path: str, offsets: array) -> None:
+    offsets = array("Q", offsets)
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    atomic_write(path, offsets)
+
+
+def build_block_index(blob_file_path: str) -> None:
+    """
+    Finds the blocks (gzip members / zstd frames) of a compressed blob
+    stored without an index. Files compressed elsewhere may be one block.
+    """
+    kind = blob_compression(blob_file_path)
+    offsets = array("Q", [0, 0])
+    raw = stored = 0
+    with open(blob_file_path, "rb") as f:
+        data = b""
+        while True:
+            if not data:
+                data = f.read(READ_CHUNK_BYTES)
+                if not data:
+                    break
+            decompressor = zlib.decompressobj(31) if kind == "gzip" else zstandard.ZstdDecompressor().decompressobj()
+            while True:
+                raw += len(decompressor.decompress(data))
+                if decompressor.eof:
+                    used = len(data) - len(decompressor.unused_data)
+                    stored += used
+                    data = decompressor.unused_data
+                    break
+                stored += len(data)
+                data = f.read(READ_CHUNK_BYTES)
+                if not data:
+                    raise EOFError("Compressed blob ends mid-block")
+            offsets.extend((raw, stored))
+    write_block_index(blocks_path(blob_file_path), offsets)
+
+
+def _load_index(blob_file_path: str) -> Tuple[array, array]:
+    path = blocks_path(blob_file_path)
+    if not os.path.exists(path):
+        build_block_index(blob_file_path)
+    offsets = array("Q")
+    with open(path, "rb") as f:
+        offsets.frombytes(f.read())
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    return offsets[0::2], offsets[1::2]
+
+
+class BlockReader:
+    """
+    Random access to a compressed blob's content: reader[begin:end]
+    decompresses only the blocks the range touches.
+    """
+
+    def __init__(self, blob_file_path: str):
+        self.kind = blob_compression(blob_file_path)
+        self._raw, self._stored = _load_index(blob_file_path)
+        self._file = open(blob_file_path, "rb")
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return int(self._raw[-1])
+
+    def __getitem__(self, key: slice) -> bytes:
+        begin, end = key.start or 0, len(self) if key.stop is None else key.stop
+        parts = []
+        block = bisect_right(self._raw, begin) - 1
+        while 0 <= block < len(self._raw) - 1 and self._raw[block] < end:
+            start = self._raw[block]
+            parts.append(self._block(block)[max(begin - start, 0):end - start])
+            block += 1
+        return b"".join(parts)
+
+    def close(self) -> None:
+        self._file.close()
+        self._cache.clear()
+
+    def _block(self, i: int) -> bytes:
+        data = self._cache.get(i)
+        if data is not None:
+            self._cache.move_to_end(i)
+            return data
+        self._file.seek(self._stored[i])
+        data = decompress_block(self._file.read(self._stored[i + 1] - self._stored[i]), self.kind)
+        self._cache[i] = data
+        if len(self._cache) > CACHED_BLOCKS:
+            self._cache.popitem(last=False)
+        return data
@@ -0,0 +1,159 @@
+import os
+import glob
+import time
+import fcntl
+from contextlib import contextmanager
+from typing import Iterator
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from models.log_blob import LogBlob
+from models.log_index import LogIndexTerm
+from models.answer_cache import CachedAnswer
+from services.file_upload import UPLOAD_DIR
+from services.blob_compression import blocks_path
+
+BLOB_DIR = os.path.join(UPLOAD_DIR, "blobs")
+os.makedirs(BLOB_DIR, exist_ok=True)
+
+# Temp files older than this are leftovers from crashed uploads
+STALE_UPLOAD_SECONDS = 24 * 60 * 60
+
+# Uploads hold this shared while they place a blob and reference it, and
+# collect_garbage exclusively while it deletes one, so an upload can't put
+# a file back between the row's deletion and the unlink
+GC_LOCK_PATH = os.path.join(BLOB_DIR, "gc.lock")
+
+
+def blob_path(sha256: str, suffix: str = "") -> str:
+    """
+    Location of a blob (or of data derived from it, via suffix) on disk.
+    Derived files share the blob's prefix so they can be shared across
+    every Log pointing at the same content and are removed with it.
+    """
+    return os.path.join(BLOB_DIR, sha256[:2], sha256 + suffix)
+
+
+@contextmanager
+def gc_lock(exclusive: bool) -> Iterator[None]:
+    with open(GC_LOCK_PATH, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def store_blob(db: Session, saved: dict) -> LogBlob:
+    """
+    Moves a streamed upload (see save_uploaded_file) into the content-addressed
+    store, with its block index if it is compressed, and takes a reference on it. If the same content is already stored,
+    the temp file is dropped and only the reference count changes.
+    The caller commits together with the Log row that holds the reference.
+    """
+    with gc_lock(exclusive=False):
+        return _store_blob(db, saved)
+
+
+def _store_blob(db: Session, saved: dict) -> LogBlob:
+    sha256 = saved["sha256"]
+    blob = db.query(LogBlob).filter(LogBlob.sha256 == sha256).first()
+
+    # Take the reference before dropping the upload so a concurrent
+    # collect_garbage can't delete the blob out from under us
+    if blob and os.path.exists(blob.file_path) and _add_ref(db, sha256, 1):
+        os.remove(saved["tmp_path"])
+        if saved.get("blocks_tmp_path"):
+            os.remove(saved["blocks_tmp_path"])
+        return blob
+
+    path = blob_path(sha256)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Block index first, so the blob is never there compressed without it
+    if saved.get("blocks_tmp_path"):
+        os.replace(saved["blocks_tmp_path"], blocks_path(path))
+    os.replace(saved["tmp_path"], path)
+
+    if blob and _add_ref(db, sha256, 1):
+        # Row survived but the file went missing; the new upload restores it
+        blob.file_path = path
+        return blob
+
+    blob = LogBlob(
+        sha256=sha256,
+        file_path=path,
+        size_bytes=saved["size_bytes"],
+        line_count=saved["line_count"],
+        ref_count=1
+    )
+    try:
+        with db.begin_nested():
+            db.add(blob)
+    except IntegrityError:
+        # A concurrent upload of the same content inserted the row first
+        _add_ref(db, sha256, 1)
+        blob = db.query(LogBlob).filter(LogBlob.sha256 == sha256).first()
+    return blob
+
+
+def require_parsed(blob: LogBlob, name: str = "Log") -> None:
+    """Raises unless the blob's records are ready: 422 if parsing it failed, 409 while it is being parsed."""
+    if blob.parse_error is not None:
+        raise HTTPException(status_code=422, detail=f"{name} could not be parsed ({blob.parse_error}); upload it again to retry")
+    if blob.parsed_at is None:
+        raise HTTPException(status_code=409, detail=f"{name} is still being parsed, try again shortly")
+
+
+def release_blob(db: Session, sha256: str) -> None:
+    """Drops one reference; unreferenced blobs are removed by collect_garbage."""
+    _add_ref(db, sha256, -1)
+
+
+def collect_garbage(db: Session) -> int:
+    """
+    Deletes blobs that no Log references any more, along with their derived
+    files, and clears temp files left behind by interrupted uploads.
+    Returns the number of blobs removed.
+    """
+    removed = 0
+    candidates = [sha for (sha,) in db.query(LogBlob.sha256).filter(LogBlob.ref_count <= 0).all()]
+    for sha256 in candidates:
+        if _remove_blob(db, sha256):
+            removed += 1
+
+    cutoff = time.time() - STALE_UPLOAD_SECONDS
+    for path in glob.glob(os.path.join(UPLOAD_DIR, "*.part")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            pass  # an upload in progress just moved it into the store
+
+    return removed
+
+
+def _remove_blob(db: Session, sha256: str) -> bool:
+    with gc_lock(exclusive=True):
+        db.query(LogIndexTerm).filter(LogIndexTerm.blob_hash == sha256).delete(synchronize_session=False)
+        db.query(CachedAnswer).filter(CachedAnswer.blob_hash == sha256).delete(synchronize_session=False)
+        # Re-check the count in the DELETE itself in case an upload just re-referenced it
+        deleted = db.query(LogBlob).filter(
+            LogBlob.sha256 == sha256, LogBlob.ref_count <= 0
+        ).delete(synchronize_session=False)
+        if not deleted:
+            db.rollback()
+            return False
+        db.commit()
+        for path in glob.glob(blob_path(sha256, "*")):
+            os.remove(path)
+        return True
+
+
+def _add_ref(db: Session, sha256: str, delta: int) -> bool:
+    # Single UPDATE so concurrent requests can't lose an increment;
+    # returns False if the blob row no longer exists
+    updated = db.query(LogBlob).filter(LogBlob.sha256 == sha256).update(
+        {LogBlob.ref_count: LogBlob.ref_count + delta},
+        synchronize_session=False
+    )
+    return updated > 0
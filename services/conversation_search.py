@@ -0,0 +1,197 @@
+import re
+from typing import Dict, List, Optional
+from sqlalchemy import and_, or_, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from models.conversation import Conversation
+
+# Full-text index over the question and answer of every conversation. On
+# SQLite it is an FTS5 table reading its text from the conversations table
+# (external content), kept in sync by triggers, so every write path
+# (save_conversation, delete_log, bulk loads) updates it. Rows are keyed by
+# conversations.search_rowid, which the insert trigger assigns: the table's
+# implicit rowid isn't stable, as it has no INTEGER PRIMARY KEY
+FTS_TABLE = "conversations_fts"
+FTS_COLUMNS = ["question", "answer_insights", "answer_reasoning", "answer_supporting_logs", "answer_fixes"]
+
+# The owner is indexed too (last, so snippets never pick it), which makes a
+# per-user search a merge of two term lists instead of a row lookup per match
+INDEXED_COLUMNS = FTS_COLUMNS + ["user_id"]
+
+# bm25 weight per column: the question says most about what a conversation was about
+COLUMN_WEIGHTS = [3.0, 1.0, 1.0, 1.0, 1.0, 0.0]
+
+SNIPPET_TOKENS = 16
+MAX_QUERY_TERMS = 16
+
+# Words, IPs, paths, hashes; a trailing * makes a term a prefix match
+TERM = re.compile(r"[\w.:/\\@-]+\*?")
+
+_cols = ", ".join(INDEXED_COLUMNS)
+_new = ", ".join(f"new.{c}" for c in INDEXED_COLUMNS)
+_old = ", ".join(f"old.{c}" for c in INDEXED_COLUMNS)
+
+# Marks the index as keyed by search_rowid; older ones used the implicit rowid
+CONTENT_ROWID = "search_rowid"
+
+SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {_cols}, content='conversations', content_rowid='{CONTENT_ROWID}', tokenize='porter unicode61'
+    )""",
+    # Numbering the row is an UPDATE, which indexes it (the _numbered trigger)
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON conversations
+    WHEN new.search_rowid IS NULL BEGIN
+        UPDATE conversations SET search_rowid = (SELECT COALESCE(MAX(search_rowid), 0) + 1 FROM conversations)
+        WHERE rowid = new.rowid;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert_numbered AFTER INSERT ON conversations
+    WHEN new.search_rowid IS NOT NULL BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.search_rowid, {_new});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_numbered AFTER UPDATE ON conversations
+    WHEN old.search_rowid IS NULL AND new.search_rowid IS NOT NULL BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.search_rowid, {_new});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON conversations
+    WHEN old.search_rowid IS NOT NULL BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.search_rowid, {_old});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE ON conversations
+    WHEN old.search_rowid IS NOT NULL BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.search_rowid, {_old});
+        INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.search_rowid, {_new});
+    END""",
+]
+
+TRIGGERS = ["insert", "insert_numbered", "numbered", "delete", "update"]
+
+# Only the newest MAX_RANKED matches are scored, so a term that appears in
+# most of the history costs the same as a rare one. Snippets are only built
+# for the page being returned
+MAX_RANKED = 5000
+
+SEARCH = f"""
+    WITH recent AS (
+        SELECT {FTS_TABLE}.rowid AS rowid, bm25({FTS_TABLE}, {', '.join(str(w) for w in COLUMN_WEIGHTS)}) AS score
+        FROM {FTS_TABLE}
+        WHERE {FTS_TABLE} MATCH :query
+        ORDER BY {FTS_TABLE}.rowid DESC
+        LIMIT {MAX_RANKED}
+    ),
+    page AS (SELECT rowid, score FROM recent ORDER BY score LIMIT :limit OFFSET :offset)
+    SELECT c.id, snippet({FTS_TABLE}, -1, '[', ']', '…', {SNIPPET_TOKENS}) AS snippet, page.score
+    FROM page
+    CROSS JOIN {FTS_TABLE} ON {FTS_TABLE}.rowid = page.rowid
+    CROSS JOIN conversations c ON c.search_rowid = page.rowid
+    WHERE {FTS_TABLE} MATCH :query
+    ORDER BY page.score
+"""
+
+
+# Whether each database's SQLite has FTS5, by URL; probed once
+_fts5: Dict[str, bool] = {}
+
+
+def full_text_available(bind) -> bool:
+    if bind.dialect.name != "sqlite":
+        return False
+    engine = getattr(bind, "engine", bind)
+    url = str(engine.url)
+    if url not in _fts5:
+        _fts5[url] = _has_fts5(engine)
+    return _fts5[url]
+
+
+def _has_fts5(engine: Engine) -> bool:
+    # SQLite can be built without FTS5; searches then fall back to LIKE
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)"))
+            conn.execute(text("DROP TABLE temp.fts5_probe"))
+        return True
+    except OperationalError:
+        return False
+
+
+def ensure_search_index(bind: Engine) -> None:
+    """
+    Creates the FTS5 table and its triggers if missing, indexing any
+    existing history. An index keyed by the implicit rowid (from before
+    search_rowid) is dropped and rebuilt.
+    """
+    if not full_text_available(bind):
+        return
+    with bind.begin() as conn:
+        existing = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = :name"), {"name": FTS_TABLE}).scalar()
+        rebuild = existing is None or f"content_rowid='{CONTENT_ROWID}'" not in existing
+        if rebuild:
+            for trigger in TRIGGERS:
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}"))
+            conn.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+            # Number existing history in insertion order, before the triggers exist
+            conn.execute(text(
+                "UPDATE conversations SET search_rowid = rowid + COALESCE((SELECT MAX(search_rowid) FROM conversations), 0) "
+                "WHERE search_rowid IS NULL"
+            ))
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        if rebuild:
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def fts_query(query: str, user_id: Optional[str] = None) -> str:
+    """
+    Turns free text into an FTS5 query that can't be a syntax error: every
+    term becomes a quoted phrase (so 10.0.0.5 or C:\\Windows match as
+    written) and all terms must match in the question or answer. With
+    user_id, only that user's conversations match.
+    """
+    phrases = []
+    for term in TERM.findall(query)[:MAX_QUERY_TERMS]:
+        prefix = term.endswith("*")
+        phrases.append(_phrase(term.rstrip("*")) + ("*" if prefix else ""))
+    if not phrases:
+        return ""
+    match = "{" + " ".join(FTS_COLUMNS) + "} : (" + " ".join(phrases) + ")"
+    if user_id is not None:
+        match = f"user_id : {_phrase(user_id)} AND {match}"
+    return match
+
+
+def _phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_conversations(db: Session, query: str, user_id: Optional[str], limit: int, offset: int = 0) -> List[Dict]:
+    """
+    Ranked matches for query, best first, limited to user_id's
+    conversations unless it is None. Each hit is the Conversation plus a
+    snippet around the match (terms in [brackets]) and its relevance score
+    (negated bm25, so higher is better).
+    """
+    if not full_text_available(db.get_bind()):
+        return _search_like(db, query, user_id, limit, offset)
+
+    match = fts_query(query, user_id)
+    if not match:
+        return []
+    rows = db.execute(text(SEARCH), {"query": match, "limit": limit, "offset": offset}).fetchall()
+    convos = {c.id: c for c in db.query(Conversation).filter(Conversation.id.in_([r.id for r in rows]))}
+    return [
+        {"conversation": convos[r.id], "snippet": r.snippet, "score": round(-r.score, 4)}
+        for r in rows if r.id in convos
+    ]
+
+
+def _search_like(db: Session, query: str, user_id: Optional[str], limit: int, offset: int) -> List[Dict]:
+    # Databases without FTS5: substring match on every term, newest first, unranked
+    terms = [t.rstrip("*") for t in TERM.findall(query)[:MAX_QUERY_TERMS]]
+    if not terms:
+        return []
+    columns = [getattr(Conversation, c) for c in FTS_COLUMNS]
+    q = db.query(Conversation).filter(and_(*[or_(*[col.ilike(f"%{t}%") for col in columns]) for t in terms]))
+    if user_id is not None:
+        q = q.filter(Conversation.user_id == user_id)
+    rows = q.order_by(Conversation.created_at.desc(), Conversation.id.desc()).offset(offset).limit(limit).all()
+    return [{"conversation": c, "snippet": None, "score": None} for c in rows]
@@ -1,13 +1,677 @@
-def parse_log_file(file_path: str, log_type: str) -> str:
+import os
+import re
+import json
+import time
+import logging
+import calendar
+import threading
+import multiprocessing
+from array import array
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO, Tuple
+from core.config import settings
+from core.metrics import timed
+from services.blob_compression import open_blob_text
+
+logger = logging.getLogger(__name__)
+
+# Longest parse error message kept on a blob
+MAX_PARSE_ERROR_CHARS = 500
+
+# One normalised record: (line_no, timestamp, source, severity, message).
+# line_no is the line the record starts on, timestamp is UTC epoch seconds.
+Record = Tuple[int, Optional[float], Optional[str], Optional[str], str]
+
+FORMATS = ["text", "json", "sarif"]
+
+# Longest message kept per record; the raw line stays in the blob
+MAX_MESSAGE_CHARS = 4096
+
+READ_CHUNK_CHARS = 1 << 20
+
+SEVERITIES = {
+    "trace": "debug", "debug": "debug",
+    "info": "info", "information": "info", "informational": "info", "note": "info",
+    "notice": "notice",
+    "warn": "warning", "warning": "warning",
+    "err": "error", "error": "error",
+    "crit": "critical", "critical": "critical", "fatal": "critical",
+    "alert": "critical", "emerg": "critical", "emergency": "critical",
+}
+
+# Syslog PRI severity (pri % 8), RFC 5424 section 6.2.1
+SYSLOG_SEVERITIES = ["critical", "critical", "critical", "error", "warning", "notice", "info", "debug"]
+
+MONTHS = {name: i for i, name in enumerate(calendar.month_abbr) if name}
+
+# Jan  1 00:00:00 host sshd[123]: message
+SYSLOG = re.compile(r"^(?:<(\d{1,3})>)?([A-Z][a-z]{2}) {1,2}(\d{1,2}) (\d\d):(\d\d):(\d\d) (\S+) ([^\s:\[]+)(?:\[\d+\])?: ?(.*)$")
+# <34>1 2025-01-01T00:00:00Z host app procid msgid [sd] message
+SYSLOG_5424 = re.compile(r"^<(\d{1,3})>1 (\S+) (\S+) (\S+) \S+ \S+ (?:-|(?:\[.*?\])+) ?(.*)$")
+# 10.0.0.1 - frank [10/Oct/2000:13:55:36 -0700] "GET / HTTP/1.1" 200 2326 ...
+ACCESS_LOG = re.compile(r"^(\S+) \S+ \S+ \[([^\]]+)\] (\"(?:[^\"\\]|\\.)*\" (\d{3}) .*)$")
+# 2025/01/01 00:00:00 [error] 123#0: *4 message
+NGINX_ERROR = re.compile(r"^(\d{4}/\d\d/\d\d \d\d:\d\d:\d\d) \[(\w+)\] \d+#\d+: (?:\*\d+ )?(.*)$")
+# 2025-01-01T00:00:00.123Z ... / [2025-01-01 00:00:00,123] ...
+ISO_PREFIX = re.compile(r"^\[?(\d{4}-\d\d-\d\d[T ]\d\d:\d\d:\d\d(?:[.,]\d+)?(?:Z|[+-]\d\d:?\d\d)?)\]?\s*(.*)$")
+AUTH_FAILURE = re.compile(r"Failed password|Failed publickey|authentication failure|Invalid user|invalid user|login failed|failed login|Login incorrect|access denied|Accepted password for \S+ from .* after \d+ failures", re.IGNORECASE)
+DEST_PORT = re.compile(r"\b(?:dpt|dport|dst_port|dest_port|destination_port|dstport)[\"']?\s*[=:]\s*[\"']?(\d{1,5})\b|-> ?(?:\d{1,3}\.){3}\d{1,3}:(\d{1,5})\b", re.IGNORECASE)
+SYSLOG_PREFIX = re.compile(r"^(?:<\d{1,3}>)?[A-Z][a-z]{2} ")
+ACCESS_TIME = re.compile(r"^(\d{1,2})/([A-Z][a-z]{2})/(\d{4}):(\d\d):(\d\d):(\d\d)(?: ([+-])(\d\d):?(\d\d))?$")
+LEVEL_TOKEN = re.compile(r"\b(TRACE|DEBUG|INFO|NOTICE|WARN(?:ING)?|ERROR|ERR|CRIT(?:ICAL)?|FATAL|ALERT|EMERG(?:ENCY)?)\b|\blevel[\"']?\s*[=:]\s*[\"']?(\w+)", re.IGNORECASE)
+
+# Keys looked up, in order, to normalise JSON records; dotted keys are nested
+TIMESTAMP_KEYS = ["@timestamp", "timestamp", "time", "ts", "eventTime", "datetime", "date", "created_at"]
+SEVERITY_KEYS = ["level", "severity", "log.level", "levelname", "loglevel", "priority"]
+SOURCE_KEYS = ["source", "host", "hostname", "host.name", "service", "service.name", "logger", "eventSource", "app", "program"]
+MESSAGE_KEYS = ["message", "msg", "log", "event", "eventName", "description"]
+
+# Top-level keys of a JSON object that usually hold the list of records
+RECORD_LIST_KEYS = {"records", "Records", "events", "logs", "entries", "items", "data", "hits"}
+
+
+def detect_format(file_path: str) -> str:
+    """
+    Sniffs the stored content rather than trusting the upload's log_type,
+    so data derived from a blob depends only on its bytes.
+    """
+    with open_blob_text(file_path, errors="replace") as f:
+        head = f.read(64 * 1024).lstrip("\ufeff \t\r\n")
+    if head.startswith("{") and '"runs"' in head and "sarif" in head.lower():
+        return "sarif"
+    if head.startswith(("{", "[")):
+        return "json"
+    return "text"
+
+
+def iter_records(file_path: str, fmt: str) -> Iterator[Tuple[Record, str]]:
+    """
+    Streams (record, index_text) pairs for a stored blob. index_text is what
+    the inverted index extracts fields from: the raw line for text logs,
+    the compact JSON of the record for structured ones.
+    Raises ValueError if the content isn't valid for fmt.
+    """
+    with open_blob_text(file_path, errors="replace") as f:
+        yield from iter_stream_records(f, fmt)
+
+
+def iter_stream_records(f: TextIO, fmt: str, first_line: int = 1, year: Optional[int] = None) -> Iterator[Tuple[Record, str]]:
+    """
+    iter_records over an open text stream whose first line is line
+    first_line of the log, e.g. lines being appended to it. year is the
+    one syslog lines take until a line carrying a year is seen.
+    """
+    if fmt == "text":
+        # Classic syslog lines carry no year; take it from the latest line that does
+        for line_no, line in enumerate(f, start=first_line):
+            line = line.rstrip("\n")
+            record = parse_text_line(line_no, line, year)
+            if record[1] is not None and not SYSLOG_PREFIX.match(line):
+                year = datetime.fromtimestamp(record[1], timezone.utc).year
+            yield record, line
+    elif fmt == "json":
+        for line_no, value in iter_json_records(JsonStream(f)):
+            yield json_record(line_no + first_line - 1, value), _compact(value)
+    elif fmt == "sarif":
+        for line_no, result, tool in iter_sarif_results(JsonStream(f)):
+            yield sarif_record(line_no + first_line - 1, result, tool), _compact(result)
+    else:
+        raise ValueError(f"Unknown log format: {fmt}")
+
+
+# ---- line-oriented logs ----
+
+def parse_text_line(line_no: int, line: str, year: int = None) -> Record:
+    m = SYSLOG.match(line)
+    if m:
+        pri, month, day, hh, mm, ss, _host, program, message = m.groups()
+        ts = _syslog_time(year, MONTHS.get(month, 1), int(day), int(hh), int(mm), int(ss))
+        severity = SYSLOG_SEVERITIES[int(pri) % 8] if pri else _level_in(message)
+        return line_no, ts, program, severity, _clip(message)
+
+    m = SYSLOG_5424.match(line)
+    if m:
+        pri, stamp, _host, app, message = m.groups()
+        return line_no, _parse_timestamp(stamp), app, SYSLOG_SEVERITIES[int(pri) % 8], _clip(message)
+
+    m = ACCESS_LOG.match(line)
+    if m:
+        client, stamp, message, status = m.groups()
+        ts = _access_time(stamp)
+        severity = "error" if status[0] == "5" else "warning" if status[0] == "4" else "info"
+        return line_no, ts, client, severity, _clip(message)
+
+    m = NGINX_ERROR.match(line)
+    if m:
+        stamp, level, message = m.groups()
+        return line_no, _parse_timestamp(stamp.replace("/", "-")), None, normalise_severity(level), _clip(message)
+
+    m = ISO_PREFIX.match(line)
+    if m:
+        stamp, message = m.groups()
+        return line_no, _parse_timestamp(stamp), None, _level_in(message), _clip(message)
+
+    return line_no, None, None, _level_in(line), _clip(line)
+
+
+def _level_in(text: str) -> Optional[str]:
+    m = LEVEL_TOKEN.search(text)
+    if not m:
+        return None
+    return normalise_severity(m.group(1) or m.group(2))
+
+
+# ---- JSON / NDJSON ----
+
+class JsonStream:
+    """
+    Minimal pull parser over a text file: walks the structure of objects
+    and arrays and decodes only the values it's asked for, reading the file
+    in chunks, so a large array or NDJSON file is never held in memory at
+    once. Tracks the line number of the current position.
+
+    A single value may be read whole, up to max_value_chars; by default the
+    largest log an upload can store, so only malformed input reaches it.
+    """
+
+    WHITESPACE = " \t\r\n\ufeff"
+
+    def __init__(self, f: TextIO, max_value_chars: Optional[int] = None):
+        self.f = f
+        self.buffer = ""
+        self.pos = 0
+        self.line = 1
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+        self.max_value_chars = max_value_chars or max(settings.max_file_size_mb, settings.max_decompressed_size_mb) * 1024 * 1024
+
+    def peek(self) -> Optional[str]:
+        """Skips whitespace and returns the next character, or None at the end."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self.WHITESPACE:
+                if self.buffer[self.pos] == "\n":
+                    self.line += 1
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} on line {self.line}")
+        self.pos += 1
+
+    def accept(self, char: str) -> bool:
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def value(self) -> Any:
+        """Decodes the next complete value."""
+        if self.peek() is None:
+            raise ValueError("Unexpected end of JSON")
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Past the cap the value can't be valid, so stop rather than
+                # read a malformed file to the end looking for its close
+                if len(self.buffer) - self.pos <= self.max_value_chars and self._fill():
+                    continue
+                raise ValueError(f"Invalid JSON on line {self.line}")
+            # A number or literal cut off at the end of the buffer may continue
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.line += self.buffer.count("\n", self.pos, end)
+            self.pos = end
+            return value
+
+    def items(self) -> Iterator[str]:
+        """Iterates the keys of the object at the current position; the caller consumes each value."""
+        self.expect("{")
+        if self.accept("}"):
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError(f"Expected an object key on line {self.line}")
+            self.expect(":")
+            yield key
+            if self.accept("}"):
+                return
+            self.expect(",")
+
+    def elements(self) -> Iterator[int]:
+        """Iterates the array at the current position, yielding each element's line; the caller consumes it."""
+        self.expect("[")
+        if self.accept("]"):
+            return
+        while True:
+            self.peek()
+            yield self.line
+            if self.accept("]"):
+                return
+            self.expect(",")
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(READ_CHUNK_CHARS)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what's been consumed; positions are relative to the buffer
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+
+def iter_json_records(stream: JsonStream) -> Iterator[Tuple[int, Any]]:
+    """
+    Yields (line_no, value) for each record: every value of an NDJSON file,
+    every element of a top-level array, or the elements of a records list
+    inside a top-level object (e.g. CloudTrail's "Records"). An object with
+    no such list is a single record.
+    """
+    while stream.peek() is not None:
+        line_no = stream.line
+        if stream.peek() == "[":
+            for element_line in stream.elements():
+                yield element_line, stream.value()
+        elif stream.peek() == "{":
+            rest, found = {}, False
+            for key in stream.items():
+                if key in RECORD_LIST_KEYS and stream.peek() == "[":
+                    found = True
+                    for element_line in stream.elements():
+                        yield element_line, stream.value()
+                else:
+                    rest[key] = stream.value()
+            if not found:
+                yield line_no, rest
+        else:
+            yield line_no, stream.value()
+
+
+def json_record(line_no: int, value: Any) -> Record:
+    if not isinstance(value, dict):
+        return line_no, None, None, None, _clip(_compact(value))
+
+    used = set()
+    ts = _lookup(value, TIMESTAMP_KEYS, used)
+    severity = _lookup(value, SEVERITY_KEYS, used)
+    source = _lookup(value, SOURCE_KEYS, used)
+    message = _lookup(value, MESSAGE_KEYS, used)
+    # Whatever wasn't normalised stays in the message so nothing is lost
+    rest = {k: v for k, v in value.items() if k not in used}
+    if not isinstance(message, str):
+        message = _compact(value)
+    elif rest:
+        message = f"{message} {_compact(rest)}"
+    return (
+        line_no,
+        _parse_timestamp(ts),
+        _clip(str(source), 256) if isinstance(source, (str, int)) else None,
+        normalise_severity(severity),
+        _clip(message)
+    )
+
+
+def _lookup(record: dict, keys, used: set) -> Any:
+    for key in keys:
+        value = record.get(key)
+        if value is None and "." in key:
+            value = record
+            for part in key.split("."):
+                value = value.get(part) if isinstance(value, dict) else None
+        if value is not None:
+            if key in record:
+                used.add(key)
+            return value
+    return None
+
+
+# ---- SARIF ----
+
+def iter_sarif_results(stream: JsonStream) -> Iterator[Tuple[int, dict, Optional[str]]]:
+    """Yields (line_no, result, tool_name) for every result of every run."""
+    for key in stream.items():
+        if key != "runs":
+            stream.value()
+            continue
+        for _ in stream.elements():
+            tool = None
+            for run_key in stream.items():
+                if run_key == "tool":
+                    driver = (stream.value() or {}).get("driver") or {}
+                    tool = driver.get("name")
+                elif run_key == "results" and stream.peek() == "[":
+                    for result_line in stream.elements():
+                        yield result_line, stream.value(), tool
+                else:
+                    stream.value()
+
+
+def sarif_record(line_no: int, result: dict, tool: Optional[str]) -> Record:
+    if not isinstance(result, dict):
+        return line_no, None, tool, None, _clip(_compact(result))
+
+    text = (result.get("message") or {}).get("text") or ""
+    rule = result.get("ruleId")
+    message = f"{rule}: {text}" if rule else text
+
+    locations = result.get("locations") or []
+    physical = (locations[0].get("physicalLocation") or {}) if locations and isinstance(locations[0], dict) else {}
+    uri = (physical.get("artifactLocation") or {}).get("uri")
+    start = (physical.get("region") or {}).get("startLine")
+    if uri:
+        message += f" ({uri}:{start})" if start else f" ({uri})"
+
+    # SARIF's default level is "warning"; "none" means informational
+    level = result.get("level", "warning")
+    return line_no, None, tool, normalise_severity("info" if level == "none" else level), _clip(message)
+
+
+# ---- helpers ----
+
+def normalise_severity(value: Any) -> Optional[str]:
+    if isinstance(value, int) and 0 <= value <= 7:
+        return SYSLOG_SEVERITIES[value]
+    if not isinstance(value, str):
+        return None
+    return SEVERITIES.get(value.strip().lower())
+
+
+def _parse_timestamp(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        # Epoch seconds, or milliseconds for anything past 2286
+        return value / 1000 if value > 1e10 else float(value)
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace(",", "."))
+    except ValueError:
+        return None
+    return _epoch(parsed)
+
+
+def _access_time(value: str) -> Optional[float]:
+    # 10/Oct/2000:13:55:36 -0700; strptime is several times slower
+    m = ACCESS_TIME.match(value)
+    if not m:
+        return None
+    day, month, year, hh, mm, ss, sign, off_h, off_m = m.groups()
+    if month not in MONTHS:
+        return None
+    offset = (int(off_h) * 3600 + int(off_m) * 60) * (-1 if sign == "-" else 1) if sign else 0
+    return float(calendar.timegm((int(year), MONTHS[month], int(day), int(hh), int(mm), int(ss))) - offset)
+
+
+def _syslog_time(year: Optional[int], month: int, day: int, hh: int, mm: int, ss: int) -> float:
+    if year is None:
+        # No year anywhere yet: assume the last twelve months
+        now = datetime.now(timezone.utc)
+        year = now.year
+        if (month, day) > (now.month, now.day + 1):
+            year -= 1
+    return float(calendar.timegm((year, month, day, hh, mm, ss)))
+
+
+def _epoch(value: datetime) -> float:
+    # Timestamps without a zone are taken as UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _compact(value: Any) -> str:
+    return json.dumps(value, separators=(", ", ": "), ensure_ascii=False, default=str)
+
+
+def _clip(text: str, limit: int = MAX_MESSAGE_CHARS) -> str:
+    return text if len(text) <= limit else text[:limit] + " …[truncated]"
+
+
+# ---- upload-time pipeline ----
+
+def parse_blob(file_path: str) -> Tuple[str, int, Dict[Tuple[str, str], bytes]]:
     """
-    Reads the uploaded file and optionally processes it based on type.
-    For now, returns plain text. Extend per type as needed.
+    Builds a stored blob's line-offset index, parses it into its record
+    store (building the inverted index postings and mining line templates
+    in the same pass) and runs the threat pre-analysis over the records.
+    Runs in the parser process pool, so it only touches files; the caller
+    writes the postings to the DB.
+    Returns (format, record_count, postings).
     """
+    from services.line_index import build_line_index
+    from services.record_store import records_path, write_records
+    from services.template_miner import TemplateMiner, write_templates
+    from services.threat_analysis import write_findings
+
+    build_line_index(file_path)
+
+    fmt = detect_format(file_path)
+    postings: Dict[Tuple[str, str], array] = {}
+    miner = TemplateMiner()
+
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
-    except Exception as e:
-        raise ValueError(f"Error reading log file: {str(e)}")
+        count = write_records(records_path(file_path), fmt, derive_rows(iter_records(file_path, fmt), fmt, postings, miner))
+    except ValueError:
+        # Looked like JSON but isn't (e.g. "[2025-01-01 ...] ..." lines)
+        if fmt == "text":
+            raise
+        fmt = "text"
+        postings.clear()
+        miner = TemplateMiner()
+        count = write_records(records_path(file_path), fmt, derive_rows(iter_records(file_path, fmt), fmt, postings, miner))
+
+    write_templates(file_path, miner.result())
+    write_findings(file_path)
+    return fmt, count, {key: lines.tobytes() for key, lines in postings.items()}
+
+
+def derive_rows(records: Iterable[Tuple[Record, str]], fmt: str, postings: Dict[Tuple[str, str], array], miner) -> Iterator[tuple]:
+    """
+    Record store rows for parsed records, adding each record to the index
+    postings and the template miner on the way.
+    """
+    from services.log_indexer import add_postings
+    from services.record_store import render_record
+
+    for record, index_text in records:
+        entities = add_postings(postings, record[0], index_text, record[3])
+        # Mine the text the model would otherwise be sent (see iter_log_lines)
+        miner.add(record[0], index_text if fmt == "text" else render_record(record))
+        yield record + entity_columns(entities, index_text)
+
+
+def entity_columns(entities, index_text: str) -> tuple:
+    """
+    Per-record entity columns for the pre-analysis: (ip, peer_ip, user,
+    status, port, auth_failure). The first IP in a line is usually the
+    client/source and the second the destination.
+    """
+    ips = [value for field, value in entities if field == "ip"]
+    first = {}
+    for field, value in entities:
+        first.setdefault(field, value)
+    status = first.get("status")
+    # Only explicit destination ports; "port N" in sshd lines is the client's
+    port = DEST_PORT.search(index_text)
+    return (
+        ips[0] if ips else None,
+        ips[1] if len(ips) > 1 else None,
+        first.get("user"),
+        int(status) if status else None,
+        int(port.group(1) or port.group(2)) if port else None,
+        1 if AUTH_FAILURE.search(index_text) else 0
+    )
 
-    # Add log-type-specific parsing logic here if needed
-    return content
\ No newline at end of file
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _parser_pool() -> Optional[ProcessPoolExecutor]:
+    # Created on first use so importing the app doesn't fork
+    global _pool
+    if settings.parser_workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.parser_workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard_parser_pool(pool: ProcessPoolExecutor) -> None:
+    # A worker that crashed or was OOM-killed breaks the whole pool; the
+    # next _parser_pool() call starts a new one
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_parser_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+# Blobs being parsed by this process. Concurrent uploads of the same
+# content each schedule a parse; only the first one does the work
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def process_blob_in_background(sha256: str) -> None:
+    """
+    Runs after the upload response is sent: parses the blob in the process
+    pool (parsing is CPU-bound and would otherwise hold the GIL against
+    request handling), then records the index and parse results.
+    """
+    with _in_flight_lock:
+        if sha256 in _in_flight:
+            return
+        _in_flight.add(sha256)
+    try:
+        _process_blob(sha256)
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(sha256)
+
+
+def _process_blob(sha256: str) -> None:
+    from core.db import SessionLocal
+    from models.log_blob import LogBlob
+    from services.log_append import append_lock
+    from services.log_indexer import write_index
+    from services.record_store import records_path
+
+    db = SessionLocal()
+    try:
+        blob = db.query(LogBlob).filter(LogBlob.sha256 == sha256).first()
+        if not blob or blob.parsed_at is not None:
+            return
+        file_path = blob.file_path
+        live = blob.live_since is not None
+        db.rollback()  # don't hold a connection while parsing
+
+        pool = _parser_pool()
+        try:
+            # A log being appended to must not grow while it is re-parsed;
+            # appends check parsed_at once they hold the lock
+            with append_lock(file_path) if live else nullcontext(), timed("parse", "parse_blob"):
+                if pool is None:
+                    fmt, count, postings = parse_blob(file_path)
+                else:
+                    try:
+                        fmt, count, postings = pool.submit(parse_blob, file_path).result()
+                    except BrokenProcessPool:
+                        _discard_parser_pool(pool)
+                        raise
+        except Exception as e:
+            logger.exception("Parsing blob %s failed", sha256)
+            # Reported by every endpoint that needs the records, until an
+            # upload of the same content retries
+            db.query(LogBlob).filter(LogBlob.sha256 == sha256).update(
+                {LogBlob.parse_error: f"{type(e).__name__}: {e}"[:MAX_PARSE_ERROR_CHARS]}, synchronize_session=False
+            )
+            db.commit()
+            return
+
+        blob = db.query(LogBlob).filter(LogBlob.sha256 == sha256).first()
+        if not blob:
+            # Garbage-collected while we were parsing
+            if os.path.exists(records_path(file_path)):
+                os.remove(records_path(file_path))
+            return
+        with timed("parse", "write_index"):
+            write_index(db, blob, postings)
+            blob.record_format = fmt
+            blob.record_count = count
+            blob.parsed_at = datetime.utcnow()
+            db.commit()
+    finally:
+        db.close()
+
+
+# Live blobs whose findings are being recomputed by this process
+_refreshing = set()
+
+
+def refresh_findings_in_background(file_path: str) -> None:
+    """
+    Recomputes the findings of a blob being appended to (see log_append)
+    once they are older than append_findings_interval_seconds, in the
+    parser pool. Returns without waiting; one run per blob at a time.
+    """
+    from services.threat_analysis import findings_path, write_findings
+
+    try:
+        age = time.time() - os.path.getmtime(findings_path(file_path))
+    except OSError:
+        age = float("inf")
+    if age < settings.append_findings_interval_seconds:
+        return
+    with _in_flight_lock:
+        if file_path in _refreshing:
+            return
+        _refreshing.add(file_path)
+
+    pool = _parser_pool()
+
+    def done(future=None):
+        with _in_flight_lock:
+            _refreshing.discard(file_path)
+        if future is not None and future.exception() is not None:
+            if isinstance(future.exception(), BrokenProcessPool):
+                _discard_parser_pool(pool)
+            logger.error("Refreshing findings of %s failed", file_path, exc_info=future.exception())
+
+    if pool is None:
+        try:
+            write_findings(file_path)
+        except Exception:
+            logger.exception("Refreshing findings of %s failed", file_path)
+        finally:
+            done()
+        return
+    try:
+        future = pool.submit(write_findings, file_path)
+    except BrokenProcessPool:
+        _discard_parser_pool(pool)
+        logger.exception("Refreshing findings of %s failed", file_path)
+        done()
+        return
+    future.add_done_callback(done)
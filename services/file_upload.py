@@ -1,27 +1,112 @@
 import os
-from uuid import uuid4
+import hashlib
+import tempfile
+from typing import BinaryIO, Optional
 from fastapi import UploadFile, HTTPException
 from core.config import settings
+from services.blob_compression import (
+    BLOCKS_SUFFIX, COMPRESSED_ERRORS, BlockWriter, decompressing_reader, detect_compression, zstd_available
+)
 
 UPLOAD_DIR = "uploaded_logs"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def save_uploaded_file(file: UploadFile, log_type: str) -> str:
+# Read uploads in fixed-size chunks so memory use doesn't grow with the file
+CHUNK_SIZE = 1024 * 1024
+
+
+def save_uploaded_file(file: UploadFile, log_type: str) -> dict:
     """
-    Validates file size and saves it locally.
-    Returns the saved file path.
+    Streams the upload to a temp file in UPLOAD_DIR, enforcing the size limit
+    as bytes arrive. SHA-256 and line count are computed in the same pass.
+    Returns the temp file path along with its hash, size and line count;
+    services.blob_store moves it to its content-addressed location.
+
+    gzip and zstd uploads are decompressed as they stream (hash, size and
+    line count describe the log itself, so the same log dedupes however it
+    was sent) and stored recompressed in blocks; see blob_compression.
     """
-    content = file.file.read()
-    file_size_mb = len(content) / (1024 * 1024)
+    head = file.file.read(4)
+    file.file.seek(0)
+    compression = detect_compression(head)
+    if compression is None:
+        return _save(file.file, settings.max_file_size_mb, None)
+
+    if compression == "zstd" and not zstd_available():
+        raise HTTPException(status_code=415, detail="zstd uploads are not supported on this server")
+    sent = _LimitedReader(file.file, settings.max_file_size_mb * 1024 * 1024)
+    try:
+        return _save(decompressing_reader(sent, compression), settings.max_decompressed_size_mb, compression)
+    except COMPRESSED_ERRORS:
+        raise HTTPException(status_code=400, detail=f"Invalid {compression} file")
+
+
+def _save(source: BinaryIO, max_size_mb: int, compression: Optional[str]) -> dict:
+    max_bytes = max_size_mb * 1024 * 1024
+    sha256 = hashlib.sha256()
+    size_bytes = 0
+    line_count = 0
+    last_byte = b""
+
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+    blocks_tmp_path = None
+    try:
+        with os.fdopen(fd, "wb") as out:
+            writer = BlockWriter(out, compression) if compression else out
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                size_bytes += len(chunk)
+                if size_bytes > max_bytes:
+                    detail = "File too large once decompressed" if compression else "File too large"
+                    raise HTTPException(status_code=413, detail=detail)
+
+                sha256.update(chunk)
+                line_count += chunk.count(b"\n")
+                last_byte = chunk[-1:]
+                writer.write(chunk)
+
+            if compression:
+                writer.close()
+                blocks_tmp_path = tmp_path[:-len(".part")] + BLOCKS_SUFFIX + ".part"
+                writer.write_index(blocks_tmp_path)
+            out.flush()
+            os.fsync(out.fileno())
+
+        # A trailing line without a newline still counts as a line
+        if last_byte and last_byte != b"\n":
+            line_count += 1
+    except BaseException:
+        for path in (tmp_path, blocks_tmp_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+        raise
+
+    return {
+        "tmp_path": tmp_path,
+        "blocks_tmp_path": blocks_tmp_path,
+        "sha256": sha256.hexdigest(),
+        "size_bytes": size_bytes,
+        "line_count": line_count,
+    }
+
 
-    if file_size_mb > settings.max_file_size_mb:
-        raise HTTPException(status_code=413, detail="File too large")
+class _LimitedReader:
+    """The raw (still compressed) upload, failing with 413 once more than max_bytes have been read."""
 
-    ext = file.filename.split(".")[-1]
-    file_id = str(uuid4())
-    file_path = os.path.join(UPLOAD_DIR, f"{file_id}.{ext}")
+    def __init__(self, raw: BinaryIO, max_bytes: int):
+        self.raw = raw
+        self.max_bytes = max_bytes
+        self.read_bytes = 0
 
-    with open(file_path, "wb") as f:
-        f.write(content)
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.read_bytes += len(data)
+        if self.read_bytes > self.max_bytes:
+            raise HTTPException(status_code=413, detail="File too large")
+        return data
 
-    return file_path
\ No newline at end of file
+    def readable(self) -> bool:
+        return True
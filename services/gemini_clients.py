@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import threading
+import weakref
+from typing import Optional
+from core.cache import TTLCache
+from core.config import settings
+from services.stub_model import StubModel
+
+
+class GeminiModel:
+    """
+    Adapter giving a pooled google.genai client the generate_content /
+    generate_content_async interface the analysis pipeline expects. The
+    API key lives on the client, never in process-global state, so
+    concurrent requests for different users can't pick up each other's key.
+    """
+
+    def __init__(self, clients: "KeyClients", model_name: str):
+        self.clients = clients
+        self.model_name = model_name
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        client = self.clients.client()
+        if stream:
+            return client.models.generate_content_stream(model=self.model_name, contents=prompt)
+        return client.models.generate_content(model=self.model_name, contents=prompt)
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        client = self.clients.client(asyncio.get_running_loop())
+        if stream:
+            return await client.aio.models.generate_content_stream(model=self.model_name, contents=prompt)
+        return await client.aio.models.generate_content(model=self.model_name, contents=prompt)
+
+
+class KeyClients:
+    """
+    The clients for one API key. The async transport is bound to the event
+    loop that first used it, so each loop (the server's, and each job
+    worker's) gets its own client; blocking callers share one more.
+    """
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self._lock = threading.Lock()
+        self._by_loop: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, object]" = weakref.WeakKeyDictionary()
+        self._blocking = None
+
+    def client(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        with self._lock:
+            if loop is None:
+                if self._blocking is None:
+                    self._blocking = _new_client(self.api_key)
+                return self._blocking
+            client = self._by_loop.get(loop)
+            if client is None:
+                client = self._by_loop[loop] = _new_client(self.api_key)
+            return client
+
+
+def _new_client(api_key: str):
+    from google import genai
+
+    return genai.Client(api_key=api_key)
+
+
+def _key_id(api_key: str) -> str:
+    # Registry keys are hashes so raw API keys aren't kept around as dict keys
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+# Idle keys drop out after gemini_client_idle_seconds; clients aren't closed
+# on eviction because an in-flight request may still hold them, they are
+# released once the last reference goes away
+_registry = TTLCache(settings.gemini_client_pool_size, settings.gemini_client_idle_seconds, sliding=True)
+_registry_lock = threading.Lock()
+
+
+def get_model(user):
+    if settings.gemini_model == "stub":
+        return StubModel()
+    key_id = _key_id(user.gemini_api_key)
+    with _registry_lock:
+        clients = _registry.get(key_id)
+        if clients is None:
+            clients = KeyClients(user.gemini_api_key)
+            _registry.set(key_id, clients)
+    return GeminiModel(clients, settings.gemini_model)
+
+
+def invalidate_api_key(api_key: Optional[str]) -> None:
+    """Drops the pooled clients for a key that was replaced or removed."""
+    if api_key:
+        _registry.pop(_key_id(api_key))
+
+
+def pool_size() -> int:
+    return len(_registry)
@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, Set
+from fastapi import HTTPException
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from core.config import settings
+from core.db import SessionLocal
+from models.analysis_job import AnalysisJob
+from models.user import User
+from services.ai_handler import call_gemini_async
+from services.analysis import prepare_analysis, lookup_cached, save_conversation
+from services.answer_cache import store_answer
+
+logger = logging.getLogger(__name__)
+
+# Idle workers look for jobs queued by other processes (or before a restart) this often
+POLL_SECONDS = 5
+
+# Each process refreshes the heartbeat of the jobs it is running this often
+HEARTBEAT_SECONDS = 10
+
+# A running job whose heartbeat is older than this belongs to a dead process
+DEAD_AFTER_SECONDS = 60
+
+
+class JobQueue:
+    """
+    In-process worker pool for queued /ask analyses. Job state lives in
+    the analysis_jobs table, so queued jobs survive restarts and several
+    server processes can share the table: a worker only runs a job after
+    atomically moving it from queued to running, recording this process as
+    its owner. Owners keep a heartbeat on their running jobs; a job whose
+    owner stopped beating (crashed or killed) is queued again.
+
+    Users are served round-robin, so one user's backlog can't starve the
+    others. Queued jobs are cancelled in the DB; running jobs are also
+    interrupted if they are running in this process.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[str]] = {}  # user_id -> job ids, oldest first
+        self._users: Deque[str] = deque()         # users with queued jobs, in serving order
+        self._known: Set[str] = set()
+        self._running: Dict[str, tuple] = {}      # job_id -> (event loop, task)
+        self._threads = []
+        self._stopping = False
+        self._stopped = threading.Event()
+        # Unique per process (and per start), so a restarted server doesn't
+        # pass for the owner of the jobs it was running when it died
+        self.worker_id = None
+
+    def start(self) -> None:
+        self._stopping = False
+        self._stopped.clear()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.poll()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"analysis-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="analysis-job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        with self._cond:
+            self._stopping = True
+            for loop, task in self._running.values():
+                loop.call_soon_threadsafe(task.cancel)
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=10)
+        self._threads = []
+
+    def submit(self, db: Session, user_id: str, log_id: str, question: str, filters: Optional[dict], use_cache: bool, compact: bool = False, log_ids: Optional[List[str]] = None, incremental: bool = False) -> AnalysisJob:
+        pending = db.query(AnalysisJob).filter(
+            AnalysisJob.user_id == user_id,
+            AnalysisJob.status.in_(["queued", "running"])
+        ).count()
+        if pending >= settings.job_max_queued_per_user:
+            raise HTTPException(status_code=429, detail="Too many queued analyses, wait for some to finish")
+
+        job = AnalysisJob(
+            user_id=user_id,
+            log_id=log_id,
+            question=question,
+            filters=json.dumps(filters) if filters else None,
+            log_ids=json.dumps(log_ids) if log_ids else None,
+            use_cache=use_cache,
+            compact=compact,
+            incremental=incremental,
+            status="queued"
+        )
+        db.add(job)
+        db.commit()
+        self._enqueue(job.id, user_id)
+        return job
+
+    def cancel(self, db: Session, job: AnalysisJob) -> bool:
+        """Cancels a queued or running job; returns False if it already finished."""
+        cancelled = db.query(AnalysisJob).filter(
+            AnalysisJob.id == job.id,
+            AnalysisJob.status.in_(["queued", "running"])
+        ).update({AnalysisJob.status: "cancelled", AnalysisJob.finished_at: datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+
+        with self._cond:
+            running = self._running.get(job.id)
+        if running:
+            loop, task = running
+            loop.call_soon_threadsafe(task.cancel)
+        return bool(cancelled)
+
+    def poll(self) -> None:
+        """Picks up queued jobs this process doesn't know about and requeues those of dead processes."""
+        db = SessionLocal()
+        try:
+            # Only the owner knows whether a job is still running, and it
+            # says so through the heartbeat; age alone would rerun long jobs.
+            # Jobs from before heartbeats fall back to their start time
+            dead = datetime.utcnow() - timedelta(seconds=DEAD_AFTER_SECONDS)
+            db.query(AnalysisJob).filter(
+                AnalysisJob.status == "running",
+                or_(AnalysisJob.worker_id.is_(None), AnalysisJob.worker_id != self.worker_id),
+                func.coalesce(AnalysisJob.heartbeat_at, AnalysisJob.started_at) < dead
+            ).update({
+                AnalysisJob.status: "queued",
+                AnalysisJob.started_at: None,
+                AnalysisJob.worker_id: None,
+                AnalysisJob.heartbeat_at: None
+            }, synchronize_session=False)
+            db.commit()
+
+            queued = (
+                db.query(AnalysisJob.id, AnalysisJob.user_id)
+                .filter(AnalysisJob.status == "queued")
+                .order_by(AnalysisJob.created_at.asc())
+                .all()
+            )
+        finally:
+            db.close()
+
+        for job_id, user_id in queued:
+            self._enqueue(job_id, user_id)
+
+    def beat(self) -> None:
+        """Marks the jobs this process is running as alive."""
+        db = SessionLocal()
+        try:
+            db.query(AnalysisJob).filter(
+                AnalysisJob.status == "running",
+                AnalysisJob.worker_id == self.worker_id
+            ).update({AnalysisJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _heartbeat(self) -> None:
+        # Its own thread, so a worker blocked in a long analysis still beats
+        while not self._stopped.wait(HEARTBEAT_SECONDS):
+            try:
+                self.beat()
+            except Exception:
+                logger.exception("Analysis job heartbeat failed")
+
+    def _enqueue(self, job_id: str, user_id: str) -> None:
+        with self._cond:
+            if job_id in self._known:
+                return
+            self._known.add(job_id)
+            queue = self._queues.get(user_id)
+            if queue is None:
+                queue = self._queues[user_id] = deque()
+                self._users.append(user_id)
+            queue.append(job_id)
+            self._cond.notify()
+
+    def _next_job(self) -> Optional[str]:
+        # Round-robin across users with queued work
+        with self._cond:
+            while not self._users and not self._stopping:
+                if not self._cond.wait(timeout=POLL_SECONDS):
+                    return None
+            if self._stopping:
+                return None
+            user_id = self._users.popleft()
+            queue = self._queues[user_id]
+            job_id = queue.popleft()
+            if queue:
+                self._users.append(user_id)
+            else:
+                del self._queues[user_id]
+            self._known.discard(job_id)
+            return job_id
+
+    def _worker(self) -> None:
+        loop = asyncio.new_event_loop()
+        try:
+            while not self._stopping:
+                job_id = self._next_job()
+                if job_id is None:
+                    if not self._stopping:
+                        self.poll()
+                    continue
+                try:
+                    self._run(loop, job_id)
+                except Exception:
+                    logger.exception("Analysis job %s crashed", job_id)
+        finally:
+            loop.close()
+
+    def _run(self, loop: asyncio.AbstractEventLoop, job_id: str) -> None:
+        db = SessionLocal()
+        try:
+            # Claim the job; another worker or a cancel may have got there first
+            now = datetime.utcnow()
+            claimed = db.query(AnalysisJob).filter(
+                AnalysisJob.id == job_id,
+                AnalysisJob.status == "queued"
+            ).update({
+                AnalysisJob.status: "running",
+                AnalysisJob.started_at: now,
+                AnalysisJob.worker_id: self.worker_id,
+                AnalysisJob.heartbeat_at: now
+            }, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                return
+
+            job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+            user = db.query(User).filter(User.id == job.user_id).first()
+            filters = json.loads(job.filters) if job.filters else None
+            log_ids = json.loads(job.log_ids) if job.log_ids else None
+
+            try:
+                log, log_path, line_numbers, key, sources, progress = prepare_analysis(db, user, job.log_id, job.question, filters, bool(job.compact), log_ids, bool(job.incremental))
+                result = lookup_cached(db, key, job.use_cache, progress)
+                if result is None:
+                    db.commit()
+                    started = time.perf_counter()
+                    task = loop.create_task(call_gemini_async(log_file_path=log_path, question=job.question, user=user, line_numbers=line_numbers, compact=bool(job.compact), sources=sources, prior=progress.prior if progress else None))
+                    with self._cond:
+                        self._running[job_id] = (loop, task)
+                    try:
+                        result = loop.run_until_complete(task)
+                    finally:
+                        with self._cond:
+                            self._running.pop(job_id, None)
+                    if key:
+                        compute_ms = int((time.perf_counter() - started) * 1000)
+                        store_answer(db, key, log.file_hash, job.question, result, compute_ms)
+            except asyncio.CancelledError:
+                # Shutting down: put the job back for the next start instead
+                self._finish(db, job_id, "queued" if self._stopping else "cancelled")
+                return
+            except HTTPException as e:
+                self._finish(db, job_id, "failed", error=str(e.detail))
+                return
+            except Exception as e:
+                logger.exception("Analysis job %s failed", job_id)
+                self._finish(db, job_id, "failed", error=str(e))
+                return
+
+            # Only record the answer if nobody cancelled or requeued the job meanwhile
+            still_running = db.query(AnalysisJob).filter(
+                AnalysisJob.id == job_id,
+                AnalysisJob.status == "running",
+                AnalysisJob.worker_id == self.worker_id
+            ).count()
+            if still_running:
+                convo_id = save_conversation(db, user.id, log.id, job.question, result, sources, progress)
+                self._finish(db, job_id, "done", conversation_id=convo_id)
+        finally:
+            db.close()
+
+    def _finish(self, db: Session, job_id: str, status: str, error: str = None, conversation_id: str = None) -> None:
+        db.rollback()
+        db.query(AnalysisJob).filter(
+            AnalysisJob.id == job_id,
+            AnalysisJob.status == "running",
+            AnalysisJob.worker_id == self.worker_id
+        ).update({
+            AnalysisJob.status: status,
+            AnalysisJob.error: error,
+            AnalysisJob.conversation_id: conversation_id,
+            AnalysisJob.worker_id: None if status == "queued" else AnalysisJob.worker_id,
+            AnalysisJob.started_at: None if status == "queued" else AnalysisJob.started_at,
+            AnalysisJob.finished_at: None if status == "queued" else datetime.utcnow()
+        }, synchronize_session=False)
+        db.commit()
+
+
+job_queue = JobQueue(settings.job_workers)
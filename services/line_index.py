@@ -0,0 +1,140 @@
+import os
+import sys
+import mmap
+from array import array
+from itertools import accumulate, islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+from core.files import atomic_write
+from services.blob_compression import BlockReader, blob_compression, open_blob
+
+# Byte offset of the start of every line of a blob (decompressed, if it is
+# stored compressed), as little-endian uint64, followed by its size; stored next to the blob (see blob_path)
+LINES_SUFFIX = ".lines"
+
+OFFSET_BYTES = 8
+
+READ_CHUNK_BYTES = 1 << 20
+
+
+def line_index_path(blob_file_path: str) -> str:
+    return blob_file_path + LINES_SUFFIX
+
+
+def build_line_index(blob_file_path: str) -> int:
+    """Writes the offset index for a file in one sequential pass; returns its line count."""
+    offsets = array("Q", [0])
+    base = 0
+    with open_blob(blob_file_path) as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_BYTES), b""):
+            # Every piece but the last ends in a newline; the next line starts after it
+            pieces = chunk.split(b"\n")[:-1]
+            offsets.extend(islice(accumulate((len(p) + 1 for p in pieces), initial=base), 1, None))
+            base += len(chunk)
+    if offsets[-1] != base:
+        offsets.append(base)  # last line has no trailing newline
+
+    if sys.byteorder == "big":
+        offsets.byteswap()
+
+    atomic_write(line_index_path(blob_file_path), offsets)
+    return len(offsets) - 1
+
+
+def append_line_index(blob_file_path: str, line_count: int, size: int, data: bytes, ends_last_line: bool) -> int:
+    """
+    Extends the index of a blob that had line_count lines and size bytes
+    with data appended at the end (newline-terminated). ends_last_line: the
+    blob didn't end in a newline and data starts with the one closing its
+    last line. Returns the number of lines added.
+    """
+    offsets = array("Q")
+    position = size
+    for piece in data.split(b"\n")[:-1]:
+        position += len(piece) + 1
+        offsets.append(position)
+    if sys.byteorder == "big":
+        offsets.byteswap()
+
+    with open(line_index_path(blob_file_path), "r+b") as f:
+        # Drops entries an interrupted append may have left, and the end
+        # offset of an unterminated last line, which data now extends
+        f.truncate((line_count + (0 if ends_last_line else 1)) * OFFSET_BYTES)
+        f.seek(0, os.SEEK_END)
+        offsets.tofile(f)
+    return len(offsets) - (1 if ends_last_line else 0)
+
+
+def ensure_line_index(blob_file_path: str) -> None:
+    # Blobs stored before the index existed, or not yet through the parser pool
+    if not os.path.exists(line_index_path(blob_file_path)):
+        build_line_index(blob_file_path)
+
+
+class LineIndex:
+    """
+    Random access to a file's lines through its offset index. Both files
+    are memory-mapped, so fetching a range costs O(range) regardless of
+    where in the file it is; compressed blobs are read a block at a time
+    instead (see blob_compression.BlockReader).
+    """
+
+    def __init__(self, blob_file_path: str):
+        ensure_line_index(blob_file_path)
+        self._files = []
+        self._offsets = self._map(line_index_path(blob_file_path))
+        if blob_compression(blob_file_path):
+            self._data = BlockReader(blob_file_path)
+        else:
+            self._data = self._map(blob_file_path)
+        self.line_count = len(self._offsets) // OFFSET_BYTES - 1 if self._offsets else 0
+
+    def __enter__(self) -> "LineIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for m in (self._offsets, self._data):
+            if m is not None:
+                m.close()
+        for f in self._files:
+            f.close()
+        self._files = []
+
+    def lines(self, start: int, end: int) -> Iterator[Tuple[int, str]]:
+        """Yields (line_no, text) for lines start..end inclusive, clamped to the file."""
+        start = max(start, 1)
+        end = min(end, self.line_count)
+        for line_no in range(start, end + 1):
+            yield line_no, self._line(line_no)
+
+    def select(self, line_numbers: Iterable[int]) -> Iterator[Tuple[int, str]]:
+        """Yields the requested lines that exist, in ascending order."""
+        for line_no in sorted(set(line_numbers)):
+            if 1 <= line_no <= self.line_count:
+                yield line_no, self._line(line_no)
+
+    def _line(self, line_no: int) -> str:
+        begin = self._offset(line_no - 1)
+        end = self._offset(line_no)
+        raw = self._data[begin:end]
+        return raw.decode("utf-8", errors="replace").rstrip("\n").rstrip("\r")
+
+    def _offset(self, i: int) -> int:
+        return int.from_bytes(self._offsets[i * OFFSET_BYTES:(i + 1) * OFFSET_BYTES], "little")
+
+    def _map(self, path: str) -> Optional[mmap.mmap]:
+        f = open(path, "rb")
+        self._files.append(f)
+        if os.fstat(f.fileno()).st_size == 0:
+            return None  # empty files can't be mapped
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_cited_lines(blob_file_path: str, line_numbers: List[int]) -> Tuple[List[Tuple[int, str]], List[int]]:
+    """Splits cited line numbers into (existing lines with their text, numbers past the end of the file)."""
+    with LineIndex(blob_file_path) as index:
+        found = list(index.select(line_numbers))
+        invalid = sorted({n for n in line_numbers if not 1 <= n <= index.line_count})
+    return found, invalid
@@ -0,0 +1,216 @@
+"""
+Appending to an uploaded log, e.g. to follow a live incident without
+re-uploading an ever-growing file.
+
+Blobs are content-addressed and shared between Logs (see blob_store), so
+the first append gives the Log a private copy under a random id. From
+then on every batch of lines is written to the end of the file and each
+piece of derived state is extended rather than rebuilt: line offsets,
+parsed records, index postings (further rows per term), the template
+miner (whose state is kept next to the blob) and a digest chained over
+the appends, which is what answer cache keys use. Findings aggregate the
+whole log, so they are recomputed in the background at most every
+append_findings_interval_seconds.
+
+Appends to a blob are serialised by an exclusive lock on a file next to
+it, which holds across threads and worker processes.
+"""
+import io
+import os
+import glob
+import fcntl
+import shutil
+import hashlib
+import secrets
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+from fastapi import HTTPException
+from sqlalchemy import insert, literal, select
+from sqlalchemy.orm import Session
+from core.config import settings
+from models.log import Log
+from models.log_blob import LogBlob
+from models.log_index import LogIndexTerm
+from services.blob_compression import open_blob
+from services.blob_store import blob_path, release_blob, require_parsed
+from services.file_parser import derive_rows, iter_stream_records, refresh_findings_in_background
+from services.line_index import append_line_index, line_index_path
+from services.log_indexer import append_index
+from services.record_store import append_records, iter_log_lines, last_timestamp, open_records, records_path
+from services.template_miner import TemplateMiner, load_miner, save_miner, write_templates
+from services.threat_analysis import findings_path
+
+LOCK_SUFFIX = ".lock"
+
+COPY_CHUNK_BYTES = 1 << 20
+
+
+@contextmanager
+def append_lock(blob_file_path: str) -> Iterator[None]:
+    with open(blob_file_path + LOCK_SUFFIX, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def append_lines(db: Session, user_id: str, log_id: str, data: bytes) -> dict:
+    """
+    Appends complete lines (data ends with a newline) to one of the user's
+    logs and extends its derived state. Text logs take any lines, JSON logs
+    NDJSON records. Returns the log's new size and line count.
+    """
+    log = db.query(Log).filter(Log.id == log_id, Log.user_id == user_id).first()
+    if not log:
+        raise HTTPException(status_code=404, detail="Log not found or not authorized")
+    blob = live_blob(db, log)
+    path = blob.file_path
+
+    with append_lock(path):
+        # Another appender may have committed while we waited; end the read
+        # transaction begun before the lock, whose snapshot can predate that
+        db.rollback()
+        db.refresh(blob)
+        require_parsed(blob)
+        size, line_count = blob.size_bytes, blob.line_count
+        if size + len(data) > settings.max_decompressed_size_mb * 1024 * 1024:
+            raise HTTPException(status_code=413, detail="Log would exceed the size limit")
+
+        # Parse first, so a batch that isn't valid for the log's format is rejected whole
+        miner = load_miner(path, line_count) or _mine(path, line_count)
+        postings = {}
+        text = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8", errors="replace")
+        records = iter_stream_records(text, blob.record_format, line_count + 1, _year(path))
+        try:
+            rows = list(derive_rows(records, blob.record_format, postings, miner))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Appended data is not valid {blob.record_format}: {e}")
+
+        ends_last_line = size > 0 and _byte_at(path, size - 1) != b"\n"
+        if ends_last_line:
+            data = b"\n" + data
+
+        # Anything past size is left over from an append that failed before its commit
+        with open(path, "r+b") as f:
+            f.truncate(size)
+            f.seek(size)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        added = append_line_index(path, line_count, size, data, ends_last_line)
+        blob.record_count = append_records(path, line_count, rows)
+        save_miner(path, miner, line_count + added)
+        write_templates(path, miner.result())
+
+        append_index(db, blob.sha256, {key: lines.tobytes() for key, lines in postings.items()})
+        blob.size_bytes = log.size_bytes = size + len(data)
+        blob.line_count = log.line_count = line_count + added
+        blob.content_hash = hashlib.sha256(blob.content_hash.encode() + data).hexdigest()
+        db.commit()
+
+    refresh_findings_in_background(path)
+    return {"log_id": log.id, "appended_lines": added, "line_count": log.line_count, "size_bytes": log.size_bytes}
+
+
+def live_blob(db: Session, log: Log) -> LogBlob:
+    """The Log's private blob, copying its shared one on the first append."""
+    blob = db.query(LogBlob).filter(LogBlob.sha256 == log.file_hash).first() if log.file_hash else None
+    if not blob:
+        raise HTTPException(status_code=409, detail="Log was uploaded before parsing was available")
+    require_parsed(blob)
+    if blob.record_format == "sarif":
+        raise HTTPException(status_code=409, detail="SARIF logs can't be appended to")
+    if blob.live_since is not None:
+        return blob
+    return _copy_blob(db, log, blob)
+
+
+def _copy_blob(db: Session, log: Log, blob: LogBlob) -> LogBlob:
+    """
+    Copies a shared blob and its derived files under a random id and points
+    the Log at the copy. Stored decompressed, since appends write in place.
+    """
+    live_id = secrets.token_hex(32)
+    path = blob_path(live_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        with open_blob(blob.file_path) as src, open(path, "wb") as out:
+            shutil.copyfileobj(src, out, COPY_CHUNK_BYTES)
+        for derived in (line_index_path, records_path, findings_path):
+            if os.path.exists(derived(blob.file_path)):
+                shutil.copyfile(derived(blob.file_path), derived(path))
+        miner = _mine(path, blob.line_count)
+        save_miner(path, miner, blob.line_count)
+        write_templates(path, miner.result())
+
+        db.add(LogBlob(
+            sha256=live_id,
+            file_path=path,
+            size_bytes=blob.size_bytes,
+            line_count=blob.line_count,
+            ref_count=1,
+            indexed_at=blob.indexed_at,
+            record_format=blob.record_format,
+            record_count=blob.record_count,
+            parsed_at=blob.parsed_at,
+            live_since=datetime.utcnow(),
+            # The chain starts from the content address of what was uploaded
+            content_hash=blob.sha256
+        ))
+        db.flush()
+        db.execute(insert(LogIndexTerm).from_select(
+            ["blob_hash", "field", "value", "lines"],
+            select(literal(live_id), LogIndexTerm.field, LogIndexTerm.value, LogIndexTerm.lines)
+            .where(LogIndexTerm.blob_hash == blob.sha256)
+        ))
+        # Only if a concurrent first append hasn't moved the Log already
+        moved = db.query(Log).filter(Log.id == log.id, Log.file_hash == blob.sha256).update(
+            {Log.file_hash: live_id, Log.file_path: path}, synchronize_session=False
+        )
+        if moved:
+            release_blob(db, blob.sha256)
+            db.commit()
+    except BaseException:
+        db.rollback()
+        _remove_files(path)
+        raise
+
+    if not moved:
+        db.rollback()
+        _remove_files(path)
+    db.refresh(log)
+    return live_blob(db, log)
+
+
+def _mine(path: str, line_count: int) -> TemplateMiner:
+    # Miner state is missing (the first append) or doesn't match the log
+    # (an append failed after saving it); mine what is there once
+    miner = TemplateMiner()
+    for line_no, text in iter_log_lines(path):
+        if line_no > line_count:
+            break
+        miner.add(line_no, text)
+    return miner
+
+
+def _year(path: str) -> Optional[int]:
+    # Year syslog lines carry on with, as when the log is parsed whole
+    conn = open_records(path)
+    try:
+        ts = last_timestamp(conn)
+    finally:
+        conn.close()
+    return datetime.fromtimestamp(ts, timezone.utc).year if ts is not None else None
+
+
+def _byte_at(path: str, offset: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(1)
+
+
+def _remove_files(path: str) -> None:
+    for leftover in glob.glob(path + "*"):
+        os.remove(leftover)
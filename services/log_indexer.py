@@ -0,0 +1,154 @@
+import os
+import re
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from models.log_blob import LogBlob
+from models.log_index import LogIndexTerm
+from services.blob_compression import open_blob_text
+from services.line_index import LineIndex, line_index_path
+
+# Fields the inverted index understands, each with the patterns that extract it.
+# Every pattern captures the value in its first non-empty group.
+FIELD_PATTERNS = {
+    "ip": [
+        re.compile(r"(?<![\d.])((?:25[0-5]|2[0-4]\d|1?\d?\d)(?:\.(?:25[0-5]|2[0-4]\d|1?\d?\d)){3})(?![\d.])"),
+    ],
+    "user": [
+        re.compile(r"\bfor (?:invalid user )?([\w.@-]+) from\b"),
+        re.compile(r"\buser(?:name)?[\"']?\s*[=:]\s*[\"']?([\w.@\\-]+)", re.IGNORECASE),
+        re.compile(r"^\S+ \S+ ([^\s\-\[][^\s\[]*) \["),  # Apache/nginx combined: host ident user [
+    ],
+    "status": [
+        re.compile(r"\"[A-Z]+ \S+ HTTP/[\d.]+\" ([1-5]\d\d)\b"),
+        re.compile(r"\bstatus(?:_?code)?[\"']?\s*[=:]\s*[\"']?([1-5]\d\d)\b", re.IGNORECASE),
+    ],
+    "port": [
+        re.compile(r"\bport (\d{1,5})\b"),
+        re.compile(r"\b(?:spt|dpt|sport|dport|src_port|dst_port|dest_port|port)[\"']?\s*[=:]\s*[\"']?(\d{1,5})\b", re.IGNORECASE),
+        re.compile(r"(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}:(\d{1,5})\b"),
+    ],
+    "url": [
+        re.compile(r"\b(https?://[^\s\"'<>]+)"),
+        re.compile(r"\"[A-Z]+ (\S+) HTTP/[\d.]+\""),
+    ],
+    "rule_id": [
+        re.compile(r"\"ruleId\"\s*:\s*\"([^\"]+)\""),
+    ],
+}
+
+# severity comes from the parsed record rather than a pattern (see file_parser)
+INDEX_FIELDS = list(FIELD_PATTERNS.keys()) + ["severity"]
+
+
+def extract_entities(line: str) -> Iterator[Tuple[str, str]]:
+    """Yields the distinct (field, value) pairs found in one log line."""
+    seen = set()
+    for field, patterns in FIELD_PATTERNS.items():
+        for pattern in patterns:
+            for match in pattern.finditer(line):
+                value = next((g for g in match.groups() if g), None)
+                if not value or (field, value) in seen:
+                    continue
+                if field == "port" and int(value) > 65535:
+                    continue
+                seen.add((field, value))
+                yield field, value
+
+
+def add_postings(postings: Dict[Tuple[str, str], array], line_no: int, text: str, severity: Optional[str] = None) -> List[Tuple[str, str]]:
+    """
+    Adds the fields found in one record (or raw line) to an in-progress
+    index. Returns them, in the order extract_entities found them.
+    """
+    keys = list(extract_entities(text))
+    if severity:
+        keys.append(("severity", severity))
+    for key in keys:
+        lines = postings.get(key)
+        if lines is None:
+            lines = postings[key] = array("I")
+        lines.append(line_no)
+    return keys
+
+
+def write_index(db: Session, blob: LogBlob, postings: Dict[Tuple[str, str], bytes]) -> int:
+    """
+    Writes a blob's inverted index (field, value -> packed line numbers) to
+    log_index_terms. Indexes are keyed by content hash so every Log sharing
+    the blob shares the index. Returns the term count; the caller commits.
+    """
+    # Rebuilding replaces whatever a previous (possibly interrupted) run left
+    db.query(LogIndexTerm).filter(LogIndexTerm.blob_hash == blob.sha256).delete(synchronize_session=False)
+    db.bulk_insert_mappings(LogIndexTerm, [
+        {"blob_hash": blob.sha256, "field": field, "value": value, "lines": lines}
+        for (field, value), lines in postings.items()
+    ])
+    blob.indexed_at = datetime.utcnow()
+    return len(postings)
+
+
+def append_index(db: Session, sha256: str, postings: Dict[Tuple[str, str], bytes]) -> int:
+    """
+    Adds the postings of lines appended to a blob (see log_append) as
+    further rows per term; search_lines reads every row of a term, so the
+    existing ones are never rewritten. Returns the row count; the caller commits.
+    """
+    db.bulk_insert_mappings(LogIndexTerm, [
+        {"blob_hash": sha256, "field": field, "value": value, "lines": lines}
+        for (field, value), lines in postings.items()
+    ])
+    return len(postings)
+
+
+def search_lines(db: Session, sha256: str, filters: Dict[str, List[str]]) -> List[int]:
+    """
+    Returns the sorted line numbers matching every field in filters.
+    Several values for the same field match any of them. A term may have
+    several rows (one per append), which are merged.
+    """
+    result: Optional[Set[int]] = None
+    for field, values in filters.items():
+        if not values:
+            continue
+        rows = db.query(LogIndexTerm.lines).filter(
+            LogIndexTerm.blob_hash == sha256,
+            LogIndexTerm.field == field,
+            LogIndexTerm.value.in_(values)
+        ).all()
+
+        matched: Set[int] = set()
+        for (packed,) in rows:
+            lines = array("I")
+            lines.frombytes(packed)
+            matched.update(lines)
+
+        result = matched if result is None else result & matched
+        if not result:
+            return []
+
+    return sorted(result or [])
+
+
+def read_lines(file_path: str, line_numbers: Iterable[int]) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (line_no, text) for the requested lines: straight from the
+    line-offset index once it exists, otherwise in a single pass over the file.
+    """
+    wanted = sorted(set(line_numbers))
+    if not wanted:
+        return
+    if os.path.exists(line_index_path(file_path)):
+        with LineIndex(file_path) as index:
+            yield from index.select(wanted)
+        return
+
+    position = 0
+    with open_blob_text(file_path, errors="replace") as f:
+        for line_no, line in enumerate(f, start=1):
+            if line_no == wanted[position]:
+                yield line_no, line.rstrip("\n")
+                position += 1
+                if position == len(wanted):
+                    return
@@ -0,0 +1,119 @@
+"""
+One time-ordered view over several logs, for questions that span sources
+(firewall + auth + web server). Each log is streamed in file order with
+the timestamps parsed at upload (see record_store), and a k-way heap merge
+interleaves the streams, so memory holds one pending line per log however
+large the files are.
+
+Every line is tagged with its log's letter (A, B, ...) and keeps its own
+line number, e.g. B:120, which is how prompts show lines and how answers
+cite them.
+"""
+import re
+import heapq
+from string import ascii_uppercase
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from services.record_store import open_records, iter_record_times, records_count, iter_log_lines
+
+# Most logs one question or search may merge
+MAX_MERGED_LOGS = 10
+
+# Lines of a log without any parsed timestamp sort after every timed line
+UNTIMED = float("inf")
+
+# Citations of merged lines: "B:120", "B:120-130", "B:120 to B:130"
+SOURCE_CITATION = re.compile(r"\b([A-Z]):(\d+)(?:\s*(?:-|–|to)\s*(?:\1:)?(\d+))?")
+MAX_CITED_LINES = 200
+
+
+class MergeSource(NamedTuple):
+    tag: str
+    log_id: str
+    log_type: str
+    path: str
+    # Index-matched lines to merge; None for the whole log
+    line_numbers: Optional[List[int]] = None
+
+
+# (timestamp, position of the source, line_no, text)
+MergedLine = Tuple[float, int, int, str]
+
+
+def source_tags(count: int) -> List[str]:
+    return list(ascii_uppercase[:count])
+
+
+def merged_lines(sources: List[MergeSource]) -> Iterator[MergedLine]:
+    """
+    Lines of every source in timestamp order. Ties keep the order of the
+    sources, and lines within a source stay in file order.
+    """
+    streams = [_timed_lines(i, source) for i, source in enumerate(sources)]
+    try:
+        yield from heapq.merge(*streams)
+    finally:
+        for stream in streams:
+            stream.close()
+
+
+def _timed_lines(position: int, source: MergeSource) -> Iterator[MergedLine]:
+    """
+    A source's lines in file order with their timestamps. Lines that carry
+    none (continuations, stack traces) take the latest one before them, and
+    lines before the first timestamp take that first one, so each stream is
+    ordered as long as the log itself is.
+    """
+    conn = open_records(source.path)
+    if conn is None:
+        raise FileNotFoundError(f"Log {source.log_id} has not been parsed")
+    times = iter_record_times(conn, source.line_numbers)
+    lines = iter_log_lines(source.path, source.line_numbers)
+    try:
+        first = conn.execute("SELECT ts FROM records WHERE ts IS NOT NULL ORDER BY line LIMIT 1").fetchone()
+        current = first[0] if first else UNTIMED
+        pending = next(times, None)
+        for line_no, text in lines:
+            while pending is not None and pending[0] < line_no:
+                pending = next(times, None)
+            if pending is not None and pending[0] == line_no and pending[1] is not None:
+                current = pending[1]
+            yield current, position, line_no, text
+    finally:
+        lines.close()
+        times.close()
+        conn.close()
+
+
+def merged_size(sources: List[MergeSource]) -> int:
+    """Number of lines merged_lines yields."""
+    total = 0
+    for source in sources:
+        if source.line_numbers is not None:
+            total += len(source.line_numbers)
+            continue
+        conn = open_records(source.path)
+        if conn is None:
+            raise FileNotFoundError(f"Log {source.log_id} has not been parsed")
+        try:
+            total += records_count(conn)
+        finally:
+            conn.close()
+    return total
+
+
+def legend(sources: List[MergeSource]) -> str:
+    return "\n".join(f"{s.tag}: {s.log_type} log {s.log_id}" for s in sources)
+
+
+def cited_source_lines(supporting_logs: str) -> Dict[str, List[int]]:
+    """
+    Line numbers per source letter cited in a Supporting Logs section of a
+    merged answer. Ranges are capped as in ai_handler.cited_line_numbers.
+    """
+    cited: Dict[str, set] = {}
+    for m in SOURCE_CITATION.finditer(supporting_logs):
+        first = int(m.group(2))
+        last = int(m.group(3)) if m.group(3) else first
+        lines = cited.setdefault(m.group(1), set())
+        lines.update(range(first, min(last, first + MAX_CITED_LINES) + 1))
+    return {tag: sorted(lines)[:MAX_CITED_LINES] for tag, lines in sorted(cited.items())}
@@ -0,0 +1,75 @@
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models.conversation import Conversation
+from models.question_count import UserQuestionCount, DailyQuestionCount
+
+REBUILD_BATCH = 10_000
+
+
+def count_questions(db: Session, user_id: str, asked_at: datetime, delta: int = 1) -> None:
+    """
+    Adds delta questions for user_id on the day of asked_at to both counter
+    tables. Call in the same transaction that adds or removes the
+    conversations, so the counts never drift from them.
+    """
+    _bump(db, UserQuestionCount, {"user_id": user_id}, delta)
+    _bump(db, DailyQuestionCount, {"user_id": user_id, "day": asked_at.date()}, delta)
+
+
+def uncount_log_questions(db: Session, log_id: str) -> None:
+    """Takes a log's conversations off the counters; call before deleting them."""
+    rows = db.query(Conversation.user_id, Conversation.created_at).filter(Conversation.log_id == log_id)
+    for (user_id, day), n in _per_user_day(rows).items():
+        _bump(db, UserQuestionCount, {"user_id": user_id}, -n)
+        _bump(db, DailyQuestionCount, {"user_id": user_id, "day": day}, -n)
+
+
+def rebuild_question_counts(db: Session) -> int:
+    """
+    Recomputes both counter tables from the conversations table in one pass.
+    Only needed once, for databases that have history from before the
+    counters existed. Returns the number of conversations counted.
+    """
+    rows = db.query(Conversation.user_id, Conversation.created_at).yield_per(REBUILD_BATCH)
+    per_day = _per_user_day(rows)
+    per_user = Counter()
+    for (user_id, _), n in per_day.items():
+        per_user[user_id] += n
+
+    db.query(DailyQuestionCount).delete(synchronize_session=False)
+    db.query(UserQuestionCount).delete(synchronize_session=False)
+    db.bulk_insert_mappings(UserQuestionCount, [{"user_id": u, "questions": n} for u, n in per_user.items()])
+    db.bulk_insert_mappings(DailyQuestionCount, [{"user_id": u, "day": d, "questions": n} for (u, d), n in per_day.items()])
+    db.commit()
+    return sum(per_user.values())
+
+
+def counters_missing(db: Session) -> bool:
+    # History without counters means the database predates them
+    return (
+        db.query(UserQuestionCount.user_id).first() is None
+        and db.query(Conversation.id).first() is not None
+    )
+
+
+def _per_user_day(rows: Iterable[Tuple[str, datetime]]) -> Counter:
+    counts = Counter()
+    for user_id, created_at in rows:
+        counts[(user_id, (created_at or datetime.utcnow()).date())] += 1
+    return counts
+
+
+def _bump(db: Session, model, key: dict, delta: int) -> None:
+    # Single UPDATE so concurrent requests can't lose an increment
+    query = db.query(model).filter_by(**key)
+    if query.update({model.questions: model.questions + delta}, synchronize_session=False):
+        return
+    try:
+        with db.begin_nested():
+            db.add(model(**key, questions=delta))
+    except IntegrityError:
+        # A concurrent request inserted the row first
+        query.update({model.questions: model.questions + delta}, synchronize_session=False)
@@ -0,0 +1,215 @@
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional, Tuple
+from core.files import atomic_path
+from services.blob_compression import open_blob_text
+from services.log_indexer import read_lines
+
+# Normalised records live next to the blob they were parsed from, in a small
+# SQLite file per blob (see blob_path), so they are shared by every Log with
+# the same content and deleted with it
+RECORDS_SUFFIX = ".records.db"
+
+WRITE_BATCH = 10_000
+
+# Bump when the schema changes; older stores are rebuilt on next use
+RECORDS_VERSION = "2"
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE records (
+    line INTEGER PRIMARY KEY,
+    ts REAL,
+    source TEXT,
+    severity TEXT,
+    message TEXT NOT NULL,
+    -- entities for the threat pre-analysis (see file_parser.entity_columns)
+    ip TEXT,
+    peer_ip TEXT,
+    user TEXT,
+    status INTEGER,
+    port INTEGER,
+    auth_failure INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+INSERT = f"INSERT OR REPLACE INTO records VALUES ({', '.join('?' * 11)})"
+
+
+def records_path(blob_file_path: str) -> str:
+    return blob_file_path + RECORDS_SUFFIX
+
+
+def write_records(out_path: str, fmt: str, records: Iterable[tuple]) -> int:
+    """
+    Writes record rows (one value per records column) to a fresh store at
+    out_path, replacing any previous one atomically. Returns the row count.
+    """
+    with atomic_path(out_path) as tmp_path:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            # Scratch file until atomic_path renames it, so durability settings can go
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.executescript(SCHEMA)
+
+            count = 0
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) >= WRITE_BATCH:
+                    conn.executemany(INSERT, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                conn.executemany(INSERT, batch)
+                count += len(batch)
+
+            conn.execute("CREATE INDEX ix_records_ts ON records (ts) WHERE ts IS NOT NULL")
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [("format", fmt), ("records", str(count)), ("version", RECORDS_VERSION)])
+            conn.commit()
+        finally:
+            conn.close()
+    return count
+
+
+def append_records(blob_file_path: str, after_line: int, records: List[tuple]) -> int:
+    """
+    Adds record rows for lines after after_line to a blob's existing store
+    (see services.log_append). Rows past after_line left by an append that
+    failed before it was committed are replaced. Returns the new row count.
+    """
+    conn = sqlite3.connect(records_path(blob_file_path), timeout=30)
+    try:
+        count = records_count(conn)
+        count -= conn.execute("DELETE FROM records WHERE line > ?", (after_line,)).rowcount
+        conn.executemany(INSERT, records)
+        count += len(records)
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('records', ?)", (str(count),))
+        conn.commit()
+    finally:
+        conn.close()
+    return count
+
+
+def last_timestamp(conn: sqlite3.Connection) -> Optional[float]:
+    # Walks back from the last line; filtering on ts in SQL would plan
+    # through the partial ts index and sort the whole store
+    for (ts,) in conn.execute("SELECT ts FROM records ORDER BY line DESC"):
+        if ts is not None:
+            return ts
+    return None
+
+
+def open_records(blob_file_path: str) -> Optional[sqlite3.Connection]:
+    """Read-only connection to a blob's record store, or None if it hasn't been parsed."""
+    path = records_path(blob_file_path)
+    if not os.path.exists(path):
+        return None
+    # Readers are generators that chunked analysis advances with
+    # asyncio.to_thread, so from whichever worker thread is free; only one
+    # thread uses a connection at a time
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+
+def records_version(conn: sqlite3.Connection) -> Optional[str]:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    return row[0] if row else None
+
+
+def records_format(conn: sqlite3.Connection) -> str:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+    return row[0] if row else "text"
+
+
+def records_count(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'records'").fetchone()
+    return int(row[0]) if row else conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+
+def iter_records(conn: sqlite3.Connection, line_numbers: Optional[Iterable[int]] = None) -> Iterator[tuple]:
+    """Yields stored records in line order, optionally only those starting on line_numbers."""
+    return _select(conn, "line, ts, source, severity, message", line_numbers)
+
+
+def iter_record_times(conn: sqlite3.Connection, line_numbers: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, Optional[float]]]:
+    """(line, timestamp) of stored records in line order, like iter_records without the text."""
+    return _select(conn, "line, ts", line_numbers)
+
+
+def _select(conn: sqlite3.Connection, columns: str, line_numbers: Optional[Iterable[int]]) -> Iterator[tuple]:
+    if line_numbers is None:
+        yield from conn.execute(f"SELECT {columns} FROM records ORDER BY line")
+        return
+
+    wanted = sorted(set(line_numbers))
+    # Stay well under SQLite's bound-parameter limit
+    for i in range(0, len(wanted), 500):
+        batch = wanted[i:i + 500]
+        yield from conn.execute(
+            f"SELECT {columns} FROM records WHERE line IN ({','.join('?' * len(batch))}) ORDER BY line",
+            batch
+        )
+
+
+def render_record(record: tuple) -> str:
+    """One-line text form of a record, as shown to the model and in search results."""
+    _, ts, source, severity, message = record
+    parts = []
+    if ts is not None:
+        parts.append(datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z"))
+    if severity:
+        parts.append(severity.upper())
+    if source:
+        parts.append(f"{source}:")
+    parts.append(message)
+    return " ".join(parts)
+
+
+def structured_lines(blob_file_path: str, line_numbers: Optional[Iterable[int]] = None) -> Optional[Iterator[Tuple[int, str]]]:
+    """
+    (line_no, text) for a JSON or SARIF blob, rendered from its parsed
+    records; None for line-oriented logs (whose raw lines are already the
+    most faithful text) and for blobs that haven't been parsed yet.
+    """
+    conn = open_records(blob_file_path)
+    if conn is None:
+        return None
+    if records_format(conn) == "text":
+        conn.close()
+        return None
+    return _render_all(conn, line_numbers)
+
+
+def _render_all(conn: sqlite3.Connection, line_numbers: Optional[Iterable[int]]) -> Iterator[Tuple[int, str]]:
+    try:
+        for record in iter_records(conn, line_numbers):
+            yield record[0], render_record(record)
+    finally:
+        conn.close()
+
+
+def iter_log_lines(blob_file_path: str, line_numbers: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, str]]:
+    """
+    The text of a log as (line_no, text) pairs, for prompts and search
+    results: parsed records for structured logs, raw lines otherwise.
+    """
+    structured = structured_lines(str(blob_file_path), line_numbers)
+    if structured is not None:
+        yield from structured
+    elif line_numbers is not None:
+        yield from read_lines(str(blob_file_path), line_numbers)
+    else:
+        with open_blob_text(blob_file_path, errors="replace") as f:
+            for line_no, line in enumerate(f, start=1):
+                yield line_no, line.rstrip("\n")
+
+
+def load_log_text(blob_file_path: str) -> str:
+    """Whole-log text for a single prompt, with the same choice of source as iter_log_lines."""
+    structured = structured_lines(str(blob_file_path))
+    if structured is not None:
+        return "\n".join(text for _, text in structured)
+    with open_blob_text(blob_file_path) as f:
+        return f.read()
@@ -0,0 +1,87 @@
+import re
+import time
+import asyncio
+import hashlib
+from core.config import settings
+
+# Lines sent to the model are prefixed with their line number ("12: ...", or
+# "B:12: ..." in merged timelines), and merge prompts carry earlier
+# citations ("Line 12: ...")
+NUMBERED_LINE = re.compile(r"^\s*(?:Supporting Logs: )?(?:Line )?((?:[A-Z]:)?\d+): (.*)$")
+
+# Batch prompts number their questions and ask for one answer per question,
+# each opened by a "### Question <n>" line
+BATCH_QUESTION = re.compile(r"^\s*Question (\d+): ", re.MULTILINE)
+BATCH_MARKER = "### Question"
+
+STREAM_CHUNK_CHARS = 16
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubModel:
+    """
+    Deterministic local stand-in for the Gemini GenerativeModel, used when
+    settings.gemini_model is "stub". It answers in the same emoji-sectioned
+    format as Gemini, citing the numbered lines it finds in the prompt, with
+    configurable latency and response size.
+    """
+
+    def __init__(self, latency_ms: int = None, response_lines: int = None):
+        self.latency_ms = settings.gemini_stub_latency_ms if latency_ms is None else latency_ms
+        self.response_lines = settings.gemini_stub_response_lines if response_lines is None else response_lines
+
+    def generate_content(self, prompt: str, stream: bool = False) -> StubResponse:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return StubResponse(self.render(prompt))
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        if stream:
+            return self._stream(self.render(prompt))
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return StubResponse(self.render(prompt))
+
+    async def _stream(self, text: str):
+        # Spread the latency over small chunks, like a token stream
+        pieces = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+        for piece in pieces:
+            if self.latency_ms:
+                await asyncio.sleep(self.latency_ms / 1000 / len(pieces))
+            yield StubResponse(piece)
+
+    def render(self, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+        cited = []
+        for line in prompt.splitlines():
+            match = NUMBERED_LINE.match(line)
+            if match:
+                ref = match.group(1)
+                cited.append(f"{ref}: {match.group(2).strip()}" if ":" in ref else f"Line {ref}: {match.group(2).strip()}")
+            if len(cited) >= self.response_lines:
+                break
+
+        questions = BATCH_QUESTION.findall(prompt) if BATCH_MARKER in prompt else []
+        if not questions:
+            return self._answer(prompt, digest, cited)
+        return "\n".join(
+            f"### Question {n}\n" + self._answer(prompt, f"{digest} question {n}", cited)
+            for n in questions
+        )
+
+    def _answer(self, prompt: str, digest: str, cited: list) -> str:
+        filler = [f"Stub observation {i + 1} for prompt {digest}." for i in range(self.response_lines)]
+        return "\n".join([
+            "🔍 Insights",
+            *filler,
+            "🧠 Reasoning",
+            f"Prompt of {len(prompt)} characters analysed by the local stub model.",
+            "📄 Supporting Logs",
+            *(cited or ["No numbered log lines in prompt."]),
+            "🛠️ Fixes",
+            "Review the cited lines and rotate any exposed credentials.",
+        ])
@@ -0,0 +1,277 @@
+import re
+import json
+import pickle
+from typing import Dict, Iterable, List, Optional, Tuple
+from core.files import atomic_write
+
+# Mined templates are stored next to the blob they describe (see blob_path)
+TEMPLATES_SUFFIX = ".templates.json"
+
+# Miner state of logs being appended to, so appends extend their templates
+MINER_SUFFIX = ".miner.pickle"
+
+# Bump when mining or the stored format changes; stale files are re-mined
+MINER_VERSION = 1
+
+WILDCARD = "<*>"
+
+# Drain parameters: prefix tokens used to route a line through the tree,
+# how similar a line must be to join a template, and how wide a node may grow
+TREE_DEPTH = 2
+SIMILARITY = 0.5
+MAX_CHILDREN = 100
+
+SAMPLES_PER_TEMPLATE = 3
+# Values counted per <*> position (Misra-Gries: any value on more than
+# 1/MAX_TRACKED_VALUES of a template's lines is kept, counts are lower
+# bounds), and how many of the most common are stored and shown
+MAX_TRACKED_VALUES = 50
+TOP_VALUES = 5
+SHOWN_VALUES = 3
+RARE_COUNT = SAMPLES_PER_TEMPLATE  # templates this rare are sent as their verbatim lines
+MAX_STORED_TEMPLATES = 5000
+
+HAS_DIGIT = re.compile(r"\d")
+
+
+class Template:
+    __slots__ = ("id", "tokens", "count", "first_line", "last_line", "samples", "values")
+
+    def __init__(self, template_id: int, tokens: List[str], line_no: int):
+        self.id = template_id
+        self.tokens = tokens
+        self.count = 0
+        self.first_line = line_no
+        self.last_line = line_no
+        self.samples: List[Tuple[int, List[str]]] = []
+        # Per <*> position: value -> count
+        self.values: Dict[int, Dict[str, int]] = {}
+
+
+class TemplateMiner:
+    """
+    Streaming Drain-style log template miner (He et al., "Drain: An Online
+    Log Parsing Approach with Fixed Depth Tree", ICWS 2017). Lines are
+    routed by token count and their first tokens to a small group of
+    templates, joined to the most similar one (differing tokens become
+    <*>), or start a new template. Memory grows with the number of
+    templates, not lines.
+    """
+
+    def __init__(self):
+        self.templates: List[Template] = []
+        self.lines = 0
+        self.chars = 0
+        self._root: Dict = {}
+
+    def add(self, line_no: int, text: str) -> Template:
+        self.lines += 1
+        self.chars += len(text) + 1
+        tokens = text.split()
+
+        leaf = self._leaf(tokens)
+        template = self._best_match(leaf, tokens)
+        if template is None:
+            template = Template(len(self.templates), list(tokens), line_no)
+            self.templates.append(template)
+            leaf.append(template)
+        else:
+            for i, (have, new) in enumerate(zip(template.tokens, tokens)):
+                if have != new and have != WILDCARD:
+                    template.tokens[i] = WILDCARD
+                    # Every earlier line had the old constant here
+                    template.values[i] = {have: template.count}
+
+        template.count += 1
+        for i, counts in template.values.items():
+            value = tokens[i]
+            if value in counts:
+                counts[value] += 1
+            elif len(counts) < MAX_TRACKED_VALUES:
+                counts[value] = 1
+            else:
+                for tracked in list(counts):
+                    counts[tracked] -= 1
+                    if not counts[tracked]:
+                        del counts[tracked]
+        template.last_line = line_no
+        if len(template.samples) < SAMPLES_PER_TEMPLATE:
+            template.samples.append((line_no, tokens))
+        return template
+
+    def _leaf(self, tokens: List[str]) -> List[Template]:
+        node = self._root.setdefault(len(tokens), {})
+        for depth, token in enumerate(tokens[:TREE_DEPTH]):
+            last = depth == min(TREE_DEPTH, len(tokens)) - 1
+            # Tokens with digits are usually variables; route them together
+            key = WILDCARD if HAS_DIGIT.search(token) else token
+            if key not in node and len(node) >= MAX_CHILDREN:
+                key = WILDCARD
+            node = node.setdefault(key, [] if last else {})
+        if isinstance(node, dict):
+            # Empty line: everything lands in one group
+            node = node.setdefault(WILDCARD, [])
+        return node
+
+    @staticmethod
+    def _best_match(leaf: List[Template], tokens: List[str]) -> Optional[Template]:
+        best, best_score, best_wild = None, -1.0, -1
+        n = len(tokens) or 1
+        for template in leaf:
+            same = wild = 0
+            for have, new in zip(template.tokens, tokens):
+                if have == WILDCARD:
+                    wild += 1
+                elif have == new:
+                    same += 1
+            score = same / n
+            if score > best_score or (score == best_score and wild > best_wild):
+                best, best_score, best_wild = template, score, wild
+        if best is not None and (best_score >= SIMILARITY or not tokens):
+            return best
+        return None
+
+    def result(self) -> dict:
+        """JSON-ready templates, most frequent first, with the sample values of each <*>."""
+        ordered = sorted(self.templates, key=lambda t: (-t.count, t.first_line))
+        stored = ordered[:MAX_STORED_TEMPLATES]
+        doc = {
+            "version": MINER_VERSION,
+            "lines": self.lines,
+            "raw_chars": self.chars,
+            "template_count": len(self.templates),
+            "omitted_lines": sum(t.count for t in ordered[MAX_STORED_TEMPLATES:]),
+            "templates": [
+                {
+                    "template": " ".join(t.tokens),
+                    "count": t.count,
+                    "first_line": t.first_line,
+                    "last_line": t.last_line,
+                    "samples": [[line_no, _params(t.tokens, tokens)] for line_no, tokens in t.samples],
+                    "values": [_top_values(t.values.get(i, {}), t.count)
+                               for i, token in enumerate(t.tokens) if token == WILDCARD],
+                }
+                for t in stored
+            ],
+        }
+        doc["compact_chars"] = len(render_compact(doc))
+        return doc
+
+
+def mine(lines: Iterable[Tuple[int, str]]) -> dict:
+    miner = TemplateMiner()
+    for line_no, text in lines:
+        miner.add(line_no, text)
+    return miner.result()
+
+
+def render_compact(doc: dict, max_chars: Optional[int] = None) -> str:
+    """
+    Prompt text for a mined log: frequent templates with counts, line spans
+    and example values, then rare lines verbatim with their line numbers.
+    With max_chars, whatever doesn't fit is dropped and counted instead.
+    """
+    frequent = [t for t in doc["templates"] if t["count"] > RARE_COUNT]
+    rare = sorted(
+        (line_no, _fill(t["template"], params))
+        for t in doc["templates"] if t["count"] <= RARE_COUNT
+        for line_no, params in t["samples"]
+    )
+
+    out = [
+        f"Compacted log: {doc['lines']} lines grouped into {doc['template_count']} templates. "
+        f"{WILDCARD} marks a variable part. Frequent templates are listed as "
+        f"[count, first-last line] template | most common values of each {WILDCARD} with counts | "
+        f"example line numbers and values; rare lines follow verbatim."
+    ]
+    size = len(out[0])
+    omitted_templates = omitted_rare = 0
+
+    if frequent:
+        out.append("Templates:")
+    for t in frequent:
+        examples = "; ".join(f"line {line_no}: {', '.join(params)}" if params else f"line {line_no}"
+                             for line_no, params in t["samples"])
+        values = "; ".join(f"#{i}: {_shown_values(v['top'], t['count'])}"
+                           for i, v in enumerate(t.get("values", []), start=1))
+        bare = f"[{t['count']}x, lines {t['first_line']}-{t['last_line']}] {t['template']}"
+        entry = f"{bare} | {values} | {examples}" if values else f"{bare} | {examples}"
+        if max_chars is not None and size + len(entry) + 1 > max_chars:
+            # Keep the frequent template itself even without its details
+            entry = bare
+            if size + len(entry) + 1 > max_chars:
+                omitted_templates += 1
+                continue
+        out.append(entry)
+        size += len(entry) + 1
+
+    if rare:
+        out.append("Rare lines:")
+    for line_no, text in rare:
+        entry = f"{line_no}: {text}"
+        if max_chars is not None and size + len(entry) + 1 > max_chars:
+            omitted_rare += 1
+            continue
+        out.append(entry)
+        size += len(entry) + 1
+
+    if omitted_templates or omitted_rare or doc.get("omitted_lines"):
+        out.append(f"[omitted to fit: {omitted_templates} templates, {omitted_rare} rare lines, "
+                   f"{doc.get('omitted_lines', 0)} lines of the least frequent templates]")
+    return "\n".join(out)
+
+
+def templates_path(blob_file_path: str) -> str:
+    return blob_file_path + TEMPLATES_SUFFIX
+
+
+def write_templates(blob_file_path: str, doc: dict) -> None:
+    atomic_write(templates_path(blob_file_path), json.dumps(doc))
+
+
+def load_templates(blob_file_path: str) -> Optional[dict]:
+    try:
+        with open(templates_path(blob_file_path), encoding="utf-8") as f:
+            doc = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return doc if doc.get("version") == MINER_VERSION else None
+
+
+def save_miner(blob_file_path: str, miner: TemplateMiner, line_count: int) -> None:
+    """Stores a miner that has seen the blob's first line_count lines."""
+    atomic_write(blob_file_path + MINER_SUFFIX, pickle.dumps((MINER_VERSION, line_count, miner), pickle.HIGHEST_PROTOCOL))
+
+
+def load_miner(blob_file_path: str, line_count: int) -> Optional[TemplateMiner]:
+    """The stored miner if it has seen exactly the first line_count lines, else None."""
+    try:
+        with open(blob_file_path + MINER_SUFFIX, "rb") as f:
+            version, seen, miner = pickle.load(f)
+    except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+        return None
+    return miner if version == MINER_VERSION and seen == line_count else None
+
+
+def _params(template_tokens: List[str], tokens: List[str]) -> List[str]:
+    # Values of a line at its template's wildcard positions
+    return [token for have, token in zip(template_tokens, tokens) if have == WILDCARD]
+
+
+def _top_values(counts: Dict[str, int], total: int) -> dict:
+    top = sorted(counts.items(), key=lambda kv: -kv[1])[:TOP_VALUES]
+    return {"top": [list(kv) for kv in top], "other": total - sum(c for _, c in top)}
+
+
+def _shown_values(top: List[list], total: int) -> str:
+    # Values seen once say nothing a sample line doesn't
+    shown = [(value, count) for value, count in top[:SHOWN_VALUES] if count > 1]
+    if not shown:
+        return "many different"
+    other = total - sum(count for _, count in shown)
+    return ", ".join(f"{value} ({count})" for value, count in shown) + (f", other ({other})" if other else "")
+
+
+def _fill(template: str, params: List[str]) -> str:
+    values = iter(params)
+    return " ".join(next(values, WILDCARD) if token == WILDCARD else token for token in template.split(" "))
@@ -0,0 +1,81 @@
+import json
+from typing import Optional
+from core.files import atomic_write
+from services.record_store import RECORDS_VERSION, open_records, records_version
+
+# Deterministic pre-analysis of a blob's parsed records, computed once per
+# blob (in the parser pool) and stored next to it as JSON
+FINDINGS_SUFFIX = ".findings.json"
+
+# Bump when the analysis or its output changes; stale files are recomputed
+ANALYSIS_VERSION = 1
+
+
+def findings_path(blob_file_path: str) -> str:
+    return blob_file_path + FINDINGS_SUFFIX
+
+
+def write_findings(blob_file_path: str) -> Optional[dict]:
+    """Runs the pre-analysis over a blob's record store and saves the result; None if it isn't parsed."""
+    from services.threat_stats import analyse, load_columns
+
+    conn = open_records(blob_file_path)
+    if conn is None:
+        return None
+    try:
+        if records_version(conn) != RECORDS_VERSION:
+            return None
+        findings = {"version": ANALYSIS_VERSION, **analyse(load_columns(conn))}
+    finally:
+        conn.close()
+
+    atomic_write(findings_path(blob_file_path), json.dumps(findings))
+    return findings
+
+
+def load_findings(blob_file_path: str) -> Optional[dict]:
+    """
+    Stored findings for a blob, computing them if the records are current
+    but the findings are missing or stale. None if the blob needs (re)parsing.
+    """
+    try:
+        with open(findings_path(blob_file_path), encoding="utf-8") as f:
+            findings = json.load(f)
+        if findings.get("version") == ANALYSIS_VERSION:
+            return findings
+    except (OSError, ValueError):
+        pass
+    return write_findings(blob_file_path)
+
+
+def prompt_summary(blob_file_path: str) -> Optional[str]:
+    # Only reads what the upload pipeline stored; never computes in a request
+    try:
+        with open(findings_path(blob_file_path), encoding="utf-8") as f:
+            findings = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if findings.get("version") != ANALYSIS_VERSION:
+        return None
+    return summarise_findings(findings)
+
+
+# ---- prompt summary ----
+
+def summarise_findings(findings: dict, max_findings: int = 15) -> str:
+    """A few lines of aggregates for the prompt, instead of the raw lines they summarise."""
+    out = [f"Records: {findings['records']}"
+           + (f", from {findings['first_seen']} to {findings['last_seen']}" if findings.get("first_seen") else "")]
+    for key, label in (("top_ips", "Top IPs"), ("top_users", "Top users")):
+        talkers = findings.get(key) or []
+        if talkers:
+            out.append(f"{label}: " + ", ".join(
+                f"{t['value']} ({t['events']} events, {t['errors']} errors, {t['auth_failures']} auth failures)"
+                for t in talkers[:5]
+            ))
+    for finding in (findings.get("findings") or [])[:max_findings]:
+        lines = ", ".join(str(n) for n in finding["lines"])
+        out.append(f"- [{finding['type']}] {finding['subject']}: {finding['detail']} (e.g. lines {lines})")
+    if not findings.get("findings"):
+        out.append("No brute force, scan, fan-out or spike patterns over the thresholds.")
+    return "\n".join(out)
@@ -0,0 +1,229 @@
+import math
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# The NumPy half of the threat pre-analysis (see threat_analysis): kept
+# separate so that reading stored findings doesn't import NumPy
+
+BUCKET_SECONDS = 60
+MAX_BUCKETS = 100_000       # wider buckets for logs spanning a long time
+TOP_N = 10
+BRUTE_FORCE_FAILURES = 10   # auth failures from one IP within one bucket
+PORT_SCAN_PORTS = 15        # distinct destination ports touched by one IP
+FAN_OUT_HOSTS = 20          # distinct destination IPs contacted by one IP
+SPIKE_MIN_EVENTS = 10       # a bucket needs at least this many events to be a spike
+SPIKE_SCORE = 3.5           # robust z-score (median/MAD) above which a bucket is a spike
+SAMPLE_LINES = 5
+MAX_FINDINGS_PER_TYPE = 20
+
+
+def load_columns(conn) -> Dict[str, np.ndarray]:
+    rows = conn.execute(
+        "SELECT line, ts, ip, peer_ip, user, status, port, auth_failure FROM records ORDER BY line"
+    ).fetchall()
+    if not rows:
+        return {"line": np.zeros(0, dtype=np.int64)}
+    line, ts, ip, peer_ip, user, status, port, auth_failure = zip(*rows)
+
+    columns = {
+        "line": np.array(line, dtype=np.int64),
+        "ts": np.array(ts, dtype=np.float64),  # None becomes NaN
+        "status": np.nan_to_num(np.array(status, dtype=np.float64)).astype(np.int32),
+        "port": np.nan_to_num(np.array(port, dtype=np.float64)).astype(np.int32),
+        "auth_failure": np.array(auth_failure, dtype=bool),
+    }
+    for name, values in (("ip", ip), ("peer_ip", peer_ip), ("user", user)):
+        columns[name], columns[name + "_values"] = _factorize(values)
+    return columns
+
+
+def analyse(columns: Dict[str, np.ndarray]) -> dict:
+    """
+    Computes top talkers, their time-bucketed activity, and findings for
+    brute force, port scans, fan-out and volume/error spikes. Every count is
+    exact, over all records; nothing is sampled.
+    """
+    line = columns["line"]
+    result = {"records": int(len(line)), "bucket_seconds": BUCKET_SECONDS,
+              "first_seen": None, "last_seen": None, "top_ips": [], "top_users": [], "findings": []}
+    if not len(line):
+        return result
+
+    ts = columns["ts"]
+    has_ts = ~np.isnan(ts)
+    bucket_seconds = BUCKET_SECONDS
+    bucket = np.full(len(line), -1, dtype=np.int64)
+    if has_ts.any():
+        first, last = float(ts[has_ts].min()), float(ts[has_ts].max())
+        span = last - first
+        if span / bucket_seconds > MAX_BUCKETS:
+            bucket_seconds = int(math.ceil(span / MAX_BUCKETS))
+        bucket[has_ts] = ((ts[has_ts] - first) // bucket_seconds).astype(np.int64)
+        result.update(first_seen=_iso(first), last_seen=_iso(last), bucket_seconds=bucket_seconds)
+        origin = first
+    else:
+        origin = None
+
+    ctx = {
+        "line": line, "ts": ts, "has_ts": has_ts, "bucket": bucket,
+        "bucket_seconds": bucket_seconds, "origin": origin,
+        "status": columns["status"],
+        "failed": columns["auth_failure"] | (columns["status"] == 401) | (columns["status"] == 403),
+    }
+
+    result["top_ips"] = _top_talkers(ctx, columns["ip"], columns["ip_values"])
+    result["top_users"] = _top_talkers(ctx, columns["user"], columns["user_values"])
+
+    findings = result["findings"]
+    findings += _brute_force(ctx, columns["ip"], columns["ip_values"], columns["user"])
+    findings += _distinct_per_ip(ctx, columns["ip"], columns["ip_values"], columns["port"], columns["port"] > 0,
+                                 PORT_SCAN_PORTS, "port_scan", "distinct destination ports")
+    findings += _distinct_per_ip(ctx, columns["ip"], columns["ip_values"], columns["peer_ip"], columns["peer_ip"] >= 0,
+                                 FAN_OUT_HOSTS, "fan_out", "distinct destination hosts")
+    if has_ts.any():
+        findings += _spikes(ctx, np.ones(len(line), dtype=bool), "rate_spike", "events", columns["ip"], columns["ip_values"])
+        findings += _spikes(ctx, (ctx["status"] >= 400) & (ctx["status"] < 500), "error_spike", "4xx responses", columns["ip"], columns["ip_values"])
+        findings += _spikes(ctx, ctx["status"] >= 500, "error_spike", "5xx responses", columns["ip"], columns["ip_values"])
+    return result
+
+
+def _top_talkers(ctx: dict, codes: np.ndarray, values: List[str]) -> List[dict]:
+    known = codes >= 0
+    if not known.any():
+        return []
+    n = len(values)
+    events = np.bincount(codes[known], minlength=n)
+    errors = np.bincount(codes[known & (ctx["status"] >= 400)], minlength=n)
+    failures = np.bincount(codes[known & ctx["failed"]], minlength=n)
+
+    talkers = []
+    for code in np.argsort(-events, kind="stable")[:TOP_N]:
+        mine = codes == code
+        timed = mine & ctx["has_ts"]
+        entry = {
+            "value": values[code],
+            "events": int(events[code]),
+            "errors": int(errors[code]),
+            "auth_failures": int(failures[code]),
+            "first_seen": None,
+            "last_seen": None,
+            "buckets": [],
+        }
+        if timed.any():
+            entry["first_seen"] = _iso(float(ctx["ts"][timed].min()))
+            entry["last_seen"] = _iso(float(ctx["ts"][timed].max()))
+            buckets, counts = np.unique(ctx["bucket"][timed], return_counts=True)
+            entry["buckets"] = [[_bucket_start(ctx, b), int(c)] for b, c in zip(buckets, counts)]
+        talkers.append(entry)
+    return talkers
+
+
+def _brute_force(ctx: dict, ip: np.ndarray, ip_values: List[str], user: np.ndarray) -> List[dict]:
+    mask = ctx["failed"] & (ip >= 0)
+    if not mask.any():
+        return []
+    pairs = np.stack([ip[mask], ctx["bucket"][mask]], axis=1)
+    unique, inverse, counts = np.unique(pairs, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+
+    findings = []
+    for k in np.argsort(-counts, kind="stable"):
+        if counts[k] < BRUTE_FORCE_FAILURES or len(findings) >= MAX_FINDINGS_PER_TYPE:
+            break
+        ip_code, b = unique[k]
+        hit = inverse == k
+        users = user[mask][hit]
+        distinct_users = len(np.unique(users[users >= 0]))
+        window = f"within {ctx['bucket_seconds']}s from {_bucket_start(ctx, b)}" if b >= 0 else "(no timestamps)"
+        findings.append(_finding(
+            "brute_force", ip_values[ip_code], int(counts[k]), _bucket_start(ctx, b),
+            f"{int(counts[k])} failed authentications {window}, against {distinct_users} distinct users",
+            ctx["line"][mask][hit]
+        ))
+    return findings
+
+
+def _distinct_per_ip(ctx: dict, ip: np.ndarray, ip_values: List[str], other: np.ndarray, valid: np.ndarray,
+                     threshold: int, kind: str, noun: str) -> List[dict]:
+    mask = (ip >= 0) & valid
+    if not mask.any():
+        return []
+    pairs = np.unique(np.stack([ip[mask], other[mask]], axis=1), axis=0)
+    distinct = np.bincount(pairs[:, 0], minlength=len(ip_values))
+
+    findings = []
+    for code in np.argsort(-distinct, kind="stable"):
+        if distinct[code] < threshold or len(findings) >= MAX_FINDINGS_PER_TYPE:
+            break
+        mine = mask & (ip == code)
+        first = float(ctx["ts"][mine & ctx["has_ts"]].min()) if (mine & ctx["has_ts"]).any() else None
+        findings.append(_finding(
+            kind, ip_values[code], int(distinct[code]), _iso(first) if first is not None else None,
+            f"{int(distinct[code])} {noun} from one source",
+            ctx["line"][mine]
+        ))
+    return findings
+
+
+def _spikes(ctx: dict, mask: np.ndarray, kind: str, noun: str, ip: np.ndarray, ip_values: List[str]) -> List[dict]:
+    timed = mask & ctx["has_ts"]
+    if not timed.any():
+        return []
+    n_buckets = int(ctx["bucket"][ctx["has_ts"]].max()) + 1
+    counts = np.bincount(ctx["bucket"][timed], minlength=n_buckets)
+    median = float(np.median(counts))
+    mad = float(np.median(np.abs(counts - median)))
+    # 1.4826 * MAD estimates the standard deviation; floor it so a flat baseline still needs a real jump
+    score = (counts - median) / max(1.4826 * mad, 1.0)
+
+    findings = []
+    for b in np.argsort(-score, kind="stable"):
+        if score[b] < SPIKE_SCORE or counts[b] < SPIKE_MIN_EVENTS or len(findings) >= MAX_FINDINGS_PER_TYPE:
+            break
+        hit = timed & (ctx["bucket"] == b)
+        contributors = ip[hit]
+        contributors = contributors[contributors >= 0]
+        top = ""
+        if len(contributors):
+            codes, per_ip = np.unique(contributors, return_counts=True)
+            top = f", mostly from {ip_values[codes[per_ip.argmax()]]} ({int(per_ip.max())})"
+        findings.append(_finding(
+            kind, noun, int(counts[b]), _bucket_start(ctx, b),
+            f"{int(counts[b])} {noun} in {ctx['bucket_seconds']}s from {_bucket_start(ctx, b)} "
+            f"against a typical {median:g}{top}",
+            ctx["line"][hit]
+        ))
+    return findings
+
+
+def _finding(kind: str, subject: str, count: int, window_start: Optional[str], detail: str, lines: np.ndarray) -> dict:
+    return {
+        "type": kind,
+        "subject": subject,
+        "count": count,
+        "window_start": window_start,
+        "detail": detail,
+        "lines": [int(n) for n in lines[:SAMPLE_LINES]],
+    }
+
+
+def _factorize(values: Tuple[Optional[str], ...]) -> Tuple[np.ndarray, List[str]]:
+    """Integer codes for a string column (-1 for missing) and the distinct values."""
+    array = np.array(["" if v is None else v for v in values], dtype=str)
+    uniques, codes = np.unique(array, return_inverse=True)
+    codes = codes.reshape(-1).astype(np.int64)
+    if len(uniques) and uniques[0] == "":
+        codes -= 1
+        uniques = uniques[1:]
+    return codes, [str(u) for u in uniques]
+
+
+def _bucket_start(ctx: dict, b: int) -> Optional[str]:
+    if b < 0 or ctx["origin"] is None:
+        return None
+    return _iso(ctx["origin"] + int(b) * ctx["bucket_seconds"])
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
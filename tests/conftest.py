@@ -0,0 +1,104 @@
+"""
+Shared fixtures. Settings are read and the upload dir is created when the
+app's modules are first imported, so the environment is set up here,
+before any test module imports them: a temp directory holding the SQLite
+database and the uploads, the local stub model and in-thread parsing.
+"""
+import os
+import uuid
+import shutil
+import tempfile
+
+import pytest
+
+WORKDIR = tempfile.mkdtemp(prefix="septer-tests-")
+os.chdir(WORKDIR)  # the upload dir is relative to the working directory
+
+os.environ.update({
+    "DB_URL": f"sqlite:///{WORKDIR}/test.db",
+    "GEMINI_MODEL": "stub",
+    "GEMINI_STUB_LATENCY_MS": "0",
+    "PARSER_WORKERS": "0",
+})
+# Anything already exported wins
+for name, value in {
+    "JWT_SECRET": "test-secret",
+    "GEMINI_API_BASE": "https://generativelanguage.googleapis.com",
+    "SEPTER_AES_SECRET": "test-aes-secret",
+    "SEPTER_AES_SALT": "746869735f69735f73616c74",
+    "SEPTER_AES_IV_BASE": "69765f626173655f6368617200000000",
+}.items():
+    os.environ.setdefault(name, value)
+
+PASSWORD = "Test!Pass123"
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """The app behind a TestClient; its startup creates the schema."""
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def db(client):
+    from core.db import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def hunter(client) -> dict:
+    """Auth headers of a new Hunter with a Gemini key set."""
+    email = f"hunter-{uuid.uuid4().hex[:12]}@test.example.com"
+    client.post("/api/hunter/signup", json={"email": email, "password": PASSWORD, "role": "Hunter"})
+    response = client.post("/api/auth/login", json={"email": email, "password": PASSWORD})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    client.put("/api/hunter/add-api-key", json={"api_key": "stub-key"}, headers=headers).raise_for_status()
+    return headers
+
+
+@pytest.fixture
+def prompts(monkeypatch) -> list:
+    """Every prompt the stub model is sent during the test."""
+    from services.stub_model import StubModel
+
+    sent = []
+    render = StubModel.render
+
+    def recording(self, prompt):
+        sent.append(prompt)
+        return render(self, prompt)
+
+    monkeypatch.setattr(StubModel, "render", recording)
+    return sent
+
+
+def sshd_log(lines: int, offset: int = 0) -> bytes:
+    """
+    Failed ssh logins from three IPs. Uploads of identical content share a
+    blob and its cached answers, so tests pass distinct offsets.
+    """
+    return "".join(
+        f"Jan  1 00:00:{(i + offset) % 60:02d} host sshd[1]: Failed password for root from 10.0.0.{(i + offset) % 3} port {2000 + i + offset} ssh2\n"
+        for i in range(lines)
+    ).encode()
+
+
+def upload(client, headers: dict, data: bytes, filename: str = "test.log", log_type: str = "log") -> str:
+    """Uploads a log and returns its id; parsing runs before this returns."""
+    response = client.post("/api/logs/upload", data={"log_type": log_type}, files={"file": (filename, data)}, headers=headers)
+    response.raise_for_status()
+    return response.json()["log_id"]
@@ -0,0 +1,352 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from core.config import settings
+from services import ai_handler
+from services.ai_handler import (
+    PriorAnswer, SectionStreamParser, build_reduce_prompt, call_gemini_batch_async, call_gemini_chunked, estimate_tokens,
+    extract_sections, generate_text_async, iter_log_chunks, map_chunks, reduce_partials, split_batch_answers,
+)
+from services.stub_model import StubModel
+from tests.conftest import sshd_log, upload
+
+SUMMARY = "MARKER: 3 failed logins from 10.0.0.5"
+USER = SimpleNamespace(id="user", gemini_api_key="stub-key")
+
+
+class RecordingModel(StubModel):
+    """The stub model, keeping every prompt it was sent."""
+
+    def __init__(self):
+        super().__init__(latency_ms=0)
+        self.prompts = []
+
+    def render(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        return super().render(prompt)
+
+
+class SilentModel(RecordingModel):
+    """Answers with nothing the sections can be extracted from."""
+
+    def render(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        return "no sections here"
+
+
+def write_log(tmp_path, lines: int) -> str:
+    path = tmp_path / "test.log"
+    path.write_text("".join(f"event {i} from 10.0.0.{i % 7}\n" for i in range(1, lines + 1)))
+    return str(path)
+
+
+def prompt_lines(prompt: str) -> list:
+    return [int(n) for n in re.findall(r"^\s*(\d+): event", prompt, re.MULTILINE)]
+
+
+def test_chunks_cover_every_line_once_with_global_numbers(tmp_path):
+    path = write_log(tmp_path, 200)
+    chunks = list(iter_log_chunks(path, token_budget=100))
+
+    assert len(chunks) > 1
+    numbered = [n for _, _, text in chunks for n in prompt_lines(text)]
+    assert numbered == list(range(1, 201))
+    for first, last, text in chunks:
+        assert len(text) <= 100 * 4
+        assert prompt_lines(text)[0] == first and prompt_lines(text)[-1] == last
+
+
+def test_chunks_of_selected_lines(tmp_path):
+    path = write_log(tmp_path, 50)
+    chunks = list(iter_log_chunks(path, token_budget=1000, line_numbers=[3, 10, 42]))
+
+    assert [(first, last) for first, last, _ in chunks] == [(3, 42)]
+    assert prompt_lines(chunks[0][2]) == [3, 10, 42]
+
+
+def test_map_chunks_returns_partials_in_line_order(tmp_path):
+    path = write_log(tmp_path, 200)
+    model = RecordingModel()
+    partials = asyncio.run(map_chunks(path, "What happened?", model, token_budget=300))
+
+    assert len(partials) == len(model.prompts) > 1
+    assert partials[0][0] == 1 and partials[-1][1] == 200
+    for (_, last, _), (first, _, _) in zip(partials, partials[1:]):
+        assert first == last + 1
+    assert all(sections["insights"] for _, _, sections in partials)
+
+
+def test_chunked_answer_sends_summary_to_the_reduce_step_only(tmp_path):
+    path = write_log(tmp_path, 200)
+    model = RecordingModel()
+    answer = asyncio.run(call_gemini_chunked(path, "What happened?", model, token_budget=300, summary=SUMMARY))
+
+    *chunk_prompts, reduce_prompt = model.prompts
+    assert len(chunk_prompts) > 1
+    assert not any(SUMMARY in p for p in chunk_prompts)
+    assert SUMMARY in reduce_prompt
+    assert answer["insights"]
+
+
+def test_single_chunk_carries_the_summary(tmp_path):
+    path = write_log(tmp_path, 5)
+    model = RecordingModel()
+    asyncio.run(call_gemini_chunked(path, "What happened?", model, token_budget=10_000, summary=SUMMARY))
+
+    assert len(model.prompts) == 1
+    assert SUMMARY in model.prompts[0]
+    assert prompt_lines(model.prompts[0]) == [1, 2, 3, 4, 5]
+
+
+def test_prior_answer_is_merged_as_the_first_part(tmp_path):
+    path = write_log(tmp_path, 20)
+    model = RecordingModel()
+    prior = PriorAnswer(lines=10, sections={"insights": "PRIOR INSIGHT", "reasoning": "", "supporting_logs": "", "fixes": ""})
+    asyncio.run(call_gemini_chunked(path, "What happened?", model, token_budget=10_000, line_numbers=list(range(11, 21)), prior=prior))
+
+    chunk_prompt, reduce_prompt = model.prompts
+    assert prompt_lines(chunk_prompt) == list(range(11, 21))
+    assert "PRIOR INSIGHT" in reduce_prompt
+
+
+def partials_for(count: int) -> list:
+    return [
+        (i * 10 + 1, i * 10 + 10, {"insights": f"insight {i}", "reasoning": f"reasoning {i}", "supporting_logs": f"Line {i * 10 + 1}: x", "fixes": ""})
+        for i in range(count)
+    ]
+
+
+def test_reduce_merges_in_one_call_when_it_fits():
+    model = RecordingModel()
+    merged = asyncio.run(reduce_partials("Q?", partials_for(3), model, token_budget=10_000))
+
+    assert len(model.prompts) == 1
+    assert all(f"insight {i}" in model.prompts[0] for i in range(3))
+    assert merged["insights"]
+
+
+def test_reduce_merges_in_rounds_when_the_partials_dont_fit():
+    partials = partials_for(6)
+    budget = estimate_tokens(build_reduce_prompt("Q?", partials[:2])) + 1
+    model = RecordingModel()
+    asyncio.run(reduce_partials("Q?", partials, model, token_budget=budget))
+
+    # Pairs first, then their merges
+    assert len(model.prompts) > 1
+    assert all(estimate_tokens(p) <= budget for p in model.prompts)
+
+
+def test_summary_goes_into_the_final_reduce_after_shrinking():
+    partials = partials_for(6)
+    budget = estimate_tokens(build_reduce_prompt("Q?", partials[:3], SUMMARY)) + 1
+    model = RecordingModel()
+    asyncio.run(reduce_partials("Q?", partials, model, token_budget=budget, summary=SUMMARY))
+
+    *merges, final = model.prompts
+    assert merges and not any(SUMMARY in p for p in merges)
+    assert SUMMARY in final
+
+
+def test_reduce_falls_back_to_joining_sections_when_the_answer_is_unusable():
+    merged = asyncio.run(reduce_partials("Q?", partials_for(3), SilentModel(), token_budget=10_000))
+
+    assert merged["insights"] == "insight 0\ninsight 1\ninsight 2"
+    assert merged["fixes"] == ""
+
+
+def test_split_batch_answers():
+    response = (
+        "### Question 2\n🔍 Insights\nsecond\n🧠 Reasoning\nwhy two\n"
+        "### Question 1\n🔍 Insights\nfirst\n🛠️ Fixes\nfix one\n"
+        "### Question 9\n🔍 Insights\nout of range\n"
+    )
+    first, second, third = split_batch_answers(response, 3)
+
+    assert first == {"insights": "first", "reasoning": "", "supporting_logs": "", "fixes": "fix one"}
+    assert second["insights"] == "second" and second["reasoning"] == "why two"
+    assert not any(third.values())
+
+
+def test_split_batch_answers_keeps_the_first_answer_to_a_question():
+    response = "**Question 1**\n🔍 Insights\nfirst\n### Question 1\n🔍 Insights\nagain\n"
+    assert split_batch_answers(response, 1)[0]["insights"] == "first"
+
+
+def test_split_batch_answers_without_markers():
+    assert split_batch_answers("🔍 Insights\nonly one", 1)[0]["insights"] == "only one"
+    assert not any(split_batch_answers("🔍 Insights\nwhich one?", 2)[0].values())
+
+
+def test_batch_answers_every_question_in_one_call(tmp_path):
+    path = write_log(tmp_path, 20)
+    model = RecordingModel()
+    questions = ["Any brute force?", "Which IPs are busiest?", "Anything else?"]
+    answers, usage = asyncio.run(call_gemini_batch_async(path, questions, USER, model))
+
+    assert usage.calls == len(model.prompts) == 1
+    assert all(question in model.prompts[0] for question in questions)
+    for n, answer in enumerate(answers, start=1):
+        assert f"question {n}" in answer.sections["insights"]
+        assert answer.prompt_tokens > 0
+
+
+def test_batch_respects_questions_per_call(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ai_batch_questions_per_call", 2)
+    path = write_log(tmp_path, 20)
+    model = RecordingModel()
+    answers, usage = asyncio.run(call_gemini_batch_async(path, ["a?", "b?", "c?"], USER, model))
+
+    assert usage.calls == 2
+    assert all(answer.sections["insights"] for answer in answers)
+
+
+def test_batch_over_chunks_reduces_each_question(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ai_chunk_token_budget", 600)
+    path = write_log(tmp_path, 300)
+    model = RecordingModel()
+    answers, _ = asyncio.run(call_gemini_batch_async(path, ["a?", "b?"], USER, model))
+
+    # Each chunk goes out once with both questions, then each question is reduced on its own
+    map_prompts = [p for p in model.prompts if "Question 1:" in p and "Question 2:" in p]
+    assert len(map_prompts) > 1
+    reduce_prompts = model.prompts[len(map_prompts):]
+    assert any("a?" in p for p in reduce_prompts) and any("b?" in p for p in reduce_prompts)
+    assert not any("a?" in p and "b?" in p for p in reduce_prompts)
+    assert all(answer.sections["insights"] for answer in answers)
+
+
+def test_nothing_to_analyse(tmp_path):
+    path = write_log(tmp_path, 0)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(map_chunks(path, "Q?", RecordingModel(), token_budget=100))
+    assert error.value.status_code == 404
+
+
+RESPONSE = (
+    "Preamble the sections ignore\n"
+    "🔍 Insights\nBrute force from 10.0.0.5\n  indented line  \n"
+    "🧠 Reasoning\n12 failures in a minute\n"
+    "📄 Supporting Logs\nLine 3: Failed password for root\n\n"
+    "🛠️ Fixes\nBlock 10.0.0.5"
+)
+
+
+def stream(pieces) -> tuple:
+    """Feeds pieces to a SectionStreamParser; returns it, its section events and the text forwarded per section."""
+    parser = SectionStreamParser()
+    events = [event for piece in pieces for event in parser.feed(piece)] + parser.finish()
+    forwarded = {}
+    for kind, text in events:
+        if kind != "section":
+            forwarded[kind] = forwarded.get(kind, "") + text
+    return parser, [text for kind, text in events if kind == "section"], forwarded
+
+
+def test_stream_parser_header_split_across_chunks():
+    parser, sections, forwarded = stream(["🔍 Insights\nfirst\n🧠", " Reasoning\nsecond\n"])
+
+    assert sections == ["insights", "reasoning"]
+    assert forwarded == {"insights": "first\n", "reasoning": "second\n"}
+    assert parser.sections() == {"insights": "first", "reasoning": "second", "supporting_logs": "", "fixes": ""}
+
+
+def test_stream_parser_boundary_inside_a_header():
+    # Inside the header word, and between the code points of "🛠️"
+    parser, sections, forwarded = stream(["🔍 Ins", "ights\nfirst\n🛠", "\ufe0f Fi", "xes\nfix\n"])
+
+    assert sections == ["insights", "fixes"]
+    assert forwarded == {"insights": "first\n", "fixes": "fix\n"}
+    assert parser.sections()["fixes"] == "fix"
+
+
+def test_stream_parser_matches_extract_sections_at_any_split():
+    expected = extract_sections(RESPONSE)
+    splits = [[RESPONSE[:i], RESPONSE[i:]] for i in range(len(RESPONSE) + 1)]
+    for pieces in splits + [list(RESPONSE)]:
+        parser, sections, forwarded = stream(pieces)
+        assert parser.sections() == expected
+        assert sections == ["insights", "reasoning", "supporting_logs", "fixes"]
+        # Nothing before the first header, and no header text, is forwarded
+        assert not any(h in text for text in forwarded.values() for h in "🔍🧠📄🛠")
+        assert "Preamble" not in "".join(forwarded.values())
+
+
+def test_ask_stream_events(client, hunter):
+    log_id = upload(client, hunter, sshd_log(10, offset=1000))
+    response = client.post("/api/logs/ask/stream", json={"log_id": log_id, "question": "Any brute force?"}, headers=hunter)
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.text.strip().split("\n\n")
+    ]
+    assert [data["section"] for name, data in events if name == "section"] == ["insights", "reasoning", "supporting_logs", "fixes"]
+    name, done = events[-1]
+    assert name == "done" and done["conversation_id"]
+    tokens = "".join(data["text"] for name, data in events if name == "token" and data["section"] == "insights")
+    assert tokens.strip() == done["insights"]
+
+
+class ConcurrencyModel:
+    """Notes the most calls it ever had in flight at once, across threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = self.most = 0
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        with self.lock:
+            self.in_flight += 1
+            self.most = max(self.most, self.in_flight)
+        await asyncio.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        return StubModel(latency_ms=0).generate_content(prompt)
+
+
+def test_model_calls_share_one_limit_across_event_loops(monkeypatch):
+    monkeypatch.setattr(ai_handler, "_model_slots", threading.BoundedSemaphore(2))
+    model = ConcurrencyModel()
+
+    async def burst():
+        return await asyncio.gather(*(generate_text_async(model, f"prompt {i}") for i in range(3)))
+
+    # Each job worker thread runs its own event loop
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(asyncio.run(burst()))) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert len(results) == 2 and all(len(texts) == 3 for texts in results)
+    assert model.most == 2
+
+
+def test_a_cancelled_wait_gives_its_slot_back(monkeypatch):
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(ai_handler, "_model_slots", slots)
+
+    async def cancel_while_waiting():
+        slots.acquire()
+        waiter = asyncio.ensure_future(ai_handler._acquire_model_slot())
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        slots.release()
+
+    asyncio.run(cancel_while_waiting())
+    # The waiting thread takes the freed slot, then hands it back
+    deadline = time.monotonic() + 5
+    while not slots.acquire(blocking=False):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    slots.release()
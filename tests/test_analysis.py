@@ -0,0 +1,74 @@
+import re
+
+from tests.conftest import sshd_log, upload
+
+
+def numbered_lines(prompt: str) -> list:
+    return [int(n) for n in re.findall(r"^\s*(\d+): Jan", prompt, re.MULTILINE)]
+
+
+def test_append_then_incremental_ask(client, hunter, prompts):
+    log_id = upload(client, hunter, sshd_log(10, offset=300))
+    question = {"log_id": log_id, "question": "Any brute force?", "incremental": True}
+    client.post("/api/logs/ask", json=question, headers=hunter).raise_for_status()
+    assert "port 2300" in prompts[-1]
+
+    client.post(f"/api/logs/{log_id}/append", content=sshd_log(5, offset=310), headers=hunter).raise_for_status()
+
+    # Only the appended lines are sent, with the earlier answer
+    client.post("/api/logs/ask", json=question, headers=hunter).raise_for_status()
+    assert numbered_lines(prompts[-1]) == list(range(11, 16))
+
+
+def test_compact_answers_are_not_built_on(client, hunter, prompts):
+    log_id = upload(client, hunter, sshd_log(10, offset=400))
+    client.post("/api/logs/ask", json={"log_id": log_id, "question": "Q?", "compact": True}, headers=hunter).raise_for_status()
+    client.post(f"/api/logs/{log_id}/append", content=sshd_log(2, offset=410), headers=hunter).raise_for_status()
+
+    # The compact answer saw templates, not lines, so the whole log is sent again
+    client.post("/api/logs/ask", json={"log_id": log_id, "question": "Q?", "incremental": True}, headers=hunter).raise_for_status()
+    assert "port 2400" in prompts[-1] and "port 2411" in prompts[-1]
+
+
+def test_incremental_ask_without_new_lines_reuses_the_answer(client, hunter, prompts):
+    log_id = upload(client, hunter, sshd_log(10, offset=2600))
+    question = {"log_id": log_id, "question": "Any brute force?", "incremental": True, "use_cache": False}
+    first = client.post("/api/logs/ask", json=question, headers=hunter).json()
+    sent = len(prompts)
+
+    again = client.post("/api/logs/ask", json=question, headers=hunter).json()
+    assert len(prompts) == sent
+    assert again["insights"] == first["insights"]
+
+
+def test_incremental_needs_a_plain_single_log_ask(client, hunter):
+    log_id, other = upload(client, hunter, sshd_log(3, offset=2610)), upload(client, hunter, sshd_log(3, offset=2620))
+    for extra in [{"compact": True}, {"filters": {"ip": ["10.0.0.1"]}}, {"log_ids": [other]}]:
+        question = {"log_id": log_id, "question": "Q?", "incremental": True, **extra}
+        assert client.post("/api/logs/ask", json=question, headers=hunter).status_code == 400
+
+
+def test_batch_answers_in_one_call(client, hunter, prompts):
+    log_id = upload(client, hunter, sshd_log(20, offset=600))
+    questions = ["Any brute force?", "Which IPs?", "Which users?"]
+    response = client.post("/api/logs/ask/batch", json={"log_id": log_id, "questions": questions}, headers=hunter).json()
+
+    assert response["model_calls"] == len(prompts) == 1
+    assert [a["question"] for a in response["answers"]] == questions
+    for n, answer in enumerate(response["answers"], start=1):
+        assert f"question {n}" in answer["insights"]
+        assert answer["conversation_id"] and not answer["cached"]
+
+    again = client.post("/api/logs/ask/batch", json={"log_id": log_id, "questions": questions}, headers=hunter).json()
+    assert again["model_calls"] == 0 and all(a["cached"] for a in again["answers"])
+
+
+def test_batch_sends_only_the_questions_not_yet_answered(client, hunter, prompts):
+    log_id = upload(client, hunter, sshd_log(20, offset=2700))
+    client.post("/api/logs/ask", json={"log_id": log_id, "question": "Any brute force?"}, headers=hunter).raise_for_status()
+
+    questions = ["Any brute force?", "Which IPs?"]
+    response = client.post("/api/logs/ask/batch", json={"log_id": log_id, "questions": questions}, headers=hunter).json()
+    assert response["model_calls"] == 1
+    assert [a["cached"] for a in response["answers"]] == [True, False]
+    assert "Which IPs?" in prompts[-1] and "Any brute force?" not in prompts[-1]
@@ -0,0 +1,73 @@
+import uuid
+from datetime import datetime, timedelta
+
+from core.config import settings
+from models.answer_cache import CachedAnswer
+from services import answer_cache
+from services.answer_cache import cache_key, get_cached_answer, store_answer
+from tests.conftest import sshd_log, upload
+
+ANSWER = {"insights": "i", "reasoning": "r", "supporting_logs": "Line 1: x", "fixes": "f"}
+
+
+def test_key_ignores_question_formatting():
+    assert cache_key("b", "Any brute force?") == cache_key("b", "  any   BRUTE force ")
+    assert cache_key("b", "q", {"ip": ["2", "1"], "user": []}) == cache_key("b", "q", {"ip": ["1", "2"]})
+    assert cache_key("b", "q") != cache_key("b", "q", compact=True)
+    assert cache_key("b", "q") != cache_key("other", "q")
+
+
+def test_stored_answers_are_found_in_either_tier(db):
+    key = cache_key(str(uuid.uuid4()), "q")
+    assert get_cached_answer(db, key) is None
+
+    store_answer(db, key, "blob", "q", ANSWER, compute_ms=5)
+    assert get_cached_answer(db, key) == ANSWER
+
+    # Another worker (or a restart) only has the database tier
+    answer_cache._memory.clear()
+    assert get_cached_answer(db, key) == ANSWER
+    assert db.query(CachedAnswer).filter(CachedAnswer.key == key).one().hits == 1
+
+
+def test_expired_answers_are_misses(db):
+    key = cache_key(str(uuid.uuid4()), "q")
+    store_answer(db, key, "blob", "q", ANSWER, compute_ms=5)
+    answer_cache._memory.clear()
+    db.query(CachedAnswer).filter(CachedAnswer.key == key).update(
+        {CachedAnswer.created_at: datetime.utcnow() - timedelta(seconds=settings.answer_cache_ttl_seconds + 1)}
+    )
+    db.commit()
+
+    assert get_cached_answer(db, key) is None
+
+
+def test_eviction_runs_every_few_stores(db, monkeypatch):
+    monkeypatch.setattr(answer_cache, "EVICT_EVERY_STORES", 5)
+    monkeypatch.setattr(answer_cache, "_stores_since_eviction", 0)
+    db.query(CachedAnswer).delete()
+    db.commit()
+    monkeypatch.setattr(settings, "answer_cache_max_rows", 3)
+
+    counts = []
+    for i in range(10):
+        store_answer(db, f"evict-{uuid.uuid4()}", "blob", f"q{i}", ANSWER, compute_ms=1)
+        counts.append(db.query(CachedAnswer).count())
+
+    assert counts == [1, 2, 3, 4, 3, 4, 5, 6, 7, 3]
+
+
+def test_ask_answers_are_cached(client, hunter, prompts):
+    log_id = upload(client, hunter, sshd_log(20, offset=100))
+    question = {"log_id": log_id, "question": "Any brute force?"}
+
+    answer = client.post("/api/logs/ask", json=question, headers=hunter).json()
+    assert answer["insights"] and len(prompts) == 1
+
+    # Same content under another log, and the question written differently
+    other = upload(client, hunter, sshd_log(20, offset=100))
+    again = client.post("/api/logs/ask", json={"log_id": other, "question": "  any brute FORCE? "}, headers=hunter).json()
+    assert again["insights"] == answer["insights"] and len(prompts) == 1
+
+    client.post("/api/logs/ask", json={**question, "use_cache": False}, headers=hunter).raise_for_status()
+    assert len(prompts) == 2
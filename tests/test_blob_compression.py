@@ -0,0 +1,120 @@
+import gzip
+import io
+import random
+
+import pytest
+
+from core.config import settings
+from models.log import Log
+from services.blob_compression import (
+    BLOCK_BYTES, BlockReader, BlockWriter, blob_size, blocks_path, build_block_index,
+    decompressing_reader, open_blob, zstd_available,
+)
+from tests.conftest import sshd_log, upload
+
+KINDS = ["gzip", pytest.param("zstd", marks=pytest.mark.skipif(not zstd_available(), reason="zstandard not installed"))]
+
+
+def content(size: int) -> bytes:
+    rng = random.Random(size)
+    lines = []
+    total = 0
+    while total < size:
+        line = f"{rng.randint(0, 10 ** 9)} event from 10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}\n".encode()
+        lines.append(line)
+        total += len(line)
+    return b"".join(lines)[:size]
+
+
+def store(tmp_path, data: bytes, kind: str) -> str:
+    """Writes data compressed in blocks, with its block index, as an upload would."""
+    path = str(tmp_path / f"blob.{kind}")
+    with open(path, "wb") as out:
+        writer = BlockWriter(out, kind)
+        for i in range(0, len(data), 100_000):
+            writer.write(data[i:i + 100_000])
+        writer.close()
+    writer.write_index(blocks_path(path))
+    return path
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_block_reader_round_trip(tmp_path, kind):
+    data = content(3 * BLOCK_BYTES + 12345)
+    path = store(tmp_path, data, kind)
+
+    reader = BlockReader(path)
+    try:
+        assert len(reader) == len(data) == blob_size(path)
+        assert reader[0:len(data)] == data
+        # Ranges inside one block, across block boundaries and at the ends
+        for begin, end in [(0, 10), (BLOCK_BYTES - 5, BLOCK_BYTES + 5), (10, 2 * BLOCK_BYTES + 7), (len(data) - 3, len(data)), (5, 5)]:
+            assert reader[begin:end] == data[begin:end]
+        assert reader[len(data) - 3:] == data[-3:]
+    finally:
+        reader.close()
+
+    with open_blob(path) as f:
+        assert f.read() == data
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_block_index_is_rebuilt_for_files_compressed_elsewhere(tmp_path, kind):
+    data = content(50_000)
+    path = tmp_path / f"external.{kind}"
+    if kind == "gzip":
+        # Two members, as concatenating .gz files gives
+        path.write_bytes(gzip.compress(data[:20_000]) + gzip.compress(data[20_000:]))
+    else:
+        import zstandard
+        path.write_bytes(zstandard.ZstdCompressor().compress(data))
+
+    build_block_index(str(path))
+    reader = BlockReader(str(path))
+    try:
+        assert len(reader) == len(data)
+        assert reader[19_990:20_010] == data[19_990:20_010]
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_truncated_upload_raises(kind):
+    data = content(10_000)
+    if kind == "gzip":
+        compressed = gzip.compress(data)
+    else:
+        import zstandard
+        compressed = zstandard.ZstdCompressor().compress(data)
+
+    reader = decompressing_reader(io.BytesIO(compressed[:len(compressed) // 2]), kind)
+    with pytest.raises(EOFError):
+        while reader.read(4096):
+            pass
+
+
+def test_gzip_upload_is_read_like_the_plain_log(client, hunter, db):
+    data = sshd_log(30, offset=2300)
+    packed = upload(client, hunter, gzip.compress(data), filename="auth.log.gz")
+    plain = upload(client, hunter, data)
+
+    logs = db.query(Log).filter(Log.id.in_([packed, plain])).all()
+    assert len({log.file_hash for log in logs}) == 1
+    assert {log.size_bytes for log in logs} == {len(data)}
+    lines = client.get(f"/api/logs/{packed}/lines", params={"start": 2, "end": 3}, headers=hunter).json()
+    assert lines["total_lines"] == 30 and "port 4301" in lines["lines"][0]["text"]
+    found = client.get(f"/api/logs/{packed}/search", params={"ip": "10.0.0.1"}, headers=hunter).json()
+    assert found["total_matches"] == 10
+
+
+def test_bad_compressed_uploads_are_refused(client, hunter, monkeypatch):
+    def send(data):
+        return client.post("/api/logs/upload", data={"log_type": "log"}, files={"file": ("auth.log.gz", data)}, headers=hunter)
+
+    assert send(gzip.compress(sshd_log(30, offset=2330))[:-20]).status_code == 400
+
+    # Small on the wire, too large once decompressed
+    monkeypatch.setattr(settings, "max_decompressed_size_mb", 1)
+    response = send(gzip.compress(b"x" * (2 << 20)))
+    assert response.status_code == 413
+    assert response.json()["detail"] == "File too large once decompressed"
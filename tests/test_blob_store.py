@@ -0,0 +1,93 @@
+import io
+import os
+import uuid
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from models.log import Log
+from models.log_blob import LogBlob
+from services.blob_store import collect_garbage, release_blob, require_parsed, store_blob
+from services.file_upload import UPLOAD_DIR, save_uploaded_file
+from tests.conftest import sshd_log, upload
+
+
+def saved(data: bytes) -> dict:
+    return save_uploaded_file(UploadFile(io.BytesIO(data), filename="test.log"), "log")
+
+
+def unique_log() -> bytes:
+    return f"{uuid.uuid4()} sshd: Failed password for root from 10.0.0.5\nsecond line\n".encode()
+
+
+def test_identical_content_is_stored_once(db):
+    data = unique_log()
+    first = store_blob(db, saved(data))
+    db.commit()
+    second = store_blob(db, saved(data))
+    db.commit()
+
+    assert first.sha256 == second.sha256
+    assert first.file_path == second.file_path
+    db.refresh(first)
+    assert first.ref_count == 2
+    assert first.line_count == 2
+    with open(first.file_path, "rb") as f:
+        assert f.read() == data
+    # The second upload's temp file was dropped
+    assert not [p for p in os.listdir(UPLOAD_DIR) if p.endswith(".part")]
+
+
+def test_garbage_collection_removes_unreferenced_blobs_only(db):
+    kept = store_blob(db, saved(unique_log()))
+    dropped = store_blob(db, saved(unique_log()))
+    db.commit()
+    kept_path, dropped_hash, dropped_path = kept.file_path, dropped.sha256, dropped.file_path
+    with open(dropped_path + ".lines", "wb"):
+        pass  # derived files go with the blob
+
+    release_blob(db, dropped_hash)
+    db.commit()
+    assert collect_garbage(db) >= 1
+
+    assert db.query(LogBlob).filter(LogBlob.sha256 == dropped_hash).first() is None
+    assert not os.path.exists(dropped_path)
+    assert not os.path.exists(dropped_path + ".lines")
+    assert os.path.exists(kept_path)
+
+
+def test_upload_after_collection_restores_the_blob(db):
+    data = unique_log()
+    blob = store_blob(db, saved(data))
+    db.commit()
+    release_blob(db, blob.sha256)
+    db.commit()
+    collect_garbage(db)
+
+    blob = store_blob(db, saved(data))
+    db.commit()
+    assert blob.ref_count == 1
+    with open(blob.file_path, "rb") as f:
+        assert f.read() == data
+
+
+def test_require_parsed():
+    with pytest.raises(HTTPException) as error:
+        require_parsed(LogBlob(parsed_at=None, parse_error=None))
+    assert error.value.status_code == 409
+
+    with pytest.raises(HTTPException) as error:
+        require_parsed(LogBlob(parsed_at=None, parse_error="ValueError: bad"), "Log x")
+    assert error.value.status_code == 422
+    assert "Log x could not be parsed (ValueError: bad)" in error.value.detail
+
+
+def test_deleting_the_last_reference_removes_the_blob(client, hunter, db):
+    data = sshd_log(6, offset=800)
+    first, second = upload(client, hunter, data), upload(client, hunter, data)
+    path = db.query(Log).filter(Log.id == first).one().file_path
+
+    client.delete(f"/api/logs/{first}", headers=hunter).raise_for_status()
+    assert os.path.exists(path)
+    client.delete(f"/api/logs/{second}", headers=hunter).raise_for_status()
+    assert not os.path.exists(path)
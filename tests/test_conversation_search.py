@@ -0,0 +1,104 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from core.db import engine
+from models.conversation import Conversation
+from services.conversation_search import _search_like, fts_query, full_text_available, search_conversations
+from tests.conftest import sshd_log, upload
+
+pytestmark = pytest.mark.skipif(not full_text_available(engine), reason="SQLite without FTS5")
+
+
+def add(db, user_id: str, question: str, insights: str = "", created_at: datetime = None) -> Conversation:
+    convo = Conversation(user_id=user_id, log_id="log", question=question, answer_insights=insights, created_at=created_at or datetime.utcnow())
+    db.add(convo)
+    db.commit()
+    return convo
+
+
+def user() -> str:
+    return str(uuid.uuid4())
+
+
+def hit_ids(hits) -> list:
+    return [h["conversation"].id for h in hits]
+
+
+def test_search_ranks_and_scopes_by_user(db):
+    me, other = user(), user()
+    in_question = add(db, me, "brute force from 10.0.0.5?", "nothing much")
+    in_answer = add(db, me, "what happened overnight?", "a brute force run against sshd")
+    theirs = add(db, other, "brute force from 10.0.0.5?")
+    # bm25 only tells matches apart for terms most conversations don't have
+    for i in range(10):
+        add(db, me, f"unrelated {i}", "port scan")
+
+    hits = search_conversations(db, "brute force", me, limit=10)
+    assert hit_ids(hits) == [in_question.id, in_answer.id]  # question matches weigh more
+    assert "[brute]" in hits[0]["snippet"] and hits[0]["score"] > hits[1]["score"]
+
+    assert hit_ids(search_conversations(db, "10.0.0.5", me, limit=10)) == [in_question.id]
+    assert theirs.id in hit_ids(search_conversations(db, "10.0.0.5", None, limit=10))
+    assert hit_ids(search_conversations(db, "brute", me, limit=1, offset=1)) == [in_answer.id]
+    assert hit_ids(search_conversations(db, "bru*", me, limit=10)) == [in_question.id, in_answer.id]
+
+
+def test_index_follows_updates_and_deletes(db):
+    me = user()
+    convo = add(db, me, "first question", "about lateral movement")
+    assert hit_ids(search_conversations(db, "lateral", me, limit=10)) == [convo.id]
+
+    convo.answer_insights = "about exfiltration"
+    db.commit()
+    assert search_conversations(db, "lateral", me, limit=10) == []
+    assert hit_ids(search_conversations(db, "exfiltration", me, limit=10)) == [convo.id]
+
+    db.delete(convo)
+    db.commit()
+    assert search_conversations(db, "exfiltration", me, limit=10) == []
+
+
+def test_results_survive_vacuum(db):
+    me = user()
+    convos = [add(db, me, f"question {word}") for word in ["alpha", "bravo", "charlie", "delta", "echo"]]
+    for convo in convos[:2]:
+        db.delete(convo)
+    db.commit()
+    db.close()
+
+    # VACUUM may renumber the rows' implicit rowids; the index must not care
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM")
+
+    for convo, word in zip(convos[2:], ["charlie", "delta", "echo"]):
+        hits = search_conversations(db, word, me, limit=10)
+        assert [h["conversation"].question for h in hits] == [f"question {word}"]
+
+
+def test_like_fallback(db):
+    me = user()
+    older = add(db, me, "Failed logins from 10.0.0.9", created_at=datetime.utcnow() - timedelta(minutes=1))
+    newer = add(db, me, "more failed logins", "from 10.0.0.9 again")
+
+    assert hit_ids(_search_like(db, "failed 10.0.0.9", me, 10, 0)) == [newer.id, older.id]
+    assert _search_like(db, "   ", me, 10, 0) == []
+
+
+def test_fts_query_quotes_every_term():
+    assert fts_query('C:\\Windows "x" OR', None) == '{question answer_insights answer_reasoning answer_supporting_logs answer_fixes} : ("C:\\Windows" "x" "OR")'
+    assert fts_query("adm*", "u1").startswith('user_id : "u1" AND ')
+    assert fts_query("!!!") == ""
+
+
+
+def test_search_endpoint(client, hunter):
+    log_id = upload(client, hunter, sshd_log(5, offset=1900))
+    for question in ["Was there kerberoasting?", "Any brute force?"]:
+        client.post("/api/logs/ask", json={"log_id": log_id, "question": question}, headers=hunter).raise_for_status()
+
+    found = client.get("/api/conversations/search", params={"q": "kerberoasting"}, headers=hunter).json()
+    assert [hit["question"] for hit in found["hits"]] == ["Was there kerberoasting?"]
+    assert "[kerberoasting]" in found["hits"][0]["snippet"]
+    assert client.get("/api/conversations/search", params={"q": "kerberoasting", "scope": "all"}, headers=hunter).status_code == 403
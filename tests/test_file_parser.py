@@ -0,0 +1,93 @@
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from core.config import settings
+from models.log import Log
+from models.log_blob import LogBlob
+from services import file_parser
+from services.file_parser import JsonStream, iter_json_records, shutdown_parser_pool
+from tests.conftest import sshd_log, upload
+
+
+def blob_of(db, log_id: str) -> LogBlob:
+    db.expire_all()
+    return db.query(LogBlob).join(Log, Log.file_hash == LogBlob.sha256).filter(Log.id == log_id).one()
+
+
+def records(text: str) -> list:
+    return list(iter_json_records(JsonStream(io.StringIO(text))))
+
+
+def test_json_records_and_their_lines():
+    assert records('{"a": 1}\n{"a": 2}\n\n{"a": 3}\n') == [(1, {"a": 1}), (2, {"a": 2}), (4, {"a": 3})]
+    assert records('[\n  {"a": 1},\n  {"a": 2}\n]') == [(2, {"a": 1}), (3, {"a": 2})]
+    cloudtrail = json.dumps({"Records": [{"a": 1}, {"a": 2}]}, indent=1)
+    assert [record for _, record in records(cloudtrail)] == [{"a": 1}, {"a": 2}]
+
+
+def test_malformed_json_is_not_buffered_to_the_end(monkeypatch):
+    monkeypatch.setattr(file_parser, "READ_CHUNK_CHARS", 100)
+    f = io.StringIO('[{"a": 1 "b": "' + "x" * 100_000 + '"}]')
+
+    with pytest.raises(ValueError, match="Invalid JSON on line 1"):
+        list(iter_json_records(JsonStream(f, max_value_chars=1000)))
+    assert f.tell() < 2000
+
+
+def test_upload_is_parsed_into_records(client, hunter, db):
+    log_id = upload(client, hunter, sshd_log(12, offset=1400))
+
+    blob = blob_of(db, log_id)
+    assert blob.parsed_at is not None and blob.parse_error is None
+    assert (blob.record_format, blob.record_count) == ("text", 12)
+
+
+def test_parse_failure_is_reported_and_retried(client, hunter, db, monkeypatch):
+    data = sshd_log(4, offset=700)
+    parse_blob = file_parser.parse_blob
+
+    def failing(path):
+        raise ValueError("unreadable")
+
+    monkeypatch.setattr(file_parser, "parse_blob", failing)
+    log_id = upload(client, hunter, data)
+    for response in [
+        client.get(f"/api/logs/{log_id}/findings", headers=hunter),
+        client.get(f"/api/logs/{log_id}/search", params={"ip": "10.0.0.1"}, headers=hunter),
+        client.post("/api/logs/ask", json={"log_id": log_id, "question": "Q?", "filters": {"ip": ["10.0.0.1"]}}, headers=hunter),
+    ]:
+        assert response.status_code == 422
+        assert "ValueError: unreadable" in response.json()["detail"]
+
+    monkeypatch.setattr(file_parser, "parse_blob", parse_blob)
+    upload(client, hunter, data)
+    assert client.get(f"/api/logs/{log_id}/findings", headers=hunter).status_code == 200
+    assert blob_of(db, log_id).parse_error is None
+
+
+def test_a_broken_parser_pool_is_replaced(client, hunter, db, monkeypatch):
+    # A pool whose only worker died, as after a crash or an OOM kill
+    broken = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    with pytest.raises(BrokenProcessPool):
+        broken.submit(os._exit, 1).result()
+    monkeypatch.setattr(settings, "parser_workers", 1)
+    monkeypatch.setattr(file_parser, "_pool", broken)
+    try:
+        data = sshd_log(5, offset=1500)
+        log_id = upload(client, hunter, data)
+        assert "BrokenProcessPool" in blob_of(db, log_id).parse_error
+        assert file_parser._pool is None
+
+        # The next parse starts a new pool
+        upload(client, hunter, data)
+        blob = blob_of(db, log_id)
+        assert blob.parse_error is None and blob.record_count == 5
+        assert file_parser._pool not in (None, broken)
+    finally:
+        shutdown_parser_pool()
@@ -0,0 +1,33 @@
+import os
+from array import array
+
+import pytest
+
+from core.files import atomic_path, atomic_write
+
+
+def test_atomic_write_replaces_the_file(tmp_path):
+    path = str(tmp_path / "out.json")
+    atomic_write(path, "first")
+    atomic_write(path, "second é")
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "second é"
+
+    atomic_write(path, array("Q", [1, 2]))
+    assert os.path.getsize(path) == 16
+    assert os.listdir(tmp_path) == ["out.json"]
+
+
+def test_failed_write_leaves_the_old_file(tmp_path):
+    path = str(tmp_path / "out.db")
+    atomic_write(path, b"old")
+
+    with pytest.raises(RuntimeError):
+        with atomic_path(path) as tmp_path_:
+            with open(tmp_path_, "wb") as f:
+                f.write(b"partial")
+            raise RuntimeError("interrupted")
+
+    with open(path, "rb") as f:
+        assert f.read() == b"old"
+    assert os.listdir(tmp_path) == ["out.db"]
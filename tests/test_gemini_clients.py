@@ -0,0 +1,88 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from core.cache import TTLCache
+from core.config import settings
+from services import gemini_clients
+from services.gemini_clients import get_model, invalidate_api_key, pool_size
+from services.stub_model import StubModel
+
+
+def user(api_key: str) -> SimpleNamespace:
+    return SimpleNamespace(id=api_key, gemini_api_key=api_key)
+
+
+@pytest.fixture
+def pool(monkeypatch) -> list:
+    """A small, fresh client pool over fake clients; returns the keys clients were made for."""
+    made = []
+
+    def new_client(api_key):
+        made.append(api_key)
+        return object()
+
+    monkeypatch.setattr(settings, "gemini_model", "gemini-test")
+    monkeypatch.setattr(gemini_clients, "_new_client", new_client)
+    monkeypatch.setattr(gemini_clients, "_registry", TTLCache(2, 0.5, sliding=True))
+    return made
+
+
+def test_the_stub_setting_needs_no_client():
+    assert isinstance(get_model(user("key")), StubModel)
+
+
+def test_clients_are_reused_per_key(pool):
+    first, again, other = get_model(user("key-a")), get_model(user("key-a")), get_model(user("key-b"))
+
+    assert first.clients is again.clients
+    assert first.clients is not other.clients
+    assert first.model_name == "gemini-test"
+    assert first.clients.client() is again.clients.client()
+    assert pool == ["key-a"]
+    assert pool_size() == 2
+
+
+def test_each_event_loop_gets_its_own_client(pool):
+    clients = get_model(user("key-a")).clients
+
+    async def client():
+        loop = asyncio.get_running_loop()
+        assert clients.client(loop) is clients.client(loop)
+        return clients.client(loop)
+
+    assert asyncio.run(client()) is not asyncio.run(client())
+    assert clients.client() is not None
+    assert pool == ["key-a"] * 3
+
+
+def test_idle_keys_expire(pool):
+    kept = get_model(user("key-a")).clients
+    time.sleep(0.3)
+    assert get_model(user("key-a")).clients is kept  # a hit pushes the expiry back
+    time.sleep(0.3)
+    assert get_model(user("key-a")).clients is kept
+
+    time.sleep(0.7)
+    assert get_model(user("key-a")).clients is not kept
+
+
+def test_least_recently_used_key_is_evicted(pool):
+    a, b = get_model(user("key-a")).clients, get_model(user("key-b")).clients
+    get_model(user("key-a"))
+    get_model(user("key-c"))
+
+    assert pool_size() == 2
+    assert get_model(user("key-a")).clients is a
+    assert get_model(user("key-b")).clients is not b
+
+
+def test_replaced_keys_are_dropped(pool):
+    old = get_model(user("key-a")).clients
+    invalidate_api_key("key-a")
+    invalidate_api_key(None)
+
+    assert pool_size() == 0
+    assert get_model(user("key-a")).clients is not old
@@ -0,0 +1,152 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from core.config import settings
+from models.analysis_job import AnalysisJob
+from services import job_queue as queue_module
+from services.job_queue import JobQueue, job_queue
+from tests.conftest import sshd_log, upload
+
+
+@pytest.fixture
+def stopped_queue(client):
+    """The app's queue with its workers stopped, so jobs stay as the test leaves them."""
+    job_queue.stop()
+    try:
+        yield job_queue
+    finally:
+        job_queue.start()
+
+
+def background_ask(client, hunter, log_id: str, question: str = "Any brute force?") -> str:
+    response = client.post("/api/logs/ask", json={"log_id": log_id, "question": question, "background": True}, headers=hunter)
+    assert response.status_code == 202
+    return response.json()["job_id"]
+
+
+def wait_for(client, hunter, job_id: str, statuses=("done", "failed", "cancelled")) -> dict:
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/logs/jobs/{job_id}", headers=hunter).json()
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def set_job(db, job_id: str, **values) -> None:
+    db.query(AnalysisJob).filter(AnalysisJob.id == job_id).update(values, synchronize_session=False)
+    db.commit()
+
+
+def status(db, job_id: str) -> str:
+    db.expire_all()
+    return db.query(AnalysisJob).filter(AnalysisJob.id == job_id).one().status
+
+
+def test_background_ask_runs_to_an_answer(client, hunter):
+    log_id = upload(client, hunter, sshd_log(10, offset=1100))
+    job = wait_for(client, hunter, background_ask(client, hunter, log_id))
+
+    assert job["status"] == "done"
+    assert job["conversation_id"] and job["answer"]["insights"]
+    assert job["started_at"] and job["finished_at"]
+
+
+def test_cancel_a_queued_job(client, hunter, stopped_queue):
+    log_id = upload(client, hunter, sshd_log(10, offset=1200))
+    job_id = background_ask(client, hunter, log_id)
+    assert client.get(f"/api/logs/jobs/{job_id}", headers=hunter).json()["status"] == "queued"
+
+    assert client.delete(f"/api/logs/jobs/{job_id}", headers=hunter).status_code == 200
+    assert client.get(f"/api/logs/jobs/{job_id}", headers=hunter).json()["status"] == "cancelled"
+    assert client.delete(f"/api/logs/jobs/{job_id}", headers=hunter).status_code == 409
+
+
+def test_submit_caps_each_users_queue(db, stopped_queue, monkeypatch):
+    monkeypatch.setattr(settings, "job_max_queued_per_user", 2)
+    stopped_queue.submit(db, "capped-user", "log", "q1?", None, True)
+    stopped_queue.submit(db, "capped-user", "log", "q2?", None, True)
+    with pytest.raises(HTTPException) as error:
+        stopped_queue.submit(db, "capped-user", "log", "q3?", None, True)
+    assert error.value.status_code == 429
+
+    # Another user's queue is separate
+    stopped_queue.submit(db, "other-user", "log", "q1?", None, True)
+
+
+def test_users_are_served_round_robin():
+    queue = JobQueue(1)
+    for job_id, user_id in [("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b"), ("c1", "c"), ("c2", "c"), ("a1", "a")]:
+        queue._enqueue(job_id, user_id)
+
+    assert [queue._next_job() for _ in range(6)] == ["a1", "b1", "c1", "a2", "c2", "a3"]
+
+
+def test_only_jobs_of_dead_workers_are_requeued(db, stopped_queue):
+    now = datetime.utcnow()
+    long_ago = now - timedelta(seconds=queue_module.DEAD_AFTER_SECONDS * 2)
+    jobs = {}
+    for name, values in {
+        "dead": {"worker_id": "crashed-worker", "heartbeat_at": long_ago, "started_at": long_ago},
+        # Running for a day, but its worker is still beating
+        "slow": {"worker_id": "busy-worker", "heartbeat_at": now, "started_at": now - timedelta(days=1)},
+        # Claimed before workers kept heartbeats
+        "legacy": {"worker_id": None, "heartbeat_at": None, "started_at": long_ago},
+        "own": {"worker_id": "this-worker", "heartbeat_at": long_ago, "started_at": long_ago},
+    }.items():
+        job = AnalysisJob(user_id="requeue-user", log_id="log", question=name, status="running", **values)
+        db.add(job)
+        db.commit()
+        jobs[name] = job.id
+
+    queue = JobQueue(1)
+    queue.worker_id = "this-worker"
+    queue.poll()
+
+    assert {name: status(db, job_id) for name, job_id in jobs.items()} == {
+        "dead": "queued", "slow": "running", "legacy": "queued", "own": "running",
+    }
+    assert list(queue._queues["requeue-user"]) == [jobs["dead"], jobs["legacy"]]
+
+
+def test_heartbeat_keeps_a_long_job_running(db, stopped_queue):
+    long_ago = datetime.utcnow() - timedelta(seconds=queue_module.DEAD_AFTER_SECONDS * 2)
+    job = AnalysisJob(user_id="beat-user", log_id="log", question="q", status="running", worker_id="beating-worker", heartbeat_at=long_ago, started_at=long_ago)
+    db.add(job)
+    db.commit()
+
+    owner = JobQueue(1)
+    owner.worker_id = "beating-worker"
+    owner.beat()
+    JobQueue(1).poll()
+    assert status(db, job.id) == "running"
+
+
+def test_a_requeued_job_is_not_finished_by_its_old_owner(db, stopped_queue):
+    job = AnalysisJob(user_id="owner-user", log_id="log", question="q", status="running", worker_id="new-owner")
+    db.add(job)
+    db.commit()
+
+    old_owner = JobQueue(1)
+    old_owner.worker_id = "old-owner"
+    old_owner._finish(db, job.id, "failed", error="late")
+    assert status(db, job.id) == "running"
+
+
+def test_restart_recovers_a_job_its_crashed_worker_was_running(client, hunter, db, stopped_queue):
+    log_id = upload(client, hunter, sshd_log(10, offset=1300))
+    job_id = background_ask(client, hunter, log_id)
+    long_ago = datetime.utcnow() - timedelta(seconds=queue_module.DEAD_AFTER_SECONDS * 2)
+    set_job(db, job_id, status="running", worker_id="crashed-worker", heartbeat_at=long_ago, started_at=long_ago)
+
+    restarted = JobQueue(1)
+    restarted.start()
+    try:
+        job = wait_for(client, hunter, job_id, statuses=("done", "failed"))
+    finally:
+        restarted.stop()
+    assert job["status"] == "done" and job["conversation_id"]
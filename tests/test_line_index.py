@@ -0,0 +1,133 @@
+from array import array
+
+import pytest
+
+from services.blob_compression import BlockWriter, blocks_path
+from services.line_index import LineIndex, append_line_index, build_line_index, line_index_path
+from tests.conftest import PASSWORD, sshd_log, upload
+
+
+def offsets(path: str) -> list:
+    index = array("Q")
+    with open(line_index_path(path), "rb") as f:
+        index.frombytes(f.read())
+    return list(index)
+
+
+def test_build_line_index(tmp_path):
+    path = tmp_path / "test.log"
+    path.write_bytes(b"one\ntwo\n\nfour")
+
+    assert build_line_index(str(path)) == 4
+    assert offsets(str(path)) == [0, 4, 8, 9, 13]
+    with LineIndex(str(path)) as index:
+        assert list(index.lines(1, 10)) == [(1, "one"), (2, "two"), (3, ""), (4, "four")]
+        assert list(index.select([4, 2, 2, 99])) == [(2, "two"), (4, "four")]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.log"
+    path.write_bytes(b"")
+
+    assert build_line_index(str(path)) == 0
+    with LineIndex(str(path)) as index:
+        assert index.line_count == 0
+        assert list(index.lines(1, 5)) == []
+
+
+def append(path, line_count: int, data: bytes) -> int:
+    # What log_append does: write the bytes, then extend the index of the
+    # line_count lines it had (as recorded in the database)
+    size = path.stat().st_size
+    ends_last_line = size > 0 and path.read_bytes()[-1:] != b"\n"
+    if ends_last_line:
+        data = b"\n" + data
+    with open(path, "ab") as f:
+        f.write(data)
+    return append_line_index(str(path), line_count, size, data, ends_last_line)
+
+
+def test_append_matches_a_rebuilt_index(tmp_path):
+    path = tmp_path / "live.log"
+    path.write_bytes(b"a\nbb\n")
+    build_line_index(str(path))
+
+    assert append(path, 2, b"ccc\ndddd\n") == 2
+    appended = offsets(str(path))
+    build_line_index(str(path))
+    assert appended == offsets(str(path)) == [0, 2, 5, 9, 14]
+    with LineIndex(str(path)) as index:
+        assert list(index.lines(3, 4)) == [(3, "ccc"), (4, "dddd")]
+
+
+def test_append_after_an_unterminated_last_line(tmp_path):
+    path = tmp_path / "live.log"
+    path.write_bytes(b"a\nlast")
+    build_line_index(str(path))
+
+    # The newline closing "last" isn't a new line
+    assert append(path, 2, b"next\n") == 1
+    appended = offsets(str(path))
+    build_line_index(str(path))
+    assert appended == offsets(str(path)) == [0, 2, 7, 12]
+    with LineIndex(str(path)) as index:
+        assert list(index.lines(1, 3)) == [(1, "a"), (2, "last"), (3, "next")]
+
+
+def test_append_drops_entries_left_by_an_interrupted_append(tmp_path):
+    path = tmp_path / "live.log"
+    path.write_bytes(b"a\nb\n")
+    build_line_index(str(path))
+    with open(line_index_path(str(path)), "ab") as f:
+        array("Q", [99, 123]).tofile(f)
+
+    append(path, 2, b"c\n")
+    assert offsets(str(path)) == [0, 2, 4, 6]
+
+
+@pytest.mark.parametrize("kind", ["gzip", "zstd"])
+def test_lines_of_a_compressed_blob(tmp_path, kind):
+    if kind == "zstd":
+        pytest.importorskip("zstandard")
+    data = "".join(f"line {i}\n" for i in range(1, 50_001)).encode()
+    path = str(tmp_path / "blob")
+    with open(path, "wb") as out:
+        writer = BlockWriter(out, kind)
+        writer.write(data)
+        writer.close()
+    writer.write_index(blocks_path(path))
+
+    with LineIndex(path) as index:
+        assert index.line_count == 50_000
+        assert list(index.lines(1, 2)) == [(1, "line 1"), (2, "line 2")]
+        assert list(index.select([25_000, 50_000])) == [(25_000, "line 25000"), (50_000, "line 50000")]
+
+
+def test_lines_endpoint(client, hunter):
+    log_id = upload(client, hunter, sshd_log(30))
+
+    lines = client.get(f"/api/logs/{log_id}/lines", params={"start": 2, "end": 3}, headers=hunter).json()
+    assert lines["total_lines"] == 30
+    assert [line["line"] for line in lines["lines"]] == [2, 3]
+    assert "port 2001" in lines["lines"][0]["text"]
+    assert client.get(f"/api/logs/{log_id}/lines", params={"start": 31}, headers=hunter).status_code == 416
+
+
+def test_lines_of_another_users_log(client, hunter):
+    log_id = upload(client, hunter, sshd_log(3, offset=900))
+    email = "someone-else@test.example.com"
+    client.post("/api/hunter/signup", json={"email": email, "password": PASSWORD, "role": "Hunter"})
+    token = client.post("/api/auth/login", json={"email": email, "password": PASSWORD}).json()["access_token"]
+
+    response = client.get(f"/api/logs/{log_id}/lines", params={"start": 1}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404
+
+
+def test_answers_cite_existing_lines(client, hunter):
+    log_id = upload(client, hunter, sshd_log(20, offset=120))
+    # Filtered asks send numbered lines, which the stub model cites
+    answer = client.post("/api/logs/ask", json={"log_id": log_id, "question": "Which lines?", "filters": {"ip": ["10.0.0.1"]}}, headers=hunter).json()
+
+    cited = answer["cited_lines"]
+    assert [c["line"] for c in cited][:3] == [2, 5, 8] and answer["invalid_citations"] == []
+    assert "from 10.0.0.1 port 2121" in cited[0]["text"]
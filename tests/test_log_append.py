@@ -0,0 +1,36 @@
+from api.logs import APPEND_BATCH_BYTES
+from tests.conftest import sshd_log, upload
+
+
+def test_appended_lines_are_read_searched_and_cited(client, hunter):
+    log_id = upload(client, hunter, sshd_log(10, offset=2500))
+
+    appended = client.post(f"/api/logs/{log_id}/append", content=sshd_log(5, offset=2510), headers=hunter).json()
+    assert appended == {"log_id": log_id, "appended_lines": 5, "line_count": 15, "size_bytes": len(sshd_log(15, offset=2500))}
+
+    lines = client.get(f"/api/logs/{log_id}/lines", params={"start": 11, "end": 15}, headers=hunter).json()
+    assert lines["total_lines"] == 15 and "port 4510" in lines["lines"][0]["text"]
+    found = client.get(f"/api/logs/{log_id}/search", params={"ip": "10.0.0.1"}, headers=hunter).json()
+    assert [line["line"] for line in found["lines"]] == [1, 4, 7, 10, 13]
+
+    answer = client.post("/api/logs/ask", json={"log_id": log_id, "question": "Which lines?", "filters": {"ip": ["10.0.0.1"]}}, headers=hunter).json()
+    assert 13 in [c["line"] for c in answer["cited_lines"]] and answer["invalid_citations"] == []
+
+
+def test_append_does_not_change_other_uploads_of_the_content(client, hunter):
+    data = sshd_log(4, offset=2520)
+    live, copy = upload(client, hunter, data), upload(client, hunter, data)
+    client.post(f"/api/logs/{live}/append", content=b"one more line\n", headers=hunter).raise_for_status()
+
+    assert client.get(f"/api/logs/{live}/lines", params={"start": 5}, headers=hunter).json()["lines"][0]["text"] == "one more line"
+    assert client.get(f"/api/logs/{copy}/lines", params={"start": 1}, headers=hunter).json()["total_lines"] == 4
+
+
+def test_append_rejects_an_overlong_line(client, hunter):
+    log_id = upload(client, hunter, sshd_log(3, offset=500))
+    response = client.post(f"/api/logs/{log_id}/append", content=b"x" * (APPEND_BATCH_BYTES + 1), headers=hunter)
+    assert response.status_code == 413
+
+    empty = client.post(f"/api/logs/{log_id}/append", content=b"", headers=hunter).json()
+    assert empty["appended_lines"] == 0 and empty["line_count"] == 3
+    assert client.post("/api/logs/missing/append", content=b"x\n", headers=hunter).status_code == 404
@@ -0,0 +1,72 @@
+import io
+import uuid
+
+from fastapi import UploadFile
+
+from services.blob_store import store_blob
+from services.file_upload import save_uploaded_file
+from services.log_indexer import add_postings, append_index, extract_entities, search_lines, write_index
+from tests.conftest import sshd_log, upload
+
+LINES = [
+    "Jan  1 00:00:01 host sshd[1]: Failed password for root from 10.0.0.5 port 2222 ssh2",
+    '10.0.0.7 - alice [01/Jan/2025:00:00:02 +0000] "GET /admin HTTP/1.1" 401 12',
+    '10.0.0.5 - - [01/Jan/2025:00:00:03 +0000] "GET /index.html HTTP/1.1" 200 512',
+    "Jan  1 00:00:04 host sshd[1]: Failed password for invalid user admin from 10.0.0.5 port 2223 ssh2",
+]
+
+
+def test_extract_entities():
+    assert set(extract_entities(LINES[0])) == {("ip", "10.0.0.5"), ("user", "root"), ("port", "2222")}
+    assert set(extract_entities(LINES[1])) == {("ip", "10.0.0.7"), ("user", "alice"), ("status", "401"), ("url", "/admin")}
+    # Not an IP, and not a port
+    assert ("ip", "1.2.3.4.5") not in set(extract_entities("version 1.2.3.4.5"))
+    assert not list(extract_entities("port 99999"))
+
+
+def index(lines, first_line: int = 1) -> dict:
+    postings = {}
+    for line_no, line in enumerate(lines, start=first_line):
+        add_postings(postings, line_no, line, "error" if "Failed" in line else None)
+    return {key: lines.tobytes() for key, lines in postings.items()}
+
+
+def test_search_intersects_fields_and_unions_values(db):
+    blob = store_blob(db, save_uploaded_file(UploadFile(io.BytesIO(f"{uuid.uuid4()}\n".encode()), filename="x.log"), "log"))
+    write_index(db, blob, index(LINES))
+    db.commit()
+
+    assert search_lines(db, blob.sha256, {"ip": ["10.0.0.5"]}) == [1, 3, 4]
+    assert search_lines(db, blob.sha256, {"ip": ["10.0.0.5"], "severity": ["error"]}) == [1, 4]
+    assert search_lines(db, blob.sha256, {"ip": ["10.0.0.5", "10.0.0.7"], "status": ["401", "200"]}) == [2, 3]
+    assert search_lines(db, blob.sha256, {"ip": ["10.9.9.9"]}) == []
+    assert search_lines(db, blob.sha256, {"ip": ["10.0.0.5"], "user": []}) == [1, 3, 4]
+
+    # Rebuilding replaces the whole index
+    write_index(db, blob, index(LINES[:2]))
+    db.commit()
+    assert search_lines(db, blob.sha256, {"ip": ["10.0.0.5"]}) == [1]
+
+
+def test_appended_lines_are_searched_with_the_rest(db):
+    blob = store_blob(db, save_uploaded_file(UploadFile(io.BytesIO(f"{uuid.uuid4()}\n".encode()), filename="x.log"), "log"))
+    write_index(db, blob, index(LINES))
+    db.commit()
+
+    # Appended lines add rows to a term, which searches merge
+    append_index(db, blob.sha256, index(["Failed password for root from 10.0.0.5 port 1 ssh2"], first_line=5))
+    db.commit()
+    assert search_lines(db, blob.sha256, {"ip": ["10.0.0.5"], "user": ["root"]}) == [1, 5]
+    assert search_lines(db, blob.sha256, {"port": ["1"]}) == [5]
+
+
+def test_search_endpoint(client, hunter):
+    log_id = upload(client, hunter, sshd_log(30))
+
+    found = client.get(f"/api/logs/{log_id}/search", params={"ip": "10.0.0.1"}, headers=hunter).json()
+    assert found["total_matches"] == 10
+    assert [line["line"] for line in found["lines"]][:3] == [2, 5, 8]
+    assert "from 10.0.0.1 port 2001" in found["lines"][0]["text"]
+
+    found = client.get(f"/api/logs/{log_id}/search", params={"ip": "10.0.0.1", "port": "2004"}, headers=hunter).json()
+    assert [line["line"] for line in found["lines"]] == [5]
@@ -0,0 +1,88 @@
+from services.log_merge import UNTIMED, MergeSource, cited_source_lines, merged_lines, merged_size
+from services.record_store import records_path, write_records
+from tests.conftest import sshd_log, upload
+
+
+def source(tmp_path, tag: str, lines: list, line_numbers=None) -> MergeSource:
+    """A parsed text log of (timestamp or None, text) lines."""
+    path = str(tmp_path / f"{tag}.log")
+    with open(path, "w") as f:
+        f.write("".join(f"{text}\n" for _, text in lines))
+    write_records(records_path(path), "text", [
+        (n, ts, None, None, text, None, None, None, None, None, 0)
+        for n, (ts, text) in enumerate(lines, start=1)
+    ])
+    return MergeSource(tag, f"log-{tag}", "log", path, line_numbers)
+
+
+def timeline(sources) -> list:
+    return [(sources[i].tag, n, ts) for ts, i, n, _ in merged_lines(sources)]
+
+
+def test_interleaved_timestamps_are_merged_in_order(tmp_path):
+    a = source(tmp_path, "A", [(1, "a1"), (3, "a2"), (5, "a3"), (9, "a4")])
+    b = source(tmp_path, "B", [(2, "b1"), (4, "b2"), (6, "b3")])
+    c = source(tmp_path, "C", [(7, "c1")])
+
+    assert timeline([a, b, c]) == [
+        ("A", 1, 1), ("B", 1, 2), ("A", 2, 3), ("B", 2, 4), ("A", 3, 5), ("B", 3, 6), ("C", 1, 7), ("A", 4, 9),
+    ]
+    assert merged_size([a, b, c]) == 8
+
+
+def test_equal_timestamps_keep_the_order_of_the_sources(tmp_path):
+    a = source(tmp_path, "A", [(5, "a1"), (5, "a2")])
+    b = source(tmp_path, "B", [(5, "b1"), (5, "b2")])
+
+    assert [tag + str(n) for tag, n, _ in timeline([b, a])] == ["B1", "B2", "A1", "A2"]
+    assert [tag + str(n) for tag, n, _ in timeline([a, b])] == ["A1", "A2", "B1", "B2"]
+
+
+def test_lines_without_a_timestamp(tmp_path):
+    # Before the first timestamp, continuations, and a log with none at all
+    a = source(tmp_path, "A", [(None, "banner"), (10, "error"), (None, "  at frame"), (None, "  at frame"), (30, "ok")])
+    b = source(tmp_path, "B", [(20, "b1")])
+    untimed = source(tmp_path, "C", [(None, "c1"), (None, "c2")])
+
+    assert timeline([untimed, a, b]) == [
+        ("A", 1, 10), ("A", 2, 10), ("A", 3, 10), ("A", 4, 10), ("B", 1, 20), ("A", 5, 30), ("C", 1, UNTIMED), ("C", 2, UNTIMED),
+    ]
+
+
+def test_only_the_matched_lines_are_merged(tmp_path):
+    a = source(tmp_path, "A", [(1, "a1"), (2, "a2"), (3, "a3"), (4, "a4")], line_numbers=[3, 4])
+    b = source(tmp_path, "B", [(1, "b1"), (3, "b2")], line_numbers=[2])
+
+    assert timeline([a, b]) == [("A", 3, 3), ("B", 2, 3), ("A", 4, 4)]
+    assert [text for *_, text in merged_lines([a, b])] == ["a3", "b2", "a4"]
+    assert merged_size([a, b]) == 3
+
+
+def test_cited_source_lines():
+    supporting = "\n".join([
+        "A:2: Failed password for root",
+        "B:10-12 show the scan, as does B:11",
+        "A:7 to A:8, then C:3–4",
+        "Line 40 and 10.0.0.1:22 aren't merged citations",
+    ])
+    assert cited_source_lines(supporting) == {"A": [2, 7, 8], "B": [10, 11, 12], "C": [3, 4]}
+    assert cited_source_lines("B:1-100000") == {"B": list(range(1, 201))}
+
+
+def test_merged_answer_cites_lines_of_each_log(client, hunter):
+    # Seconds 40-49 and 45-54 of the same minute
+    first = upload(client, hunter, sshd_log(10, offset=2200))
+    second = upload(client, hunter, sshd_log(10, offset=2205))
+    texts = {first: sshd_log(10, offset=2200).decode().splitlines(), second: sshd_log(10, offset=2205).decode().splitlines()}
+
+    merged = client.get("/api/logs/search", params={"log_id": [second, first]}, headers=hunter).json()
+    assert [(line["log_id"], line["line"]) for line in merged["lines"][:8]] == [
+        (first, 1), (first, 2), (first, 3), (first, 4), (first, 5), (second, 1), (first, 6), (second, 2),
+    ]
+    assert merged["total_matches"] == 20
+
+    answer = client.post("/api/logs/ask", json={"log_id": first, "log_ids": [second], "question": "Correlate them"}, headers=hunter).json()
+    assert answer["sources"] == {"A": first, "B": second}
+    assert answer["cited_lines"] and not answer["invalid_source_citations"]
+    for line in answer["cited_lines"]:
+        assert line["text"] == texts[line["log_id"]][line["line"] - 1]
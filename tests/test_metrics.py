@@ -0,0 +1,75 @@
+import re
+
+from core.config import settings
+from core.metrics import CONTENT_TYPE
+from tests.conftest import sshd_log, upload
+
+SAMPLE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$")
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def scrape(client) -> dict:
+    """The /metrics samples as {(name, frozenset(labels)): value}, checking the format on the way."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == CONTENT_TYPE
+
+    samples = {}
+    for line in response.text.splitlines():
+        if line.startswith("#"):
+            assert re.match(r"^# (HELP|TYPE) \S+ ", line), line
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        samples[(name, frozenset(LABEL.findall(labels or "")))] = float(value)
+    return samples
+
+
+def sample(samples: dict, name: str, **labels) -> float:
+    return samples.get((name, frozenset(labels.items())), 0)
+
+
+def test_requests_and_stages_are_exported(client, hunter):
+    log_id = upload(client, hunter, sshd_log(10, offset=2000))
+    before = scrape(client)
+    client.post("/api/logs/ask", json={"log_id": log_id, "question": "Any brute force?"}, headers=hunter).raise_for_status()
+    client.get(f"/api/logs/{log_id}/lines", params={"start": 1, "end": 2}, headers=hunter).raise_for_status()
+    after = scrape(client)
+
+    def grew(name, **labels):
+        return sample(after, name, **labels) - sample(before, name, **labels)
+
+    # Counted per route template, not per log ID
+    assert grew("septer_http_requests_total", method="POST", route="/api/logs/ask", status="200") == 1
+    assert grew("septer_http_requests_total", method="GET", route="/api/logs/{log_id}/lines", status="200") == 1
+    assert grew("septer_http_request_duration_seconds_count", method="POST", route="/api/logs/ask") == 1
+
+    for stage in ["prepare", "cache_lookup", "model_call", "save_conversation"]:
+        labels = {"path": "ask", "stage": stage}
+        assert grew("septer_stage_duration_seconds_count", **labels) >= 1, stage
+        assert grew("septer_stage_duration_seconds_bucket", **labels, le="+Inf") == grew("septer_stage_duration_seconds_count", **labels)
+    assert sample(after, "septer_stage_duration_seconds_count", path="upload", stage="spool_copy") >= 1
+
+    text = client.get("/metrics").text
+    assert "# TYPE septer_http_requests_total counter" in text
+    assert "# TYPE septer_stage_duration_seconds histogram" in text
+
+
+def test_histogram_buckets_are_cumulative(client, hunter):
+    upload(client, hunter, sshd_log(3, offset=2100))
+    samples = scrape(client)
+    labels = frozenset({("path", "upload"), ("stage", "store_blob")})
+    buckets = sorted(
+        (float(dict(key)["le"]), value) for (name, key), value in samples.items()
+        if name == "septer_stage_duration_seconds_bucket" and labels < key
+    )
+    counts = [value for _, value in buckets]
+    assert counts == sorted(counts)
+    assert counts[-1] == sample(samples, "septer_stage_duration_seconds_count", path="upload", stage="store_blob")
+
+
+def test_scrapes_need_the_token_when_one_is_set(client, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
@@ -0,0 +1,90 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from core.pagination import after_cursor, decode_cursor, encode_cursor
+from core.security import create_access_token
+from models.conversation import Conversation
+from models.user import RoleEnum, User
+from tests.conftest import sshd_log, upload
+
+
+def test_keyset_pagination(db):
+    me = str(uuid.uuid4())
+    same_time = datetime.utcnow()
+    # Half share a timestamp, so the id has to break ties
+    convos = [
+        Conversation(user_id=me, log_id="log", question=f"q{i}", created_at=same_time if i < 3 else same_time + timedelta(seconds=i))
+        for i in range(6)
+    ]
+    db.add_all(convos)
+    db.commit()
+    expected = sorted(convos, key=lambda c: (c.created_at, c.id), reverse=True)
+
+    seen, cursor = [], None
+    while True:
+        query = db.query(Conversation).filter(Conversation.user_id == me)
+        if cursor:
+            query = query.filter(after_cursor(Conversation.created_at, Conversation.id, cursor))
+        page = query.order_by(Conversation.created_at.desc(), Conversation.id.desc()).limit(2).all()
+        if not page:
+            break
+        seen.extend(page)
+        cursor = encode_cursor(page[-1].created_at, page[-1].id)
+
+    assert [c.id for c in seen] == [c.id for c in expected]
+    assert decode_cursor(encode_cursor(same_time, "x")) == (same_time, "x")
+    with pytest.raises(HTTPException) as error:
+        decode_cursor("not a cursor")
+    assert error.value.status_code == 400
+
+
+@pytest.fixture
+def guardian(db) -> dict:
+    user = User(email=f"guardian-{uuid.uuid4().hex[:12]}@test.example.com", password="x", role=RoleEnum.Guardian)
+    db.add(user)
+    db.commit()
+    return {"Authorization": f"Bearer {create_access_token({'sub': user.id})}"}
+
+
+def dashboard(client, guardian: dict, **params) -> dict:
+    response = client.get("/api/guardian/dashboard", params=params, headers=guardian)
+    response.raise_for_status()
+    return response.json()
+
+
+def test_guardian_dashboard_counts_and_pages(client, hunter, guardian):
+    before = dashboard(client, guardian)["total_questions"]
+    log_id = upload(client, hunter, sshd_log(5, offset=1800))
+    for i in range(3):
+        client.post("/api/logs/ask", json={"log_id": log_id, "question": f"dashboard {i}?"}, headers=hunter).raise_for_status()
+
+    first = dashboard(client, guardian, limit=2)
+    assert first["total_questions"] == before + 3
+    email = first["questions_by_users"][0]["user_email"]
+    assert {"user_email": email, "questions": 3} in first["questions_per_user"]
+    assert [q["question"] for q in first["questions_by_users"]] == ["dashboard 2?", "dashboard 1?"]
+    second = dashboard(client, guardian, limit=2, cursor=first["next_cursor"])
+    assert second["questions_by_users"][0]["question"] == "dashboard 0?"
+
+    # Deleting the log takes its questions out of the counters
+    client.delete(f"/api/logs/{log_id}", headers=hunter).raise_for_status()
+    assert dashboard(client, guardian)["total_questions"] == before
+
+
+def test_conversation_history_pages(client, hunter):
+    log_id = upload(client, hunter, sshd_log(5, offset=200))
+    for i in range(5):
+        client.post("/api/logs/ask", json={"log_id": log_id, "question": f"question {i}?"}, headers=hunter).raise_for_status()
+
+    questions, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/conversations", params=params, headers=hunter).json()
+        questions += [c["question"] for c in page["conversations"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert questions == [f"question {i}?" for i in reversed(range(5))]
@@ -0,0 +1,69 @@
+import time
+import uuid
+
+import pytest
+
+from core import security
+from core.cache import TTLCache
+from core.security import create_access_token, invalidate_identity
+from models.user import RoleEnum, User
+
+# Any endpoint behind require_guardian tells the cached role apart
+GUARDIAN_ONLY = "/api/guardian/cache-stats"
+
+
+@pytest.fixture
+def account(db):
+    """A Hunter straight in the database, with the headers to act as them."""
+    user = User(email=f"cached-{uuid.uuid4().hex[:12]}@test.example.com", password="x", role=RoleEnum.Hunter)
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': user.id})}"}
+    return user, headers
+
+
+def set_role(db, user: User, role: RoleEnum) -> None:
+    user.role = role
+    db.commit()
+
+
+def test_role_change_is_served_from_the_cache_until_invalidated(client, db, account):
+    user, headers = account
+    assert client.get(GUARDIAN_ONLY, headers=headers).status_code == 403
+
+    set_role(db, user, RoleEnum.Guardian)
+    assert client.get(GUARDIAN_ONLY, headers=headers).status_code == 403
+
+    invalidate_identity(user.id)
+    assert client.get(GUARDIAN_ONLY, headers=headers).status_code == 200
+
+
+def test_deleted_user_is_refused_once_invalidated(client, db, account):
+    user, headers = account
+    set_role(db, user, RoleEnum.Guardian)
+    assert client.get(GUARDIAN_ONLY, headers=headers).status_code == 200
+
+    user_id = user.id
+    db.delete(user)
+    db.commit()
+    invalidate_identity(user_id)
+    assert client.get(GUARDIAN_ONLY, headers=headers).status_code == 401
+
+
+def test_expired_identities_are_reloaded(client, db, account, monkeypatch):
+    monkeypatch.setattr(security, "_identities", TTLCache(100, 0.3))
+    user, headers = account
+    assert client.get(GUARDIAN_ONLY, headers=headers).status_code == 403
+
+    # Changed by another process, which can't invalidate this one's cache
+    set_role(db, user, RoleEnum.Guardian)
+    assert client.get(GUARDIAN_ONLY, headers=headers).status_code == 403
+    time.sleep(0.4)
+    assert client.get(GUARDIAN_ONLY, headers=headers).status_code == 200
+
+
+def test_invalid_tokens_are_refused(client):
+    assert client.get(GUARDIAN_ONLY).status_code == 401
+    assert client.get(GUARDIAN_ONLY, headers={"Authorization": "Bearer not-a-token"}).status_code == 401
+    unknown = create_access_token({"sub": str(uuid.uuid4())})
+    assert client.get(GUARDIAN_ONLY, headers={"Authorization": f"Bearer {unknown}"}).status_code == 401
@@ -0,0 +1,21 @@
+from tests.conftest import sshd_log, upload
+
+
+def test_findings_endpoint(client, hunter):
+    log_id = upload(client, hunter, sshd_log(40, offset=1600))
+    findings = client.get(f"/api/logs/{log_id}/findings", headers=hunter).json()
+
+    assert findings["records"] == 40
+    assert [(ip["value"], ip["auth_failures"]) for ip in findings["top_ips"]] == [("10.0.0.1", 14), ("10.0.0.0", 13), ("10.0.0.2", 13)]
+    brute_force = {f["subject"]: f for f in findings["findings"] if f["type"] == "brute_force"}
+    assert set(brute_force) == {"10.0.0.0", "10.0.0.1", "10.0.0.2"}
+    assert brute_force["10.0.0.1"]["count"] == 14 and brute_force["10.0.0.1"]["lines"][:3] == [1, 4, 7]
+
+
+def test_the_prompt_carries_the_pre_analysis(client, hunter, prompts):
+    log_id = upload(client, hunter, sshd_log(40, offset=1700))
+    client.post("/api/logs/ask", json={"log_id": log_id, "question": "Any brute force?"}, headers=hunter).raise_for_status()
+
+    assert "Deterministic pre-analysis" in prompts[0]
+    assert "Records: 40" in prompts[0]
+    assert "Top IPs: 10.0.0.2 (14 events, 0 errors, 14 auth failures)" in prompts[0]